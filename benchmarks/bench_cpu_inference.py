@@ -0,0 +1,103 @@
+"""
+Throughput of the CPU backend (float32 vs. dynamically quantized int8 weights) on prompts of the dev split.
+
+For each batch size, the prefill (a single forward pass over the prompts, as in option scoring) and the generation
+(max_new_tokens per prompt) are timed separately. The agreement of the selected answer options between float32 and
+int8 shows the effect of the quantization on the predictions.
+
+Usage:
+  bench_cpu_inference.py <model> <template_name> [--num-instances=<num_instances>] [--batch-sizes=<batch_sizes>] [--max-new-tokens=<max_new_tokens>] [--threads=<threads>]
+
+Arguments:
+  <model>           Path or name of the model, e.g. Qwen/Qwen2.5-0.5B-Instruct.
+  <template_name>   The name of the prompt template.
+
+Options:
+  --num-instances=<num_instances>       Number of dev instances [default: 16].
+  --batch-sizes=<batch_sizes>           Comma-separated batch sizes [default: 1,4].
+  --max-new-tokens=<max_new_tokens>     Number of generated tokens per prompt [default: 32].
+  --threads=<threads>                   Number of torch threads (defaults to the number of physical cores).
+  -h --help                             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_cpu_inference
+"""
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from docopt import docopt
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.llms.impl.cpu_quantized import QuantizedCPUChatLLM
+from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
+from experiments.running.run_and_eval import get_dataset_with_prompts
+
+
+def load_instances(template_name: str, num_instances: int) -> List[Dict]:
+    loader: NeoQALoader = NeoQALoader(NeoQALoader.BENCHMARK_WITHOUT_NOISE, embed_articles=False)
+    prompt_generator: MultipleChoicePromptGenerator = MultipleChoicePromptGenerator(
+        template_name, article_store=loader.article_store
+    )
+    dataset = get_dataset_with_prompts(loader, prompt_generator, 'dev', random_seed=1)
+    return [dataset[i] for i in range(min(num_instances, len(dataset)))]
+
+
+def count_prompt_tokens(llm: QuantizedCPUChatLLM, instances: List[Dict]) -> int:
+    input_ids: List[List[int]] = llm.tokenizer.apply_chat_template(
+        [llm.get_messages(instance) for instance in instances], add_generation_prompt=True, tokenize=True
+    )
+    return sum(map(len, input_ids))
+
+
+def bench(llm: QuantizedCPUChatLLM, instances: List[Dict], batch_size: int) -> Dict:
+    batches: List[List[Dict]] = [instances[i:i + batch_size] for i in range(0, len(instances), batch_size)]
+    num_prompt_tokens: int = count_prompt_tokens(llm, instances)
+
+    start: float = time.perf_counter()
+    option_scores: List[List[float]] = [scores for batch in batches for scores in llm.score_options(batch)]
+    prefill_seconds: float = time.perf_counter() - start
+
+    start = time.perf_counter()
+    responses: List[str] = [response for batch in batches for response in llm.generate_batch(batch)]
+    generate_seconds: float = time.perf_counter() - start
+    num_generated_tokens: int = sum(
+        len(llm.tokenizer.encode(response, add_special_tokens=False)) for response in responses
+    )
+
+    return {
+        'prefill_tokens_per_second': num_prompt_tokens / prefill_seconds,
+        'instances_per_second': len(instances) / generate_seconds,
+        'generated_tokens_per_second': num_generated_tokens / generate_seconds,
+        'selected_options': [int(np.argmax(scores)) for scores in option_scores]
+    }
+
+
+def main(args):
+    num_threads: Optional[int] = int(args['--threads']) if args['--threads'] else None
+    batch_sizes: List[int] = [int(size) for size in args['--batch-sizes'].split(',')]
+    instances: List[Dict] = load_instances(args['<template_name>'], int(args['--num-instances']))
+
+    selected_options: Dict[str, List[int]] = dict()
+    for quantize in [False, True]:
+        llm: QuantizedCPUChatLLM = QuantizedCPUChatLLM(
+            args['<model>'], max_new_tokens=int(args['--max-new-tokens']), quantize=quantize, num_threads=num_threads
+        )
+        weights: str = 'int8' if quantize else 'fp32'
+        llm.score_options(instances[:1])  # Warm-up (and loading of the model)
+        for batch_size in batch_sizes:
+            result: Dict = bench(llm, instances, batch_size)
+            selected_options[weights] = result['selected_options']
+            print(
+                f'{weights:5s} batch={batch_size:3d} threads={torch.get_num_threads():3d}  '
+                f'prefill: {result["prefill_tokens_per_second"]:9.1f} tokens/s  '
+                f'generate: {result["generated_tokens_per_second"]:7.1f} tokens/s '
+                f'({result["instances_per_second"]:.3f} instances/s)'
+            )
+
+    agreement: float = float(np.mean(np.array(selected_options['fp32']) == np.array(selected_options['int8'])))
+    print(f'Agreement of the selected options (fp32 vs. int8): {agreement:.3f} ({len(instances)} instances)')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
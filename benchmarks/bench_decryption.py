@@ -0,0 +1,87 @@
+"""
+Benchmark of the XOR decryption against the previous implementation (one chr(b ^ key) per byte, whole file read at
+once), and of loading an encrypted file in memory compared to reading the plaintext file.
+
+Usage:
+  bench_decryption.py [--src=<src>] [--key=<key>] [--repeat=<repeat>]
+
+Options:
+  --src=<src>           A plaintext *.jsonl file (encrypted for the benchmark). Synthetic lines are used by default.
+  --key=<key>           The key [default: 23456].
+  --repeat=<repeat>     Number of repetitions [default: 3].
+  -h --help             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_decryption
+"""
+import base64
+import codecs
+import json
+import random
+import tempfile
+import time
+from os.path import join
+from typing import Callable, Optional
+
+from docopt import docopt
+
+from experiments.util.file_util import read_jsonl
+from experiments.util.xor_cipher import decrypt_file, encrypt_file, iter_decrypted_lines
+
+
+def legacy_xor_decrypt(encrypted_text: str, key: int) -> str:
+    key = key % 256
+    encrypted_bytes = base64.b64decode(encrypted_text)
+    decrypted = ''.join(chr(b ^ key) for b in encrypted_bytes)
+    return decrypted
+
+
+def legacy_decrypt_file(src: str, dest: str, key: int):
+    with codecs.open(src, encoding='utf-8') as f_in:
+        with codecs.open(dest, 'w', encoding='utf-8') as f_out:
+            for line in f_in.readlines():
+                f_out.write(legacy_xor_decrypt(line, key).strip() + '\n')
+
+
+def make_synthetic_file(dest: str, num_lines: int = 2000, seed: int = 1) -> None:
+    random.seed(seed)
+    words = ['the', 'council', 'announced', 'a', 'new', 'plan', 'on', 'monday', '{Jon Doe|PERSON-1}']
+    with open(dest, 'w', encoding='utf-8') as f_out:
+        for i in range(num_lines):
+            passages = [' '.join(random.choice(words) for _ in range(150)) for _ in range(8)]
+            f_out.write(json.dumps({'article_id': f'A{i}', 'passages': passages}) + '\n')
+
+
+def time_it(fn: Callable[[], object], repeat: int) -> float:
+    best: float = float('inf')
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    key: int = int(args['--key'])
+    repeat: int = int(args['--repeat'])
+    with tempfile.TemporaryDirectory() as directory:
+        src: Optional[str] = args['--src']
+        if src is None:
+            src = join(directory, 'plain.jsonl')
+            make_synthetic_file(src)
+        encrypted: str = join(directory, 'encrypted.jsonl')
+        encrypt_file(src, encrypted, key)
+
+        legacy_seconds: float = time_it(lambda: legacy_decrypt_file(encrypted, join(directory, 'legacy.jsonl'), key), repeat)
+        seconds: float = time_it(lambda: decrypt_file(encrypted, join(directory, 'new.jsonl'), key), repeat)
+        with open(join(directory, 'legacy.jsonl'), 'rb') as f_legacy, open(join(directory, 'new.jsonl'), 'rb') as f_new:
+            assert f_legacy.read() == f_new.read(), 'The decrypted files differ!'
+        print(f'decrypt file:     legacy {legacy_seconds:.3f}s  new {seconds:.3f}s  ({legacy_seconds / seconds:.1f}x)')
+
+        plain_seconds: float = time_it(lambda: read_jsonl(src), repeat)
+        encrypted_seconds: float = time_it(lambda: [json.loads(line) for line in iter_decrypted_lines(encrypted, key)], repeat)
+        assert read_jsonl(src) == [json.loads(line) for line in iter_decrypted_lines(encrypted, key)]
+        print(f'load in memory:   plaintext {plain_seconds:.3f}s  encrypted {encrypted_seconds:.3f}s')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the entity-ID removal against the previous implementation (one str.replace per mention).
+
+Usage:
+  bench_entity_ids.py [--news=<news_file>] [--repeat=<repeat>]
+
+Options:
+  --news=<news_file>    A *.news.jsonl file to take the passages from. Synthetic passages are used by default.
+  --repeat=<repeat>     Number of repetitions [default: 5].
+  -h --help             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_entity_ids
+"""
+import random
+import re
+import time
+from typing import List
+
+from docopt import docopt
+
+from experiments.util.entity_util import remove_ids_from, remove_ids_from_all
+from experiments.util.file_util import read_jsonl
+
+
+def legacy_remove_ids_from(text: str) -> str:
+    pattern: re.Pattern = re.compile(r'\{([^|]+)\|([A-Z]+-\d+,?)+\}')
+    matches = re.finditer(pattern, text)
+    for match in matches:
+        text = text.replace(match.group(0), match.group(1))
+    return text
+
+
+def make_synthetic_passages(num_articles: int = 500, num_passages: int = 10, seed: int = 1) -> List[List[str]]:
+    random.seed(seed)
+    categories: List[str] = ['PERSON', 'ORGANIZATION', 'LOCATION', 'PRODUCT', 'EVENT']
+    articles: List[List[str]] = []
+    for _ in range(num_articles):
+        passages: List[str] = []
+        for _ in range(num_passages):
+            words: List[str] = []
+            for _ in range(120):
+                if random.random() < 0.1:
+                    category: str = random.choice(categories)
+                    words.append(f'{{Name {random.randint(1, 50)}|{category}-{random.randint(1, 50)}}}')
+                else:
+                    words.append(random.choice(['the', 'council', 'announced', 'a', 'new', 'plan', 'on', 'monday']))
+            passages.append(' '.join(words) + '.')
+        articles.append(passages)
+    return articles
+
+
+def time_it(fn, articles: List[List[str]], repeat: int) -> float:
+    best: float = float('inf')
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        fn(articles)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    if args['--news'] is not None:
+        articles: List[List[str]] = [article['passages'] for article in read_jsonl(args['--news'])]
+    else:
+        articles = make_synthetic_passages()
+    repeat: int = int(args['--repeat'])
+
+    legacy: List[List[str]] = [[legacy_remove_ids_from(p) for p in passages] for passages in articles]
+    current: List[List[str]] = [remove_ids_from_all(passages) for passages in articles]
+    assert legacy == current, 'The outputs differ from the previous implementation!'
+
+    num_chars: int = sum(len(p) for passages in articles for p in passages)
+    print(f'Articles: {len(articles)}, characters: {num_chars}')
+    results = {
+        'legacy (per passage)': time_it(
+            lambda arts: [[legacy_remove_ids_from(p) for p in passages] for passages in arts], articles, repeat
+        ),
+        'remove_ids_from (per passage)': time_it(
+            lambda arts: [[remove_ids_from(p) for p in passages] for passages in arts], articles, repeat
+        ),
+        'remove_ids_from_all (batch)': time_it(
+            lambda arts: [remove_ids_from_all(passages) for passages in arts], articles, repeat
+        ),
+        'legacy (joined article)': time_it(
+            lambda arts: [legacy_remove_ids_from(' '.join(passages)) for passages in arts], articles, repeat
+        ),
+        'remove_ids_from (joined article)': time_it(
+            lambda arts: [remove_ids_from(' '.join(passages)) for passages in arts], articles, repeat
+        ),
+    }
+    baseline: float = results['legacy (per passage)']
+    for name, seconds in results.items():
+        print(f'{name:35s} {seconds * 1000:10.2f} ms   x{baseline / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
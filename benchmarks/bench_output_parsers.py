@@ -0,0 +1,303 @@
+"""
+Benchmark of the output parsers against their previous implementations (kept below). Both are run on a synthetic
+corpus of responses in many formats (last line answers, JSON, bare numbers, option texts, unparsable responses, ...)
+and must select identical answers and print identical messages.
+
+Usage:
+  bench_output_parsers.py [--num=<num>] [--repeat=<repeat>] [--seed=<seed>]
+
+Options:
+  --num=<num>           Number of synthetic responses [default: 20000].
+  --repeat=<repeat>     Number of repetitions [default: 3].
+  --seed=<seed>         Random seed of the corpus [default: 1].
+  -h --help             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_output_parsers
+"""
+import io
+import json
+import random
+import re
+import time
+from contextlib import redirect_stdout
+from typing import List, Dict, Callable, Tuple
+
+from docopt import docopt
+
+from experiments.parsing.last_line_output_parser import LastLineOutputParser
+from experiments.parsing.multiple_choice_json_output_parser import MultipleChoiceJsonOutputParser
+
+
+class LegacyLastLineOutputParser:
+    def __init__(self, num_answer_options: int):
+        self.num_answer_options: int = num_answer_options
+
+    def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
+        parsed: int = self.extract_single_digit_number(response)
+        if parsed < 0:
+            parsed = self.select_multi_line(response)
+        if parsed < 0:
+            parsed = self.select_by_option_text(response, answer_choices)
+        if parsed == -1:
+            print(answer_choices)
+        return {'parsed': parsed >= 0, 'answered': parsed}
+
+    def extract_single_digit_number(self, text):
+        lines = text.strip().split('\n')[::-1]
+        for line in lines:
+            line = line.replace('*', '').strip().lower()
+            match = re.match(r'^(?:answer:\s*)+\[?(\d)\]?', line)
+            if match:
+                answered: int = int(match.group(1)) - 1
+                if answered < self.num_answer_options:
+                    return answered
+        return -1
+
+    def select_multi_line(self, text: str):
+        text = text.lower().strip()
+        match = re.search(r'\*?\*?answer:\*?\*?\s*\[?(\d)\]?', text)
+        if match:
+            answer: int = int(match.group(1)) - 1
+            if answer < self.num_answer_options:
+                return answer
+        return -1
+
+    def select_by_option_text(self, text: str, options: List[str]):
+        options = sorted(options, key=lambda x: -len(x))
+        text = text.lower()
+        for i, opt in enumerate(options):
+            if re.search(rf'\s*answer\*?\*?:\*?\*?\s*{re.escape(opt.lower())}', text):
+                return i
+        return -1
+
+
+class LegacyAnswerChoiceSelector:
+    def __init__(self, choices):
+        self.choices = choices
+
+    def get_token_positions(self, text):
+        positions = []
+        for i, answer in enumerate(self.choices):
+            for match in re.finditer(rf'\b{re.escape(answer)}\b', text):
+                positions.append((i, match.group().strip(), match.start()))
+        return sorted(positions, key=lambda x: x[-1])
+
+    def get_single_answer_token(self, text):
+        found = list(set([idx for idx, _, _ in self.get_token_positions(text)]))
+        if len(found) == 1:
+            return found[0]
+        return -1
+
+
+class LegacyMultipleChoiceTextOutputParser:
+    def __init__(self, num_answer_options: int):
+        self.num_answer_options: int = num_answer_options
+
+    def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
+        selector: LegacyAnswerChoiceSelector = LegacyAnswerChoiceSelector(answer_choices)
+        parse_fns: List[Callable[[str], int]] = [
+            self.get_num_if_exists, self.first_line_is_answer, self.any_single_line_is_answer, self.starts_with_num,
+            self.single_bracket_num, selector.get_single_answer_token, self.first_bracket_num, self.first_single_line
+        ]
+        answer_idx: int = -1
+        for _parse in parse_fns:
+            answer_idx = _parse(response)
+            if answer_idx > -1:
+                return {'parsed': True, 'answered': answer_idx}
+
+        has_num = False
+        for i in range(1, self.num_answer_options + 1):
+            has_num = has_num or str(i) in response
+        if has_num and answer_idx < 0:
+            print("RESPONSE WITH NUM::")
+            print(response.strip())
+        elif answer_idx < 0:
+            print('Response>')
+            print(response.strip())
+            print('END\n')
+        return {'parsed': False, 'answered': -1}
+
+    def get_num_if_exists(self, text: str) -> int:
+        for c in '[],.:()`\'"`':
+            text = text.replace(c, '')
+        text = text.strip()
+        for answer in range(1, self.num_answer_options + 1):
+            if text == str(answer):
+                return answer - 1
+        return -1
+
+    def first_line_is_answer(self, text: str):
+        return self.get_num_if_exists(text.strip().split('\n')[0])
+
+    def first_single_line(self, text):
+        for line in text.strip('\n'):
+            answer = self.get_num_if_exists(line)
+            if answer > -1:
+                return answer
+        return -1
+
+    def starts_with_num(self, text: str) -> int:
+        return self.get_num_if_exists(text.strip().split(' ')[0])
+
+    def single_bracket_num(self, text: str):
+        nums = [num - 1 for num in range(1, self.num_answer_options + 1) if f'[{num}]' in text]
+        if len(nums) == 1:
+            return nums[0]
+        return -1
+
+    def first_bracket_num(self, text):
+        nums = [
+            (num - 1, text.index(f'[{num}]')) for num in range(1, self.num_answer_options + 1) if f'[{num}]' in text
+        ]
+        nums = sorted([n for n in nums if n[-1] >= 0], key=lambda x: x[-1])
+        if len(nums) > 0:
+            return nums[0][0]
+        return -1
+
+    def any_single_line_is_answer(self, text: str):
+        for line in [line for line in text.split('\n') if len(line.strip()) > 0]:
+            answer: int = self.get_num_if_exists(line)
+            if answer > -1:
+                return answer
+        return -1
+
+
+def legacy_find_json_in_text(text):
+    json_str = None
+    try:
+        match = re.search(r'{.*?}', text, re.DOTALL)
+        if match:
+            json_str = match.group(0)
+            return json.loads(json_str)
+        else:
+            return None
+    except json.JSONDecodeError:
+        if json_str is not None:
+            answer_lines = [line for line in json_str.split('\n') if line.strip().startswith('"answer_choice"')]
+            if len(answer_lines) > 0:
+                return json.loads('{' + answer_lines[0] + '}')
+        return None
+
+
+class LegacyMultipleChoiceJsonOutputParser:
+    def __init__(self, num_answer_options: int):
+        self.num_answer_options: int = num_answer_options
+        self.backup: LegacyMultipleChoiceTextOutputParser = LegacyMultipleChoiceTextOutputParser(num_answer_options)
+
+    def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
+        answer: Dict = self.get_answer_from_json(response, answer_choices)
+        if not answer['parsed']:
+            answer = self.backup.select_answer(response, answer_choices)
+        if not answer['parsed']:
+            print("Could not parse:", response)
+        return answer
+
+    def get_answer_from_json(self, response: str, answer_choices: List[str]) -> Dict:
+        response_json = legacy_find_json_in_text(response)
+        if response_json is not None and 'answer_choice' in response_json:
+            answer_choice = str(response_json['answer_choice'])
+            for c in '[],.:()`\'"`':
+                answer_choice = answer_choice.replace(c, '')
+            answer_choice = answer_choice.strip()
+            for possible_answer in range(1, self.num_answer_options + 1):
+                if answer_choice == str(possible_answer):
+                    return {'parsed': True, 'answered': possible_answer - 1}
+            return self.backup.select_answer(str(response_json['answer_choice']), answer_choices)
+        return {'parsed': False, 'answered': -1}
+
+
+WORDS: List[str] = [
+    'the', 'mayor', 'council', 'announced', 'answer', 'Answer:', 'option', 'evidence', 'article', 'because', 'not',
+    '2024', 'March', '12', '0', '3', '[5]', '(2)', '**', '*', ':', '"', 'İstanbul', 'ſ', 'Σ', ' ', '\t', '٣'
+]
+
+
+def make_options(rnd: random.Random) -> List[str]:
+    # Most options are unique per question (as in NeoQA), some are shared or contain special characters.
+    options: List[str] = [
+        rnd.choice([
+            f'The mayor of {rnd.choice(WORDS)} {rnd.randint(1, 10000)}', f'{rnd.randint(1, 500)} people',
+            f'{rnd.choice(WORDS)} council', 'Paris', '3', 'None of the above', ' leading space', '*starred', '',
+            'mayor', 'a.b (c)'
+        ])
+        for _ in range(6)
+    ]
+    return options + ['Unanswerable']
+
+
+def make_response(rnd: random.Random, options: List[str]) -> str:
+    reasoning: str = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 300)))
+    reasoning = '\n'.join(reasoning[i:i + 80] for i in range(0, len(reasoning), 80))
+    number: str = rnd.choice(['1', '2', '3', '4', '5', '6', '7', '8', '0', '10'])
+    option: str = rnd.choice(options)
+    endings: List[str] = [
+        f'Answer: [{number}]', f'**Answer:** [{number}]', f'answer: {number}.', f'ANSWER: answer: {number}',
+        f'  **Answer: {number}**  \n', f'Answer: {option}', f'**Answer:** {option}', f'[{number}]', number,
+        f'({number})', f'{number} because', f'The answer is {option}.', f'Answer:\n{number}',
+        json.dumps({'explanation': reasoning[:50], 'answer_choice': rnd.choice([number, f'[{number}]', option])}),
+        '{"answer_choice": "' + number + '",\n"broken": }', '', 'I cannot answer this.'
+    ]
+    parts: List[str] = [reasoning, rnd.choice(endings)]
+    if rnd.random() < 0.3:
+        parts.insert(0, rnd.choice(endings))
+    return '\n'.join(parts) if rnd.random() < 0.8 else ' '.join(parts)
+
+
+def run_parser(parser, corpus: List[Tuple[str, List[str]]]) -> Tuple[List[Dict], str]:
+    out: io.StringIO = io.StringIO()
+    with redirect_stdout(out):
+        answers: List[Dict] = [parser.select_answer(response, options) for response, options in corpus]
+    return answers, out.getvalue()
+
+
+def time_it(parser, corpus: List[Tuple[str, List[str]]], repeat: int) -> float:
+    best: float = float('inf')
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        run_parser(parser, corpus)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_it_fn(fn: Callable[[str], object], corpus: List[Tuple[str, List[str]]], repeat: int) -> float:
+    best: float = float('inf')
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        for response, _ in corpus:
+            fn(response)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    rnd: random.Random = random.Random(int(args['--seed']))
+    corpus: List[Tuple[str, List[str]]] = []
+    for _ in range(int(args['--num'])):
+        options: List[str] = make_options(rnd)
+        corpus.append((make_response(rnd, options), options))
+    repeat: int = int(args['--repeat'])
+    print(f'Responses: {len(corpus)}, characters: {sum(len(response) for response, _ in corpus)}')
+
+    for name, legacy, current in [
+        ('last-line', LegacyLastLineOutputParser(7), LastLineOutputParser(7)),
+        ('json', LegacyMultipleChoiceJsonOutputParser(7), MultipleChoiceJsonOutputParser(7)),
+        ('text', LegacyMultipleChoiceTextOutputParser(7), MultipleChoiceJsonOutputParser(7).backup),
+    ]:
+        assert run_parser(legacy, corpus) == run_parser(current, corpus), f'The outputs of "{name}" differ!'
+        legacy_seconds: float = time_it(legacy, corpus, repeat)
+        current_seconds: float = time_it(current, corpus, repeat)
+        print(f'{name:10s} legacy {legacy_seconds * 1000:9.1f} ms   current {current_seconds * 1000:9.1f} ms   '
+              f'x{legacy_seconds / current_seconds:.1f}')
+
+    # Called after every generation step when the generation stops at the answer.
+    legacy_parser, parser = LegacyLastLineOutputParser(7), LastLineOutputParser(7)
+    assert [legacy_parser.extract_single_digit_number(response) >= 0 for response, _ in corpus] == \
+           [parser.has_final_answer(response) for response, _ in corpus]
+    legacy_seconds = time_it_fn(legacy_parser.extract_single_digit_number, corpus, repeat)
+    current_seconds = time_it_fn(parser.has_final_answer, corpus, repeat)
+    print(f'{"stop check":10s} legacy {legacy_seconds * 1000:9.1f} ms   current {current_seconds * 1000:9.1f} ms   '
+          f'x{legacy_seconds / current_seconds:.1f}')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
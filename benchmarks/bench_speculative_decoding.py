@@ -0,0 +1,91 @@
+"""
+Generation throughput with and without a draft model (assisted / speculative decoding) on prompts of the dev split.
+
+The draft must be a smaller model of the same family (with the same tokenizer), e.g. Qwen/Qwen2.5-0.5B-Instruct for
+Qwen/Qwen2.5-14B-Instruct. Prompts are generated one at a time in both settings (assisted generation does not support
+batches). Under greedy decoding, both settings must produce the same responses.
+
+Usage:
+  bench_speculative_decoding.py <model> <draft_model> <template_name> [--num-instances=<num_instances>] [--max-new-tokens=<max_new_tokens>] [--cpu] [--threads=<threads>]
+
+Arguments:
+  <model>           Path or name of the model, e.g. Qwen/Qwen2.5-14B-Instruct.
+  <draft_model>     Path or name of the draft model, e.g. Qwen/Qwen2.5-0.5B-Instruct.
+  <template_name>   The name of the prompt template, e.g. a *.cot template.
+
+Options:
+  --num-instances=<num_instances>       Number of dev instances [default: 8].
+  --max-new-tokens=<max_new_tokens>     Maximum number of generated tokens per prompt [default: 256].
+  --cpu                                 Run both models on the CPU in float32.
+  --threads=<threads>                   Number of torch threads with --cpu (defaults to the number of physical cores).
+  -h --help                             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_speculative_decoding
+"""
+import time
+from typing import Dict, List, Optional
+
+from docopt import docopt
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.llms.impl.cpu_quantized import QuantizedCPUChatLLM
+from experiments.llms.impl.hf_chat_llm import HuggingFaceChatLLM
+from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
+from experiments.running.run_and_eval import get_dataset_with_prompts
+
+
+def load_instances(template_name: str, num_instances: int) -> List[Dict]:
+    loader: NeoQALoader = NeoQALoader(NeoQALoader.BENCHMARK_WITHOUT_NOISE, embed_articles=False)
+    prompt_generator: MultipleChoicePromptGenerator = MultipleChoicePromptGenerator(
+        template_name, article_store=loader.article_store
+    )
+    dataset = get_dataset_with_prompts(loader, prompt_generator, 'dev', random_seed=1)
+    return [dataset[i] for i in range(min(num_instances, len(dataset)))]
+
+
+def get_llm(args, draft_model_path: Optional[str]) -> HuggingFaceChatLLM:
+    max_new_tokens: int = int(args['--max-new-tokens'])
+    if args['--cpu']:
+        return QuantizedCPUChatLLM(
+            args['<model>'], max_new_tokens=max_new_tokens, quantize=False,
+            num_threads=int(args['--threads']) if args['--threads'] else None, draft_model_path=draft_model_path
+        )
+    return HuggingFaceChatLLM(args['<model>'], max_new_tokens=max_new_tokens, draft_model_path=draft_model_path)
+
+
+def bench(llm: HuggingFaceChatLLM, instances: List[Dict]) -> Dict:
+    llm.generate_batch(instances[:1])  # Warm-up (and loading of the models)
+
+    start: float = time.perf_counter()
+    responses: List[str] = [response for instance in instances for response in llm.generate_batch([instance])]
+    seconds: float = time.perf_counter() - start
+    num_generated_tokens: int = sum(
+        len(llm.tokenizer.encode(response, add_special_tokens=False)) for response in responses
+    )
+    return {
+        'responses': responses,
+        'seconds': seconds,
+        'generated_tokens_per_second': num_generated_tokens / seconds
+    }
+
+
+def main(args):
+    instances: List[Dict] = load_instances(args['<template_name>'], int(args['--num-instances']))
+
+    results: Dict[str, Dict] = dict()
+    for setting, draft_model_path in [('without draft', None), ('with draft', args['<draft_model>'])]:
+        results[setting] = bench(get_llm(args, draft_model_path), instances)
+        print(
+            f'{setting:14s} {results[setting]["generated_tokens_per_second"]:8.1f} tokens/s  '
+            f'({results[setting]["seconds"]:.1f}s for {len(instances)} instances)'
+        )
+
+    speedup: float = results['without draft']['seconds'] / results['with draft']['seconds']
+    num_identical: int = sum(
+        a == b for a, b in zip(results['without draft']['responses'], results['with draft']['responses'])
+    )
+    print(f'Speedup: {speedup:.2f}x, identical responses: {num_identical}/{len(instances)}')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
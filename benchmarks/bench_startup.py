@@ -0,0 +1,82 @@
+"""
+Startup time of the run scripts, each measured in a fresh interpreter.
+
+Three things are measured: importing each script, re-running a finished run (the script only loads the stored
+metrics), and importing torch, transformers and datasets. The last one is what every invocation paid before these
+imports were deferred to first use.
+
+Usage:
+  bench_startup.py [--repeat=<repeat>]
+
+Options:
+  --repeat=<repeat>     Number of repetitions (the fastest is reported) [default: 3].
+  -h --help             Show this screen.
+
+Run from the repository root via: python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join
+from typing import List, Optional
+
+from docopt import docopt
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.util.file_util import store_json
+
+REPOSITORY_DIR: str = dirname(dirname(abspath(__file__)))
+HEAVY_MODULES: List[str] = ['torch', 'transformers', 'datasets']
+
+
+def time_command(args: List[str], repeat: int, cwd: Optional[str] = None) -> float:
+    env = {**os.environ, 'PYTHONPATH': REPOSITORY_DIR}
+    best: float = float('inf')
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        subprocess.run(args, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_loaded_heavy_modules(module: str) -> str:
+    code: str = f'import sys, {module}; print(",".join(m for m in {HEAVY_MODULES} if m in sys.modules))'
+    env = {**os.environ, 'PYTHONPATH': REPOSITORY_DIR}
+    output: str = subprocess.run(
+        [sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True
+    ).stdout.strip()
+    return output or '-'
+
+
+def create_finished_run(directory: str, model_dir: str, template_name: str) -> None:
+    out_directory: str = join(directory, 'results', model_dir, NeoQALoader.BENCHMARK_WITHOUT_NOISE, template_name)
+    os.makedirs(out_directory)
+    store_json({'adt_score': {'adt': 0.0}}, join(out_directory, 'dev.seed-1.metrics.json'))
+
+
+def main(args):
+    repeat: int = int(args['--repeat'])
+
+    print(f'{"import":40s} {"seconds":>8s}  heavy modules loaded')
+    for module in ['run_qwen25', 'run_phi', 'run_openai_compatible']:
+        seconds: float = time_command([sys.executable, '-c', f'import {module}'], repeat)
+        print(f'{module:40s} {seconds:8.2f}  {get_loaded_heavy_modules(module)}')
+    # What experiments.running.run_and_eval imported at module level before
+    previous_imports: str = 'import torch, datasets; from transformers import AutoModelForCausalLM, StoppingCriteriaList'
+    seconds = time_command([sys.executable, '-c', previous_imports], repeat)
+    print(f'{" + ".join(HEAVY_MODULES) + " (before)":40s} {seconds:8.2f}')
+
+    template_name: str = 'last-line-instructions-1'
+    with tempfile.TemporaryDirectory() as directory:
+        create_finished_run(directory, 'Qwen--Qwen2.5-7B-Instruct', template_name)
+        seconds = time_command(
+            [sys.executable, join(REPOSITORY_DIR, 'run_qwen25.py'), 'tune', '7b', template_name, 'last-line'],
+            repeat, cwd=directory
+        )
+    print(f'{"run_qwen25.py tune (finished run)":40s} {seconds:8.2f}')
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
@@ -0,0 +1,220 @@
+"""
+Checks the adaptive batch sizing on the CPU: the AdaptiveBatchSizer on its own, and the batched runner
+(run_and_eval_multiple_choice_with_batches) with a simulated memory limit. The batches of the runner must be split,
+every instance must be predicted exactly once, and an interrupted run must re-use the stored batch sizes when it is
+resumed.
+
+The limit is set to twice the cost of the longest prompt (as computed by the TokenBudgetBatcher) and the token budget
+per batch to eight times the limit, i.e. the packed batches run out of memory but every single instance fits.
+
+Usage:
+  check_adaptive_batching.py <model> [--random-init] [--template=<template_name>] [--max-new-tokens=<max_new_tokens>] [--crash-after=<crash_after>]
+
+Arguments:
+  <model>           Path or name of a (small) model, e.g. Qwen/Qwen2.5-0.5B-Instruct.
+
+Options:
+  --random-init                         Only use the config and tokenizer of the model, with a single randomly
+                                        initialized layer (the responses do not matter for the check).
+  --template=<template_name>            The name of the prompt template [default: last-line-instructions-1].
+  --max-new-tokens=<max_new_tokens>     Maximum number of generated tokens per prompt [default: 4].
+  --crash-after=<crash_after>           Number of generated batches after which the first run is interrupted [default: 3].
+  -h --help                             Show this screen.
+
+Run from the repository root via: python -m benchmarks.check_adaptive_batching
+"""
+import contextlib
+import io
+import re
+import shutil
+import tempfile
+from os.path import join
+from typing import Dict, List, Optional, Tuple
+
+from docopt import docopt
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
+from experiments.running.adaptive_batch_sizer import AdaptiveBatchSizer
+from experiments.running.run_and_eval import (
+    get_dataset_with_prompts, add_prompt_tokens, get_out_directory, run_and_eval_multiple_choice_with_batches
+)
+from experiments.running.token_budget_batcher import TokenBudgetBatcher
+from experiments.util.file_util import read_json, read_jsonl
+
+MODEL_NAME: str = 'check-adaptive-batching'
+DATA_VARIANT: str = NeoQALoader.BENCHMARK_WITHOUT_NOISE
+DATA_SPLIT: str = 'dev'
+RANDOM_SEED: int = 1
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def check_batch_sizer() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = join(directory, 'batch-sizes.json')
+        batch_sizer: AdaptiveBatchSizer = AdaptiveBatchSizer(path)
+        assert batch_sizer.get_max_batch_size(1000) is None
+        assert batch_sizer.split(list(range(8)), 1000) == [list(range(8))], 'Batches must not be split without a limit!'
+
+        # Halving (rounded up) after each out-of-memory error.
+        assert batch_sizer.add_out_of_memory(8, 1000) == 4
+        assert batch_sizer.split(list(range(8)), 1000) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+        assert batch_sizer.add_out_of_memory(4, 1000) == 2
+        assert batch_sizer.add_out_of_memory(5, 1000) == 2, 'A larger failed batch must not raise the limit!'
+        assert batch_sizer.split(list(range(5)), 1000) == [[0, 1], [2, 3], [4]]
+
+        # The limit also applies to longer prompts, but not to shorter ones.
+        assert batch_sizer.get_max_batch_size(1023) == 2
+        assert batch_sizer.get_max_batch_size(5000) == 2
+        assert batch_sizer.get_max_batch_size(511) is None
+        assert batch_sizer.add_out_of_memory(7, 100) == 4
+        assert batch_sizer.get_max_batch_size(511) == 4
+        assert batch_sizer.get_max_batch_size(1000) == 2
+
+        try:
+            batch_sizer.add_out_of_memory(1, 1000)
+            raise AssertionError('A single instance must not be split!')
+        except ValueError:
+            pass
+
+        # Persistence
+        assert AdaptiveBatchSizer(path).max_batch_sizes == batch_sizer.max_batch_sizes
+        assert AdaptiveBatchSizer(path).get_max_batch_size(5000) == 2
+    print('AdaptiveBatchSizer: ok')
+
+
+def load_model(args) -> Tuple:
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args['<model>'])
+    if args['--random-init']:
+        config = AutoConfig.from_pretrained(args['<model>'])
+        config.num_hidden_layers = 1
+        model = AutoModelForCausalLM.from_config(config)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(args['<model>'])
+    return model.eval(), tokenizer
+
+
+def get_prompt_num_tokens(tokenizer, template_name: str) -> Dict[str, int]:
+    loader: NeoQALoader = NeoQALoader(DATA_VARIANT, embed_articles=False)
+    prompt_generator: MultipleChoicePromptGenerator = MultipleChoicePromptGenerator(
+        template_name, article_store=loader.article_store
+    )
+    dataset = add_prompt_tokens(get_dataset_with_prompts(loader, prompt_generator, DATA_SPLIT, RANDOM_SEED), tokenizer)
+    return dict(zip(dataset['instance_id'], dataset['prompt_num_tokens']))
+
+
+def run(
+        model, tokenizer, template_name: str, max_tokens_per_batch: int, max_new_tokens: int, memory_limit: int,
+        crash_after: Optional[int] = None
+) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """
+    Runs the batched runner and returns the out-of-memory errors (batch size, max. prompt tokens) and the sizes of
+    the generated batches. The run is interrupted after crash_after generated batches (if set).
+    """
+    batch_sizes: List[int] = []
+    generate = model.generate
+
+    def generate_and_count(**kwargs):
+        if crash_after is not None and len(batch_sizes) >= crash_after:
+            raise SimulatedCrash()
+        batch_sizes.append(kwargs['input_ids'].shape[0])
+        return generate(**kwargs)
+
+    model.generate = generate_and_count
+    output: io.StringIO = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            run_and_eval_multiple_choice_with_batches(
+                model, tokenizer, max_tokens_per_batch, MODEL_NAME, template_name, 'last-line', DATA_VARIANT,
+                DATA_SPLIT, RANDOM_SEED, max_new_tokens=max_new_tokens, cache_dir=None,
+                simulated_memory_limit=memory_limit
+            )
+    except SimulatedCrash:
+        pass
+    finally:
+        model.generate = generate
+
+    out_of_memory: List[Tuple[int, int]] = [
+        (int(num_instances), int(max_num_tokens)) for num_instances, max_num_tokens in re.findall(
+            r'Out of memory for (\d+) instances with up to (\d+) tokens', output.getvalue()
+        )
+    ]
+    return out_of_memory, batch_sizes
+
+
+def check_predictions(out_directory: str, instance_ids: List[str]) -> None:
+    predicted_ids: List[str] = [
+        prediction['instance_id']
+        for prediction in read_jsonl(join(out_directory, f'{DATA_SPLIT}.seed-{RANDOM_SEED}.predictions.jsonl'))
+    ]
+    assert len(predicted_ids) == len(set(predicted_ids)), 'Instances were predicted more than once!'
+    assert set(predicted_ids) == set(instance_ids), 'Not all instances were predicted!'
+
+
+def check_runner(args) -> None:
+    template_name: str = args['--template']
+    max_new_tokens: int = int(args['--max-new-tokens'])
+    model, tokenizer = load_model(args)
+    prompt_num_tokens: Dict[str, int] = get_prompt_num_tokens(tokenizer, template_name)
+
+    batcher: TokenBudgetBatcher = TokenBudgetBatcher(1, max_new_tokens)
+    memory_limit: int = batcher.get_batch_cost(2, max(prompt_num_tokens.values()))
+    max_tokens_per_batch: int = 8 * memory_limit
+    num_batches: int = len(
+        TokenBudgetBatcher(max_tokens_per_batch, max_new_tokens).get_batches(list(prompt_num_tokens.values()))
+    )
+
+    out_directory: str = get_out_directory(MODEL_NAME, DATA_VARIANT, template_name)
+    batch_sizes_path: str = join(out_directory, f'{DATA_SPLIT}.seed-{RANDOM_SEED}.batch-sizes.json')
+    shutil.rmtree(join('./results', MODEL_NAME), ignore_errors=True)
+    try:
+        # Uninterrupted run
+        out_of_memory, batch_sizes = run(
+            model, tokenizer, template_name, max_tokens_per_batch, max_new_tokens, memory_limit
+        )
+        assert len(out_of_memory) > 0, 'The simulated memory limit was never reached!'
+        assert len(batch_sizes) > num_batches, 'The batches were not split!'
+        check_predictions(out_directory, list(prompt_num_tokens.keys()))
+        print(
+            f'Runner: {len(prompt_num_tokens)} instances in {len(batch_sizes)} batches (instead of {num_batches}), '
+            f'{len(out_of_memory)} out-of-memory errors, limits: {read_json(batch_sizes_path)}'
+        )
+
+        # Interrupted and resumed run
+        shutil.rmtree(join('./results', MODEL_NAME), ignore_errors=True)
+        out_of_memory, batch_sizes = run(
+            model, tokenizer, template_name, max_tokens_per_batch, max_new_tokens, memory_limit,
+            crash_after=int(args['--crash-after'])
+        )
+        assert len(out_of_memory) > 0, 'The first run was interrupted before it ran out of memory!'
+        stored_limits: AdaptiveBatchSizer = AdaptiveBatchSizer(batch_sizes_path)
+        assert len(stored_limits.max_batch_sizes) > 0, 'The batch sizes were not stored!'
+
+        resumed_out_of_memory, resumed_batch_sizes = run(
+            model, tokenizer, template_name, max_tokens_per_batch, max_new_tokens, memory_limit
+        )
+        for num_instances, max_num_tokens in resumed_out_of_memory:
+            # A batch larger than a stored limit would have been split before it was run.
+            max_batch_size: Optional[int] = stored_limits.get_max_batch_size(max_num_tokens)
+            assert max_batch_size is None or num_instances <= max_batch_size, 'The stored batch sizes were not used!'
+        check_predictions(out_directory, list(prompt_num_tokens.keys()))
+        print(
+            f'Resume: {len(batch_sizes)} batches before the interruption, {len(resumed_batch_sizes)} after it, '
+            f'{len(out_of_memory)} + {len(resumed_out_of_memory)} out-of-memory errors'
+        )
+    finally:
+        shutil.rmtree(join('./results', MODEL_NAME), ignore_errors=True)
+    print('Batched runner: ok')
+
+
+def main(args):
+    check_batch_sizer()
+    check_runner(args)
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
@@ -2,11 +2,11 @@ import shutil
 from copy import deepcopy
 from os import makedirs
 from os.path import exists, join
-from typing import Dict, List
+from typing import Dict, List, Set
 from data_gen.llm.modules.module_pipeline import ModulePipeline
 from data_gen.questions.question_gen_helper import get_outline_dict_for_events, get_xml_for_events, get_xml_event, \
     get_xml_event_selection
-from data_gen.util.entity_util import get_prev_snapshot_entity_xml, get_entity_categories
+from data_gen.util.entity_util import get_prev_snapshot_entity_xml, get_entity_categories, find_entity_mentions
 from data_gen.util.misc import find_object_by_prop
 
 
@@ -102,13 +102,14 @@ class Newspaper:
             text = ' '.join([
                 item['sentence'] for item in event['outline'] if item['id'] in subset
             ])
+            mentioned_entity_ids: Set[str] = {
+                mention['entity_id'] for mention in find_entity_mentions(text)
+            }
             used_entities = dict()
             for entity_type in get_entity_categories():
-                used_entities[f'used_{entity_type}'] = []
-                for ent in entity_snapshot[entity_type]:
-                    key = f'|{ent["id"]}' + '}'
-                    if key in text:
-                        used_entities[f'used_{entity_type}'].append(ent)
+                used_entities[f'used_{entity_type}'] = [
+                    ent for ent in entity_snapshot[entity_type] if ent['id'] in mentioned_entity_ids
+                ]
 
             event_info: str = get_xml_event_selection(event, subset, outline_dict)
             # make_event_info(event['date'], sentence_dict, subset)
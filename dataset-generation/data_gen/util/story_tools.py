@@ -1,10 +1,9 @@
-import re
 from os import listdir
 from os.path import join
 from typing import Dict, List, Iterable
 
 from data_gen.timelines.event_sequence.elements.entity import Entity
-from data_gen.util.entity_util import get_entity_categories
+from data_gen.util.entity_util import get_entity_categories, remove_ids_from
 
 
 def clean_evidence_ids(evidence_ids: List[str]) -> List[str]:
@@ -49,14 +48,6 @@ def renew_outline(values: Dict) -> Dict:
     return values
 
 
-def remove_ids_from(text: str) -> str:
-    pattern: re.Pattern = re.compile(r'\{([^|]+)\|([A-Z]+-\d+,?)+\}')
-    matches = re.finditer(pattern, text)
-    for match in matches:
-        text = text.replace(match.group(0), match.group(1))
-    return text
-
-
 def is_substring_in_list(substring: str, items: List[str]) -> bool:
     for item in items:
         if substring in item:
@@ -1,36 +1,43 @@
 """
 Usage:
-  decrypt_neoqa.py <src> <key>
+  decrypt_neoqa.py encrypt <src> <dest> <key> [--processes=<processes>]
+  decrypt_neoqa.py <src> <key> [--dest=<dest>] [--processes=<processes>]
 
 Arguments:
-  <src>   The source file to decrypt.
+  <src>   The source directory with the files to decrypt (or encrypt).
+  <dest>  The directory of the encrypted files.
   <key>   The decryption key to use.
+
+Options:
+  --dest=<dest>                 The directory of the decrypted files [default: ./dataset].
+  --processes=<processes>       Number of files that are processed in parallel [default: 4].
 """
-import base64
-import codecs
+from concurrent.futures import ProcessPoolExecutor
 from os import makedirs, listdir
 from os.path import join
+from typing import Callable, List
 
 from docopt import docopt
 
-
-def xor_decrypt(encrypted_text: str, key: int) -> str:
-    key = key % 256
-    encrypted_bytes = base64.b64decode(encrypted_text)
-    decrypted = ''.join(chr(b ^ key) for b in encrypted_bytes)
-    return decrypted
+from experiments.util.xor_cipher import decrypt_file, encrypt_file
 
 
-def decrypt_neoqa(src: str, dest: str, key: int):
+def process_files(src: str, dest: str, key: int, process_fn: Callable[[str, str, int], str], num_processes: int):
     makedirs(dest, exist_ok=True)
-    for file in listdir(src):
-        print('Decrypt:', file, '...', end=' ', flush=True)
-        file_path = join(src, file)
-        with codecs.open(file_path, encoding='utf-8') as f_in:
-            with codecs.open(join(dest, file), 'w', encoding='utf-8') as f_out:
-                for line in f_in.readlines():
-                    f_out.write(xor_decrypt(line, key).strip() + '\n')
-        print('(Done)', flush=True)
+    files: List[str] = sorted(listdir(src))
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        futures = [executor.submit(process_fn, join(src, file), join(dest, file), key) for file in files]
+        for file, future in zip(files, futures):
+            future.result()
+            print('Done:', file, flush=True)
+
+
+def decrypt_neoqa(src: str, dest: str, key: int, num_processes: int = 4):
+    process_files(src, dest, key, decrypt_file, num_processes)
+
+
+def encrypt_neoqa(src: str, dest: str, key: int, num_processes: int = 4):
+    process_files(src, dest, key, encrypt_file, num_processes)
 
 
 def main():
@@ -38,9 +45,13 @@ def main():
     arguments = docopt(__doc__)
     src = arguments['<src>']
     key = int(arguments['<key>'])
+    num_processes = int(arguments['--processes'])
 
-    # Decrypt the file using the provided arguments
-    decrypt_neoqa(src, './dataset', key)
+    if arguments['encrypt']:
+        encrypt_neoqa(src, arguments['<dest>'], key, num_processes)
+    else:
+        # Decrypt the files using the provided arguments
+        decrypt_neoqa(src, arguments['--dest'], key, num_processes)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,50 @@
+from typing import Dict, List, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+
+
+class ArticleStore:
+    """
+    Holds every news article exactly once in an Arrow table and resolves articles by their article_id.
+
+    QA instances only need to keep the IDs of their evidence documents. The articles are resolved when they are
+    needed (e.g. when the prompt is built), so that the same article is not copied into every instance that uses it.
+    A store that was saved via ArticleStore.save() is memory-mapped when loaded via ArticleStore.load().
+    """
+
+    def __init__(self, articles: 'Dataset'):
+        """
+        :param articles:    Arrow table with one row per news article (must contain the column "article_id").
+        """
+        self.articles: Dataset = articles
+        self.article_id_to_row: Dict[str, int] = {
+            article_id: row for row, article_id in enumerate(articles['article_id'])
+        }
+        if len(self.article_id_to_row) != len(articles):
+            raise ValueError('The article IDs in the article store must be unique!')
+
+    @classmethod
+    def from_articles(cls, articles: Iterable[Dict]) -> 'ArticleStore':
+        from datasets import Dataset
+        return cls(Dataset.from_list(list(articles)))
+
+    @classmethod
+    def load(cls, directory: str) -> 'ArticleStore':
+        from datasets import Dataset
+        return cls(Dataset.load_from_disk(directory))
+
+    def save(self, directory: str) -> None:
+        self.articles.save_to_disk(directory)
+
+    def get(self, article_id: str) -> Dict:
+        return self.articles[self.article_id_to_row[article_id]]
+
+    def get_all(self, article_ids: List[str]) -> List[Dict]:
+        return [self.get(article_id) for article_id in article_ids]
+
+    def __contains__(self, article_id: str) -> bool:
+        return article_id in self.article_id_to_row
+
+    def __len__(self) -> int:
+        return len(self.articles)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import shutil
+from os import makedirs, replace, getpid
+from os.path import join, exists
+from typing import Dict, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+
+from experiments.util.file_util import store_json
+
+
+class DatasetCache:
+    """
+    Persists prepared datasets as Arrow tables on disk. Cached datasets are memory-mapped when loaded.
+
+    Datasets are identified by a dictionary of all values that influence their content (e.g. data variant, split,
+    random seed, checksums of the source files). Bump DatasetCache.VERSION whenever the preparation code changes in
+    a way that invalidates existing entries.
+    """
+
+    VERSION: int = 1
+
+    def __init__(self, directory: str = './cache/datasets'):
+        """
+        :param directory:   Directory in which the cached datasets are stored.
+        """
+        self.directory: str = directory
+        makedirs(directory, exist_ok=True)
+
+    def get_key(self, key_values: Dict) -> str:
+        key_str: str = json.dumps({'cache_version': DatasetCache.VERSION, **key_values}, sort_keys=True)
+        return hashlib.sha256(key_str.encode()).hexdigest()
+
+    def get_path(self, key_values: Dict) -> str:
+        return join(self.directory, self.get_key(key_values))
+
+    def has(self, key_values: Dict) -> bool:
+        return exists(self.get_path(key_values))
+
+    def load(self, key_values: Dict) -> 'Dataset':
+        from datasets import Dataset
+        return Dataset.load_from_disk(self.get_path(key_values))
+
+    def store(self, key_values: Dict, dataset: 'Dataset') -> 'Dataset':
+        """
+        Stores the dataset and returns the memory-mapped version of it.
+        The dataset is first written to a temporary directory so that concurrent runs never see partial entries.
+        """
+        path: str = self.get_path(key_values)
+        tmp_path: str = f'{path}.tmp-{getpid()}'
+        dataset.save_to_disk(tmp_path)
+        store_json(key_values, join(tmp_path, 'cache_key.json'))
+        try:
+            replace(tmp_path, path)
+        except OSError:
+            # Another process stored the same entry in the meantime.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return self.load(key_values)
+
+    def get_or_create(self, key_values: Dict, create_fn: Callable[[], 'Dataset']) -> 'Dataset':
+        if self.has(key_values):
+            return self.load(key_values)
+        return self.store(key_values, create_fn())
@@ -1,10 +1,17 @@
+import json
+import tempfile
 from os.path import join, exists
-from typing import Set, List, Dict, Iterable
-from datasets import Dataset
+from typing import Set, List, Dict, Iterable, Optional, TYPE_CHECKING
 
-from experiments.util.entity_util import remove_ids_from
-from experiments.util.file_util import read_jsonl
+from experiments.data.article_store import ArticleStore
+from experiments.data.dataset_cache import DatasetCache
+from experiments.util.entity_util import remove_ids_from_all
+from experiments.util.file_util import read_jsonl, file_checksum
 from experiments.util.misc import seeded_shuffle
+from experiments.util.xor_cipher import iter_decrypted_lines
+
+if TYPE_CHECKING:
+    from datasets import Dataset
 
 
 class NeoQALoader:
@@ -31,6 +38,10 @@ class NeoQALoader:
                  shuffle_news: bool = False,
                  remove_entity_ids: bool = True,
                  directory: str = './dataset',
+                 embed_articles: bool = True,
+                 cache_dir: Optional[str] = None,
+                 decryption_key: Optional[int] = None,
+                 canonical_article_order: bool = False,
                  ):
         """
 
@@ -39,13 +50,28 @@ class NeoQALoader:
         :param shuffle_news:        If true (default=False) evidence documents will be shuffled.
         :param remove_entity_ids:   If true (default) the IDs of the named entities are removed from the news article text.
         :param directory:           Directory of the dataset (default="./dataset")
+        :param embed_articles:      If true (default) every instance contains the full news articles. Otherwise, instances
+                                    only contain the "news_article_ids" and the articles are resolved via the article_store.
+        :param cache_dir:           If set, prepared datasets (and the article store) are cached in this directory and
+                                    memory-mapped on subsequent loads.
+        :param decryption_key:      If set, the files in the directory are the original (encrypted) files. They are
+                                    decrypted in memory while reading, i.e. the plaintext is never written to disk.
+        :param canonical_article_order: If true (default=False) the evidence documents of every instance are sorted by
+                                    date (and ID). Instances with the same evidence then have the same prompt prefix,
+                                    and instances with overlapping evidence share long prefixes.
         """
         self.name: str = name
         self.shuffle_options: bool = shuffle_options
         self.shuffle_news: bool = shuffle_news
         self.remove_entity_ids: bool = remove_entity_ids
         self.directory: str = directory
+        self.embed_articles: bool = embed_articles
+        self.decryption_key: Optional[int] = decryption_key
+        self.canonical_article_order: bool = canonical_article_order
+        self.dataset_cache: Optional[DatasetCache] = DatasetCache(cache_dir) if cache_dir is not None else None
 
+        if shuffle_news and canonical_article_order:
+            raise ValueError('The news articles can either be shuffled or sorted into a canonical order!')
         if shuffle_news:
             print('WARNING: You are shuffling the order of the news articles. The news article order for samples with sufficient evidence will likely differ from the order with insufficient evidence.')
 
@@ -59,13 +85,78 @@ class NeoQALoader:
         if not exists(join(directory)):
             raise ValueError(f'Directory does not exist: {directory}!')
 
-        self.article_dict: Dict[str, Dict] = {
-            article['article_id']: article
-            for split in ['dev', 'test']
-            for article in read_jsonl(join(self.directory, f'{split}.news.jsonl'))
-        }
+        self._article_dict: Optional[Dict[str, Dict]] = None
+
+        # Articles as they are used in the instances (i.e. without entity IDs if remove_entity_ids is set).
+        # Without an article store, each article is only prepared once, no matter how many instances use it.
+        self._prepared_articles: Dict[str, Dict] = dict()
+
+        # Date of every news article (for the canonical article order), created when it is first needed.
+        self._article_dates: Optional[Dict[str, str]] = None
+
+        # Holds the memory-mapped article store if it is not cached (removed with the loader).
+        self._article_store_directory: Optional[tempfile.TemporaryDirectory] = None
 
-    def get(self, split: str, random_seed: int = 1) -> Dataset:
+        self.article_store: Optional[ArticleStore] = None
+        if self.dataset_cache is not None:
+            # The prepared articles are persisted with the cache and re-used by both modes.
+            self.article_store = ArticleStore(self.dataset_cache.get_or_create(
+                self._get_article_cache_key(), lambda: self._create_article_store().articles
+            ))
+        elif not embed_articles:
+            self._article_store_directory = tempfile.TemporaryDirectory(prefix='neoqa-articles-')
+            self._create_article_store().save(self._article_store_directory.name)
+            self.article_store = ArticleStore.load(self._article_store_directory.name)
+
+        if self.article_store is not None:
+            # All articles are resolved via the (memory-mapped) article store from now on.
+            self._article_dict = None
+            self._prepared_articles = dict()
+
+    @property
+    def article_dict(self) -> Dict[str, Dict]:
+        # Only parse the news articles if they are needed (i.e. not everything is already cached)
+        if self._article_dict is None:
+            self._article_dict = {
+                article['article_id']: article
+                for split in ['dev', 'test']
+                for article in self._read_jsonl(self._get_news_path(split))
+            }
+        return self._article_dict
+
+    def get_article(self, article_id: str) -> Dict:
+        """
+        Returns the news article as it is shown to the model. Without an article store, the result is memoized and
+        must not be modified.
+        """
+        if self.article_store is not None:
+            return self.article_store.get(article_id)
+        if article_id not in self._prepared_articles:
+            self._prepared_articles[article_id] = self._prepare_article(self.article_dict[article_id])
+        return self._prepared_articles[article_id]
+
+    def get_article_dates(self) -> Dict[str, str]:
+        """
+        Returns the date of every news article by its ID. Only the date column is read from the article store.
+        """
+        if self._article_dates is None:
+            if self.article_store is not None:
+                articles: Dataset = self.article_store.articles
+                self._article_dates = dict(zip(articles['article_id'], articles['date']))
+            else:
+                self._article_dates = {
+                    article_id: article['date'] for article_id, article in self.article_dict.items()
+                }
+        return self._article_dates
+
+    def _prepare_article(self, article: Dict) -> Dict:
+        if self.remove_entity_ids:
+            return {
+                **article, 'passages': remove_ids_from_all(article['passages'])
+            }
+        return article
+
+    def get(self, split: str, random_seed: int = 1) -> 'Dataset':
 
         if self.name in {
             NeoQALoader.BENCHMARK, NeoQALoader.BENCHMARK_WITHOUT_NOISE
@@ -76,12 +167,57 @@ class NeoQALoader:
             if split not in {'test'}:
                 raise ValueError(f'Split must be one of "test"!')
 
+        if self.dataset_cache is not None:
+            return self.dataset_cache.get_or_create(
+                self.get_cache_key(split, random_seed), lambda: self._create(split, random_seed)
+            )
+        return self._create(split, random_seed)
+
+    def get_cache_key(self, split: str, random_seed: int) -> Dict:
+        """
+        Returns all values that determine the content of the dataset returned by NeoQALoader.get().
+        """
+        return {
+            'name': self.name,
+            'split': split,
+            'random_seed': random_seed,
+            'shuffle_options': self.shuffle_options,
+            'shuffle_news': self.shuffle_news,
+            'canonical_article_order': self.canonical_article_order,
+            'remove_entity_ids': self.remove_entity_ids,
+            'embed_articles': self.embed_articles,
+            'instances_checksum': file_checksum(self._get_instances_path(split)),
+            'news_checksums': self._get_news_checksums()
+        }
+
+    def _get_article_cache_key(self) -> Dict:
+        return {
+            'article_store': True,
+            'remove_entity_ids': self.remove_entity_ids,
+            'news_checksums': self._get_news_checksums()
+        }
+
+    def _get_news_checksums(self) -> List[str]:
+        return [file_checksum(self._get_news_path(split)) for split in ['dev', 'test']]
+
+    def _read_jsonl(self, src: str) -> List[Dict]:
+        if self.decryption_key is None:
+            return read_jsonl(src)
+        return [json.loads(line) for line in iter_decrypted_lines(src, self.decryption_key)]
+
+    def _get_news_path(self, split: str) -> str:
+        return join(self.directory, f'{split}.news.jsonl')
+
+    def _get_instances_path(self, split: str) -> str:
         if self.name == NeoQALoader.CONTEXT_ABL_80_20:
             filename = NeoQALoader.CONTEXT_ABL_80
         else:
             filename = self.name
+        return join(self.directory, f'{split}.{filename}.jsonl')
 
-        instances: Iterable[Dict] = read_jsonl(join(self.directory, f'{split}.{filename}.jsonl'))
+    def _create(self, split: str, random_seed: int) -> 'Dataset':
+        from datasets import Dataset
+        instances: Iterable[Dict] = self._read_jsonl(self._get_instances_path(split))
         instances = map(lambda instance: self._prepare(instance, random_seed), instances)
 
         if self.name == NeoQALoader.CONTEXT_ABL_80_20:
@@ -102,14 +238,16 @@ class NeoQALoader:
         news_article_ids: List[str] = instance['use_evidence_documents'][:]
         if self.shuffle_news:
             news_article_ids = seeded_shuffle(news_article_ids, instance['question_family_id'], random_seed)
-        news_articles: List[Dict] = [
-            self.article_dict[article_id] for article_id in news_article_ids
-        ]
-        if self.remove_entity_ids:
-            for news_article in news_articles:
-                news_article['passages'] = [
-                    remove_ids_from(passage) for passage in news_article['passages']
-                ]
+        if self.canonical_article_order:
+            article_dates: Dict[str, str] = self.get_article_dates()
+            news_article_ids = sorted(
+                news_article_ids, key=lambda article_id: (article_dates[article_id], article_id)
+            )
+        news_articles: List[Dict] = []
+        if self.embed_articles:
+            news_articles = [
+                self.get_article(article_id) for article_id in news_article_ids
+            ]
 
         sample: Dict = {
             'timeline_id': instance['timeline_id'],       # Unique for every timeline
@@ -125,17 +263,19 @@ class NeoQALoader:
             'created_at': instance['created_at'],
             'options': answer_options,
             'gold_answer_idx': gold_answer_idx,
-            'news_articles': news_articles,
+            'news_article_ids': news_article_ids,
             'num_documents': len(instance['use_evidence_documents'])
         }
+        if self.embed_articles:
+            sample['news_articles'] = news_articles
         if 'irrelevant_article_ids' in instance:
             sample['irrelevant_article_ids'] = instance['irrelevant_article_ids']
         if sample['question_family_id'] == sample['question_id']:
             assert sample['category'] in {'multi-hop', 'time-span'}
         return sample
 
-
-
-
-
-
+    def _create_article_store(self) -> ArticleStore:
+        # Articles are prepared without memoizing them: the store holds the only copy.
+        return ArticleStore.from_articles(
+            self._prepare_article(article) for article in self.article_dict.values()
+        )
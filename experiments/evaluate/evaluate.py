@@ -1,145 +1,258 @@
 import json
-from collections import defaultdict
-from typing import Dict, List
+from typing import Dict, List, Iterable, Optional, Set
 
 import numpy as np
-from sklearn.metrics import recall_score, precision_score, f1_score
 
-from experiments.util.file_util import read_jsonl
+ANSWERABLE: str = 'answerable-sufficient'
+NOT_ANSWERABLE: Set[str] = {'answerable-insufficient', 'unanswerable'}
 
 
-def evaluate_predictions(predictions: List[Dict], add_answerable_scores: bool = False) -> Dict:
+def get_prediction_columns(predictions: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Converts the predictions into NumPy columns of the values needed for the evaluation ("category", "answerable",
+    "gold", "predicted" and "family"). Predictions without "question_family_id" form their own family.
+    """
+    category: List[str] = []
+    answerable: List[str] = []
+    gold: List[int] = []
+    predicted: List[int] = []
+    family: List[str] = []
+    for prediction in predictions:
+        category.append(prediction['category'])
+        answerable.append(prediction['answerable'])
+        gold.append(prediction['gold_answer_idx'])
+        predicted.append(prediction['predicted_answer'])
+        family.append(prediction.get('question_family_id') or prediction['instance_id'])
+    return {
+        'category': np.array(category, dtype=str),
+        'answerable': np.array(answerable, dtype=str),
+        'gold': np.array(gold, dtype=np.int64),
+        'predicted': np.array(predicted, dtype=np.int64),
+        'family': np.array(family, dtype=str),
+    }
 
-    num_parsed: int = 0
-    num_correct: int = 0
 
-    performance_per_answerable: Dict[bool, List[float]] = defaultdict(list)
+def load_prediction_columns(src: str) -> Dict[str, np.ndarray]:
+    """
+    Reads the predictions file line by line and only keeps the evaluation columns (not the prompts and responses).
+    """
+    with open(src, encoding='utf-8') as f_in:
+        return get_prediction_columns(map(json.loads, f_in))
 
-    for prediction in predictions:
-        predicted_answer_idx: int = prediction['predicted_answer']
-        gold_answer_idx: int = prediction['gold_answer_idx']
 
-        if predicted_answer_idx >= 0:
-            num_parsed += 1
+class SliceCounts:
+    """
+    Number of predictions, parsed predictions and correct predictions for every combination of answerability and
+    category (rows: answerable_values, columns: category_values). Any slice is the sum over the selected groups.
+    """
 
-        if prediction['answerable'] in {'answerable-insufficient', 'unanswerable'}:
-            answerable = False
-        else:
-            assert prediction['answerable'] == 'answerable-sufficient', prediction['answerable']
-            answerable = True
+    def __init__(
+            self, answerable_values: np.ndarray, category_values: np.ndarray,
+            total: np.ndarray, parsed: np.ndarray, correct: np.ndarray, allow_empty: bool = False
+    ):
+        """
+        :param allow_empty:     Return None instead of failing for the ratios of empty slices (for partial results).
+        """
+        self.answerable_values: np.ndarray = answerable_values
+        self.category_values: np.ndarray = category_values
+        self.total: np.ndarray = total
+        self.parsed: np.ndarray = parsed
+        self.correct: np.ndarray = correct
+        self.allow_empty: bool = allow_empty
 
-        if predicted_answer_idx == gold_answer_idx:
-            num_correct += 1
-            performance_per_answerable[answerable].append(1.)
-        else:
-            performance_per_answerable[answerable].append(0.)
+    @staticmethod
+    def from_columns(columns: Dict[str, np.ndarray]) -> 'SliceCounts':
+        # All counts are computed in one pass (group-by).
+        answerable_values, answerable_codes = np.unique(columns['answerable'], return_inverse=True)
+        category_values, category_codes = np.unique(columns['category'], return_inverse=True)
+        shape = (len(answerable_values), len(category_values))
+        groups: np.ndarray = np.ravel_multi_index((answerable_codes, category_codes), shape)
 
-    out = {
-        'total': len(predictions),
-        'parsed': num_parsed / len(predictions),
-        'accuracy': num_correct / len(predictions),
-    }
+        num_groups: int = shape[0] * shape[1]
+        return SliceCounts(
+            answerable_values, category_values,
+            total=np.bincount(groups, minlength=num_groups).reshape(shape),
+            parsed=np.bincount(groups[columns['predicted'] >= 0], minlength=num_groups).reshape(shape),
+            correct=np.bincount(groups[columns['predicted'] == columns['gold']], minlength=num_groups).reshape(shape)
+        )
 
-    if add_answerable_scores:
+    def get_mask(self, answerable: Optional[Set[str]] = None, category: Optional[str] = None) -> np.ndarray:
+        answerable_mask: np.ndarray = np.ones(len(self.answerable_values), dtype=bool)
+        if answerable is not None:
+            answerable_mask = np.isin(self.answerable_values, list(answerable))
+        category_mask: np.ndarray = np.ones(len(self.category_values), dtype=bool)
+        if category is not None:
+            category_mask = self.category_values == category
+        return np.outer(answerable_mask, category_mask)
+
+    def evaluate(self, answerable: Optional[Set[str]] = None, category: Optional[str] = None) -> Dict:
+        mask: np.ndarray = self.get_mask(answerable, category)
+        total: int = int(self.total[mask].sum())
+        if total == 0 and self.allow_empty:
+            return {'total': 0, 'parsed': None, 'accuracy': None}
+        return {
+            'total': total,
+            'parsed': int(self.parsed[mask].sum()) / total,
+            'accuracy': int(self.correct[mask].sum()) / total,
+        }
 
-        acc_answerable: float = float(np.mean(performance_per_answerable[True]))
-        acc_unanswerable: float = float(np.mean(performance_per_answerable[False]))
+    def get_accuracy(self, answerable: Set[str]) -> float:
+        # NaN if no prediction has this answerability (as the mean of an empty list).
+        mask: np.ndarray = self.get_mask(answerable)
+        with np.errstate(invalid='ignore'):
+            return float(np.float64(self.correct[mask].sum()) / self.total[mask].sum())
+
+    def get_answerability_scores(self) -> Dict:
+        acc_answerable: float = self.get_accuracy({ANSWERABLE})
+        acc_unanswerable: float = self.get_accuracy(NOT_ANSWERABLE)
 
         if acc_answerable + acc_unanswerable == 0.:
             overall_score: float = 0.
         else:
             overall_score: float = (2 * acc_answerable * acc_unanswerable) / (acc_answerable + acc_unanswerable)
-
-        out['answerability_scores'] = {
+        return {
             'answerable': acc_answerable,
             'unanswerable': acc_unanswerable,
             'overall': overall_score
         }
-    return out
-
 
-def adt_score(predictions: List[Dict]):
-    correct_unanswerable: List[float] = []
-    correct_answerable: List[float] = []
-    for prediction in predictions:
-        is_answerable: bool = prediction['answerable'] == 'answerable-sufficient'
-        predicted_answer_idx: int = prediction['predicted_answer']
-        gold_answer_idx: int = prediction['gold_answer_idx']
-
-        if is_answerable:
-            if predicted_answer_idx == gold_answer_idx:
-                correct_answerable.append(1.)
-            else:
-                correct_answerable.append(0.)
-        else:
-            if predicted_answer_idx == gold_answer_idx:
-                correct_unanswerable.append(1.)
-            else:
-                correct_unanswerable.append(0.)
-
-    assert len(correct_unanswerable) > 0
-    assert len(correct_answerable) > 0
-    assert len(correct_unanswerable + correct_answerable) == len(predictions)
-
-    acc_answerable = np.mean(correct_answerable)
-    acc_unanswerable = np.mean(correct_unanswerable)
-    if acc_answerable + acc_unanswerable == 0.:
-        return {
-            'adt': 0.,
-            'acc_answerable': acc_answerable,
-            'acc_unanswerable': acc_unanswerable
-        }
-    else:
-        adt = (2 * acc_answerable * acc_unanswerable) / (acc_answerable + acc_unanswerable)
-        return {
-            'adt': adt,
-            'acc_answerable': acc_answerable,
-            'acc_unanswerable': acc_unanswerable
-        }
 
+def check_answerable_values(columns: Dict[str, np.ndarray]) -> None:
+    unknown: Set[str] = set(np.unique(columns['answerable'])) - NOT_ANSWERABLE - {ANSWERABLE}
+    assert len(unknown) == 0, unknown
 
-def evaluate_file(src: str):
-    predictions = read_jsonl(src)
 
-    out: Dict = {
-        'adt_score': adt_score(predictions),
-        'acc_all': evaluate_predictions(predictions, True),
+def get_slice_metrics(counts: SliceCounts) -> Dict:
+    """
+    Accuracy (and ratio of parsed answers) overall and for each answerability and category.
+    """
+    return {
+        'acc_all': {**counts.evaluate(), 'answerability_scores': counts.get_answerability_scores()},
         'acc_sufficient_evidence': {
-            'multi-hop': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-sufficient' and p['category'] == 'multi-hop'
-            ]),
-            'time-span': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-sufficient' and p['category'] == 'time-span'
-            ]),
-            'all': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-sufficient'
-            ]),
+            'multi-hop': counts.evaluate({'answerable-sufficient'}, 'multi-hop'),
+            'time-span': counts.evaluate({'answerable-sufficient'}, 'time-span'),
+            'all': counts.evaluate({'answerable-sufficient'}),
         },
         'acc_insufficient_evidence': {
-            'multi-hop': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-insufficient' and p['category'] == 'multi-hop'
-            ]),
-            'time-span': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-insufficient' and p['category'] == 'time-span'
-            ]),
-            'all': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'answerable-insufficient'
-            ]),
+            'multi-hop': counts.evaluate({'answerable-insufficient'}, 'multi-hop'),
+            'time-span': counts.evaluate({'answerable-insufficient'}, 'time-span'),
+            'all': counts.evaluate({'answerable-insufficient'}),
         },
         'acc_unanswerable': {
-            'uncertain-specificity': evaluate_predictions([
-                p for p in predictions if p['category'] == 'uncertain-specificity'
-            ]),
-            'false-premise': evaluate_predictions([
-                p for p in predictions if p['category'] == 'false-premise'
-            ]),
-            'all': evaluate_predictions([
-                p for p in predictions if p['answerable'] == 'unanswerable'
-            ]),
+            'uncertain-specificity': counts.evaluate(category='uncertain-specificity'),
+            'false-premise': counts.evaluate(category='false-premise'),
+            'all': counts.evaluate({'unanswerable'}),
         }
+    }
 
+
+def evaluate_columns(columns: Dict[str, np.ndarray], add_answerable_scores: bool = False) -> Dict:
+    check_answerable_values(columns)
+    counts: SliceCounts = SliceCounts.from_columns(columns)
+    out: Dict = counts.evaluate()
+    if add_answerable_scores:
+        out['answerability_scores'] = counts.get_answerability_scores()
+    return out
+
+
+def evaluate_predictions(predictions: List[Dict], add_answerable_scores: bool = False) -> Dict:
+    return evaluate_columns(get_prediction_columns(predictions), add_answerable_scores)
+
+
+def get_adt(acc_answerable: np.ndarray, acc_unanswerable: np.ndarray) -> np.ndarray:
+    """
+    Harmonic mean of both accuracies (element-wise), 0 if both are 0.
+    """
+    acc_answerable = np.asarray(acc_answerable, dtype=np.float64)
+    acc_unanswerable = np.asarray(acc_unanswerable, dtype=np.float64)
+    denominator: np.ndarray = acc_answerable + acc_unanswerable
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator == 0., 0., (2 * acc_answerable * acc_unanswerable) / denominator)
+
+
+def adt_score_columns(columns: Dict[str, np.ndarray]) -> Dict:
+    is_answerable: np.ndarray = columns['answerable'] == ANSWERABLE
+    is_correct: np.ndarray = columns['predicted'] == columns['gold']
+
+    assert np.sum(~is_answerable) > 0
+    assert np.sum(is_answerable) > 0
+
+    acc_answerable: float = float(np.mean(is_correct[is_answerable]))
+    acc_unanswerable: float = float(np.mean(is_correct[~is_answerable]))
+    return {
+        'adt': float(get_adt(np.float64(acc_answerable), np.float64(acc_unanswerable))),
+        'acc_answerable': acc_answerable,
+        'acc_unanswerable': acc_unanswerable
     }
 
+
+def adt_score(predictions: List[Dict]):
+    return adt_score_columns(get_prediction_columns(predictions))
+
+
+def bootstrap_adt(
+        columns: Dict[str, np.ndarray], num_samples: int = 1000, confidence: float = 0.95, seed: int = 1,
+        max_chunk_size: int = 1 << 22
+) -> Dict:
+    """
+    Confidence interval of the ADT score by resampling question families (all variants of a question stay together).
+
+    Only the number of (correct) answerable and unanswerable predictions per family is needed. Each bootstrap sample
+    is a vector of how often each family was drawn, so all samples are evaluated with a single matrix product.
+
+    :param max_chunk_size:  Maximum number of entries in the (samples x families) matrix that is created at once.
+    """
+    family_values, families = np.unique(columns['family'], return_inverse=True)
+    num_families: int = len(family_values)
+    is_answerable: np.ndarray = columns['answerable'] == ANSWERABLE
+    is_correct: np.ndarray = columns['predicted'] == columns['gold']
+
+    # Counts per family: answerable, correct answerable, unanswerable, correct unanswerable
+    family_counts: np.ndarray = np.stack([
+        np.bincount(families, weights=is_answerable, minlength=num_families),
+        np.bincount(families, weights=is_answerable & is_correct, minlength=num_families),
+        np.bincount(families, weights=~is_answerable, minlength=num_families),
+        np.bincount(families, weights=~is_answerable & is_correct, minlength=num_families),
+    ], axis=1)
+
+    rng: np.random.Generator = np.random.default_rng(seed)
+    chunk_size: int = max(1, max_chunk_size // num_families)
+    sample_counts: List[np.ndarray] = []
+    for start in range(0, num_samples, chunk_size):
+        # Draw the families of each sample and count how often each family was drawn (one bincount for all samples).
+        size: int = min(chunk_size, num_samples - start)
+        draws: np.ndarray = rng.integers(0, num_families, size=(size, num_families))
+        draws += np.arange(size)[:, None] * num_families
+        num_draws: np.ndarray = np.bincount(draws.ravel(), minlength=size * num_families).reshape(size, num_families)
+        sample_counts.append(num_draws @ family_counts)
+    counts: np.ndarray = np.concatenate(sample_counts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adt: np.ndarray = get_adt(counts[:, 1] / counts[:, 0], counts[:, 3] / counts[:, 2])
+
+    # Samples without any (un)answerable question are ignored.
+    alpha: float = (1 - confidence) / 2
+    lower, upper = np.nanquantile(adt, [alpha, 1 - alpha])
+    return {
+        'lower': float(lower),
+        'upper': float(upper),
+        'confidence': confidence,
+        'num_samples': num_samples,
+        'num_families': num_families
+    }
+
+
+def evaluate_file(src: str, num_bootstrap_samples: int = 1000):
+    columns: Dict[str, np.ndarray] = load_prediction_columns(src)
+    check_answerable_values(columns)
+    counts: SliceCounts = SliceCounts.from_columns(columns)
+
+    out: Dict = {
+        'adt_score': adt_score_columns(columns),
+    }
+    if num_bootstrap_samples > 0:
+        out['adt_confidence_interval'] = bootstrap_adt(columns, num_bootstrap_samples)
+    out |= get_slice_metrics(counts)
+
     print(json.dumps(out, indent=2))
     return out
-
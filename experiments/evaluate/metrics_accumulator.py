@@ -0,0 +1,107 @@
+import time
+from datetime import datetime
+from os import replace, remove
+from os.path import exists
+from typing import Dict, List, Tuple, Iterable, Optional
+
+import numpy as np
+
+from experiments.evaluate.evaluate import SliceCounts, get_slice_metrics
+from experiments.util.file_util import store_json
+
+
+class MetricsAccumulator:
+    """
+    Keeps running counts (total, parsed, correct) per answerability and category while predictions are added, so that
+    the metrics of an unfinished run are available at any time. The partial metrics (with the progress, throughput and
+    ETA of the run) are written to a JSON file at most every write_interval seconds.
+    """
+
+    def __init__(self, dest: str, num_instances: int, write_interval: float = 60.0):
+        """
+        :param dest:            Path of the partial metrics file.
+        :param num_instances:   Number of instances of the full run (including already predicted ones).
+        :param write_interval:  Minimum number of seconds between two writes of the partial metrics.
+        """
+        self.dest: str = dest
+        self.num_instances: int = num_instances
+        self.write_interval: float = write_interval
+
+        # (answerable, category) -> [total, parsed, correct]
+        self.group_counts: Dict[Tuple[str, str], List[int]] = dict()
+        self.num_predicted: int = 0
+        self.num_new: int = 0
+        self.start_time: float = time.time()
+        self.last_write: float = self.start_time
+
+    def add(self, prediction: Dict, is_new: bool = True) -> None:
+        """
+        :param is_new:  False for predictions of a previous (resumed) run. They count for the metrics, not the throughput.
+        """
+        counts: List[int] = self.group_counts.setdefault((prediction['answerable'], prediction['category']), [0, 0, 0])
+        counts[0] += 1
+        counts[1] += int(prediction['predicted_answer'] >= 0)
+        counts[2] += int(prediction['predicted_answer'] == prediction['gold_answer_idx'])
+        self.num_predicted += 1
+        self.num_new += int(is_new)
+
+    def add_all(self, predictions: Iterable[Dict], is_new: bool = True) -> None:
+        for prediction in predictions:
+            self.add(prediction, is_new)
+
+    def get_slice_counts(self) -> SliceCounts:
+        answerable_values: np.ndarray = np.array(sorted({answerable for answerable, _ in self.group_counts}), dtype=str)
+        category_values: np.ndarray = np.array(sorted({category for _, category in self.group_counts}), dtype=str)
+        counts: np.ndarray = np.zeros((3, len(answerable_values), len(category_values)), dtype=np.int64)
+        for (answerable, category), group_counts in self.group_counts.items():
+            row: int = int(np.searchsorted(answerable_values, answerable))
+            col: int = int(np.searchsorted(category_values, category))
+            counts[:, row, col] = group_counts
+        return SliceCounts(answerable_values, category_values, *counts, allow_empty=True)
+
+    def get_progress(self) -> Dict:
+        elapsed: float = time.time() - self.start_time
+        instances_per_second: Optional[float] = self.num_new / elapsed if self.num_new > 0 and elapsed > 0 else None
+        num_remaining: int = max(0, self.num_instances - self.num_predicted)
+        return {
+            'predicted': self.num_predicted,
+            'total': self.num_instances,
+            'elapsed_seconds': elapsed,
+            'instances_per_second': instances_per_second,
+            'eta_seconds': num_remaining / instances_per_second if instances_per_second else None,
+            'updated_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+    def get_metrics(self) -> Dict:
+        counts: SliceCounts = self.get_slice_counts()
+        answerability_scores: Dict = counts.get_answerability_scores()
+        return {
+            'progress': self.get_progress(),
+            # Same as evaluate_file(); NaN as long as no (un)answerable instance was predicted.
+            'adt_score': {
+                'adt': answerability_scores['overall'],
+                'acc_answerable': answerability_scores['answerable'],
+                'acc_unanswerable': answerability_scores['unanswerable']
+            },
+            **get_slice_metrics(counts)
+        }
+
+    def write(self) -> Dict:
+        # Written to a temporary file first, so that readers never see a partially written file.
+        metrics: Dict = self.get_metrics()
+        store_json(metrics, f'{self.dest}.tmp', pretty=True)
+        replace(f'{self.dest}.tmp', self.dest)
+        self.last_write = time.time()
+        return metrics
+
+    def maybe_write(self) -> Optional[Dict]:
+        if time.time() - self.last_write >= self.write_interval:
+            return self.write()
+        return None
+
+    def remove(self) -> None:
+        """
+        Deletes the partial metrics file (e.g. once the final metrics are stored).
+        """
+        if exists(self.dest):
+            remove(self.dest)
@@ -0,0 +1,126 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from experiments.evaluate.reparse import find_prediction_files, PREDICTIONS_SUFFIX
+from experiments.evaluate.results_warehouse import parse_run_path, RUN_COLUMNS
+from experiments.running.profiling import PROFILE_SUFFIX
+
+# Columns that the profiles can be grouped by.
+PROFILE_COLUMNS: List[str] = RUN_COLUMNS + ['prompt_length', 'batch_size', 'cached']
+
+
+def get_length_bucket(num_tokens: Optional[int]) -> str:
+    # Buckets double in length (as in the AdaptiveBatchSizer), e.g. "1024-2047".
+    if num_tokens is None:
+        return 'unknown'
+    bucket: int = num_tokens.bit_length()
+    return f'{(1 << bucket) >> 1}-{(1 << bucket) - 1}'
+
+
+def read_profiles(path: str) -> List[Dict]:
+    """
+    Reads the profile records of a run together with its setup (model, template, ...) and the prompt length bucket.
+    Only the last record per instance is kept (an instance is profiled again if a run is restarted before its
+    prediction was stored).
+    """
+    setup: Dict = parse_run_path(path[:-len(PROFILE_SUFFIX)] + PREDICTIONS_SUFFIX)
+    records: Dict[str, Dict] = dict()
+    with open(path, encoding='utf-8') as f_in:
+        for line in f_in:
+            if len(line.strip()) > 0:
+                record: Dict = json.loads(line)
+                records[record['instance_id']] = {
+                    **setup, **record, 'prompt_length': get_length_bucket(record['prompt_tokens'])
+                }
+    return list(records.values())
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if len(values) > 0 else None
+
+
+def _ratio(numerators: List[Optional[float]], denominators: List[Optional[float]]) -> Optional[float]:
+    # Only over the records where both values are known.
+    pairs: List[Tuple[float, float]] = [
+        (numerator, denominator) for numerator, denominator in zip(numerators, denominators)
+        if numerator is not None and denominator is not None
+    ]
+    denominator: float = sum(denominator for _, denominator in pairs)
+    return sum(numerator for numerator, _ in pairs) / denominator if denominator > 0 else None
+
+
+def summarize_profiles(records: List[Dict]) -> Dict:
+    """
+    Throughput, mean timings (in milliseconds) and peak memory of the records. Responses from the response cache are
+    counted, but not used for the timings and throughput.
+    """
+    generated: List[Dict] = [record for record in records if not record.get('cached')]
+
+    def values(key: str) -> List[Optional[float]]:
+        return [record.get(key) for record in generated]
+
+    def milliseconds(key: str) -> Optional[float]:
+        seconds: Optional[float] = _mean(values(key))
+        return seconds * 1000 if seconds is not None else None
+
+    generation_seconds: List[Optional[float]] = [
+        record['prefill_seconds'] + record['decode_seconds']
+        if record.get('prefill_seconds') is not None and record.get('decode_seconds') is not None else None
+        for record in generated
+    ]
+    peak_memory: List[int] = [
+        record['peak_memory_bytes'] if record.get('peak_memory_bytes') is not None else record['peak_rss_bytes']
+        for record in generated
+        if record.get('peak_memory_bytes') is not None or record.get('peak_rss_bytes') is not None
+    ]
+    total_seconds: float = sum(record['total_seconds'] for record in generated)
+    return {
+        'instances': len(records),
+        'from_cache': len(records) - len(generated),
+        'avg_batch_size': _mean(values('batch_size')),
+        'avg_prompt_tokens': _mean(values('prompt_tokens')),
+        'avg_output_tokens': _mean(values('output_tokens')),
+        'prefill_tok/s': _ratio(values('prompt_tokens'), values('prefill_seconds')),
+        'output_tok/s': _ratio(values('output_tokens'), generation_seconds),
+        'instances/s': len(generated) / total_seconds if total_seconds > 0 else None,
+        'build_ms': milliseconds('prompt_build_seconds'),
+        'tokenize_ms': milliseconds('tokenization_seconds'),
+        'prefill_ms': milliseconds('prefill_seconds'),
+        'decode_ms': milliseconds('decode_seconds'),
+        'parse_ms': milliseconds('parse_seconds'),
+        'total_ms': milliseconds('total_seconds'),
+        'peak_mem_gb': max(peak_memory) / 2 ** 30 if len(peak_memory) > 0 else None
+    }
+
+
+def _get_sort_key(value) -> Tuple[int, float, str]:
+    # Numbers and length buckets in numerical order, everything else alphabetically.
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0, value, ''
+    if isinstance(value, str) and value.split('-')[0].isdigit():
+        return 0, int(value.split('-')[0]), value
+    return 1, 0, str(value)
+
+
+def get_profile_report(sources: List[str], group_by: List[str]) -> List[Dict]:
+    """
+    Summarizes the profiles (*.profile.jsonl) of all runs in the sources per group (see summarize_profiles).
+    """
+    for column in group_by:
+        if column not in PROFILE_COLUMNS:
+            raise ValueError(f'Cannot group by "{column}", select from: {PROFILE_COLUMNS}')
+
+    groups: Dict[Tuple, List[Dict]] = dict()
+    for path in find_prediction_files(sources, suffix=PROFILE_SUFFIX):
+        for record in read_profiles(path):
+            groups.setdefault(tuple(record[column] for column in group_by), []).append(record)
+
+    rows: List[Dict] = []
+    for key in sorted(groups.keys(), key=lambda values: [_get_sort_key(value) for value in values]):
+        summary: Dict = summarize_profiles(groups[key])
+        rows.append({
+            **dict(zip(group_by, key)),
+            **{name: value if value is not None else '-' for name, value in summary.items()}
+        })
+    return rows
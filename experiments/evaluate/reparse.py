@@ -0,0 +1,74 @@
+import codecs
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from os import walk, replace, makedirs
+from os.path import join, isdir, dirname
+from typing import List, Dict, Optional, Tuple
+
+from experiments.evaluate.evaluate import evaluate_file
+from experiments.parsing.ouput_parser import OutputParser
+from experiments.parsing.parser_registry import get_output_parser
+from experiments.util.file_util import store_json
+
+PREDICTIONS_SUFFIX: str = '.predictions.jsonl'
+METRICS_SUFFIX: str = '.metrics.json'
+
+
+def find_prediction_files(sources: List[str], suffix: str = PREDICTIONS_SUFFIX) -> List[str]:
+    """
+    Returns all *.predictions.jsonl files (or files with another suffix). Each source is either such a file or a
+    directory that is searched recursively.
+    """
+    files: List[str] = []
+    for src in sources:
+        if isdir(src):
+            for directory, _, filenames in walk(src):
+                files.extend(join(directory, name) for name in filenames if name.endswith(suffix))
+        else:
+            files.append(src)
+    return sorted(files)
+
+
+def reparse_file(
+        src: str, parser_name: str, num_answer_options: int = 7, dest: Optional[str] = None
+) -> Tuple[str, Dict]:
+    """
+    Parses all stored responses of the predictions file again with the selected parser, rewrites "predicted_answer"
+    (the file is replaced once all lines are processed) and re-computes the metrics next to it. If dest is set, the
+    re-parsed predictions are stored there instead (src is not changed).
+    Nothing is printed; the parsers' messages about unparsable responses are dropped.
+    """
+    parser: OutputParser = get_output_parser(parser_name, num_answer_options)
+    dest = dest or src
+    makedirs(dirname(dest) or '.', exist_ok=True)
+    tmp_path: str = f'{dest}.reparse-tmp'
+    with redirect_stdout(io.StringIO()):
+        with codecs.open(src, encoding='utf-8') as f_in, codecs.open(tmp_path, 'w', encoding='utf-8') as f_out:
+            for line in f_in:
+                if len(line.strip()) == 0:
+                    continue
+                prediction: Dict = json.loads(line)
+                prediction['predicted_answer'] = parser.select_answer(
+                    prediction['response'], prediction['options']
+                )['answered']
+                f_out.write(json.dumps(prediction) + '\n')
+        replace(tmp_path, dest)
+        metrics: Dict = evaluate_file(dest)
+    store_json(metrics, dest[:-len(PREDICTIONS_SUFFIX)] + METRICS_SUFFIX, pretty=True)
+    return dest, metrics
+
+
+def reparse_files(
+        sources: List[str], parser_name: str, num_processes: Optional[int] = None, num_answer_options: int = 7
+) -> Dict[str, Dict]:
+    """
+    Re-parses all predictions files (see reparse_file) in a process pool. Returns the new metrics per file.
+    """
+    files: List[str] = find_prediction_files(sources)
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        results = executor.map(
+            reparse_file, files, [parser_name] * len(files), [num_answer_options] * len(files)
+        )
+        return dict(results)
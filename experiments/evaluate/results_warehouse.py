@@ -0,0 +1,346 @@
+import json
+import re
+import sqlite3
+from os import makedirs, walk, stat, sep
+from os.path import join, exists, abspath, normpath
+from typing import Dict, List, Optional, Tuple, Iterable, Set
+
+from experiments.evaluate.evaluate import ANSWERABLE, get_adt
+from experiments.util.file_util import file_checksum, read_json
+
+_PREDICTIONS_FILE_PATTERN: re.Pattern = re.compile(r'^(?P<split>.+)\.seed-(?P<seed>\d+)\.predictions\.jsonl$')
+
+# Columns that can be used to group and filter predictions (whitelist, the names are inserted into the SQL).
+RUN_COLUMNS: List[str] = ['model', 'data_variant', 'template', 'split', 'seed']
+PREDICTION_COLUMNS: List[str] = ['answerable', 'category', 'num_documents', 'question_family_id']
+
+# Predictions are also counted per run and these columns, so that most slices need not scan all predictions.
+GROUP_COLUMNS: List[str] = ['answerable', 'category', 'num_documents']
+
+
+class ResultsWarehouse:
+    """
+    Indexes all runs in the results directory (./results/<model>/<variant>/<template>/<split>.seed-N.predictions.jsonl)
+    into a sqlite DB: one row per run with its overall metrics and one row per prediction with its correctness.
+
+    Indexing is incremental: files with the same modification time and size are skipped, files that were touched but
+    have the same checksum are not loaded again, and runs whose files were deleted are removed. Unfinished runs (with
+    a partial metrics file, i.e. interrupted or still running) are not indexed until they are finished.
+    """
+
+    def __init__(self, db_name: str = 'results.db', dir_name: str = './cache', results_dir: str = './results'):
+        if not exists(dir_name):
+            makedirs(dir_name, exist_ok=True)
+        self.results_dir: str = results_dir
+        self.conn = sqlite3.connect(join(dir_name, db_name), timeout=120)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE,
+                    model TEXT,
+                    data_variant TEXT,
+                    template TEXT,
+                    split TEXT,
+                    seed INTEGER,
+                    mtime_ns INTEGER,
+                    size INTEGER,
+                    checksum TEXT,
+                    metrics_mtime_ns INTEGER,
+                    metrics TEXT,
+                    num_instances INTEGER,
+                    parsed REAL,
+                    accuracy REAL,
+                    acc_answerable REAL,
+                    acc_unanswerable REAL,
+                    adt REAL
+                );
+                CREATE TABLE IF NOT EXISTS predictions (
+                    run_id INTEGER,
+                    instance_id TEXT,
+                    question_family_id TEXT,
+                    answerable TEXT,
+                    category TEXT,
+                    num_documents INTEGER,
+                    is_answerable INTEGER,
+                    gold INTEGER,
+                    predicted INTEGER,
+                    parsed INTEGER,
+                    correct INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS prediction_groups (
+                    run_id INTEGER,
+                    answerable TEXT,
+                    category TEXT,
+                    num_documents INTEGER,
+                    is_answerable INTEGER,
+                    total INTEGER,
+                    parsed INTEGER,
+                    correct INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS predictions_run ON predictions (run_id);
+                CREATE INDEX IF NOT EXISTS prediction_groups_run ON prediction_groups (run_id);
+                CREATE INDEX IF NOT EXISTS runs_setup ON runs (data_variant, split, model, template);
+            ''')
+
+    def find_prediction_files(self) -> Iterable[str]:
+        for directory, _, filenames in walk(self.results_dir):
+            for name in filenames:
+                if _PREDICTIONS_FILE_PATTERN.match(name):
+                    yield join(directory, name)
+
+    def index(self) -> Dict[str, int]:
+        """
+        Brings the DB up to date with the results directory. Returns the number of added, updated, unchanged,
+        unfinished and removed runs.
+        """
+        stats: Dict[str, int] = {'added': 0, 'updated': 0, 'unchanged': 0, 'unfinished': 0, 'removed': 0}
+        found: Set[str] = set()
+        for path in self.find_prediction_files():
+            path = abspath(path)
+            found.add(path)
+            stats[self.index_file(path)] += 1
+
+        for run_id, path in self.conn.execute('SELECT run_id, path FROM runs').fetchall():
+            if path not in found and path.startswith(abspath(self.results_dir)):
+                self._remove_run(run_id)
+                stats['removed'] += 1
+        return stats
+
+    def index_file(self, path: str) -> str:
+        file_stat = stat(path)
+        metrics_path: str = get_metrics_path(path)
+        metrics_mtime_ns: Optional[int] = stat(metrics_path).st_mtime_ns if exists(metrics_path) else None
+
+        row: Optional[Tuple] = self.conn.execute(
+            'SELECT run_id, mtime_ns, size, checksum, metrics_mtime_ns FROM runs WHERE path = ?', (path,)
+        ).fetchone()
+        if not is_finished_run(path):
+            # Kept out of the leaderboard and slices until the final metrics are stored.
+            if row is not None:
+                self._remove_run(row[0])
+            return 'unfinished'
+        if row is not None and row[1:3] == (file_stat.st_mtime_ns, file_stat.st_size) and row[4] == metrics_mtime_ns:
+            return 'unchanged'
+
+        checksum: str = file_checksum(path)
+        if row is not None and row[3] == checksum:
+            # Only touched (or the metrics changed): keep the predictions.
+            with self.conn:
+                self.conn.execute(
+                    'UPDATE runs SET mtime_ns = ?, size = ?, metrics_mtime_ns = ?, metrics = ? WHERE run_id = ?',
+                    (file_stat.st_mtime_ns, file_stat.st_size, metrics_mtime_ns, read_metrics(metrics_path), row[0])
+                )
+            return 'unchanged'
+
+        setup: Dict = parse_run_path(path)
+        predictions: List[Tuple] = list(read_prediction_rows(path))
+        summary: Dict = summarize(predictions)
+        with self.conn:
+            if row is not None:
+                self._remove_run(row[0], commit=False)
+            cursor = self.conn.execute('''
+                INSERT INTO runs (
+                    path, model, data_variant, template, split, seed, mtime_ns, size, checksum, metrics_mtime_ns,
+                    metrics, num_instances, parsed, accuracy, acc_answerable, acc_unanswerable, adt
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                path, setup['model'], setup['data_variant'], setup['template'], setup['split'], setup['seed'],
+                file_stat.st_mtime_ns, file_stat.st_size, checksum, metrics_mtime_ns, read_metrics(metrics_path),
+                summary['num_instances'], summary['parsed'], summary['accuracy'], summary['acc_answerable'],
+                summary['acc_unanswerable'], summary['adt']
+            ))
+            self.conn.executemany('''
+                INSERT INTO predictions (
+                    run_id, instance_id, question_family_id, answerable, category, num_documents, is_answerable, gold,
+                    predicted, parsed, correct
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(cursor.lastrowid, *prediction) for prediction in predictions])
+            self.conn.executemany('''
+                INSERT INTO prediction_groups (
+                    run_id, answerable, category, num_documents, is_answerable, total, parsed, correct
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(cursor.lastrowid, *group, *counts) for group, counts in count_groups(predictions).items()])
+        return 'added' if row is None else 'updated'
+
+    def _remove_run(self, run_id: int, commit: bool = True):
+        def remove():
+            self.conn.execute('DELETE FROM predictions WHERE run_id = ?', (run_id,))
+            self.conn.execute('DELETE FROM prediction_groups WHERE run_id = ?', (run_id,))
+            self.conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+        if commit:
+            with self.conn:
+                remove()
+        else:
+            remove()
+
+    def get_leaderboard(self, filters: Optional[Dict] = None, order_by: str = 'adt') -> List[Dict]:
+        """
+        Metrics per model, data variant, template and split (averaged over the seeds), best first.
+        """
+        where, values = get_where_clause(filters, RUN_COLUMNS)
+        if order_by not in {'adt', 'accuracy', 'parsed'}:
+            raise ValueError(order_by)
+        cursor = self.conn.execute(f'''
+            SELECT model, data_variant, template, split, COUNT(*) AS num_seeds, SUM(num_instances) AS num_instances,
+                AVG(adt) AS adt, MIN(adt) AS adt_min, MAX(adt) AS adt_max, AVG(acc_answerable) AS acc_answerable,
+                AVG(acc_unanswerable) AS acc_unanswerable, AVG(accuracy) AS accuracy, AVG(parsed) AS parsed
+            FROM runs {where}
+            GROUP BY model, data_variant, template, split
+            ORDER BY {order_by} DESC
+        ''', values)
+        return to_dicts(cursor)
+
+    def get_slices(self, group_by: List[str], filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        Metrics of all predictions grouped by any of RUN_COLUMNS and PREDICTION_COLUMNS, e.g. the accuracy per
+        model and num_documents for the context length ablation.
+        """
+        for column in group_by:
+            if column not in RUN_COLUMNS + PREDICTION_COLUMNS:
+                raise ValueError(f'Cannot group by "{column}". Select from: {RUN_COLUMNS + PREDICTION_COLUMNS}')
+        where, values = get_where_clause(filters, RUN_COLUMNS + PREDICTION_COLUMNS, table_prefix=True)
+        columns: str = ', '.join(get_column(column) for column in group_by)
+
+        # Use the counts per group unless single predictions are needed (e.g. for question_family_id).
+        used_columns: Set[str] = set(group_by) | set((filters or dict()).keys())
+        if used_columns <= set(RUN_COLUMNS + GROUP_COLUMNS):
+            source, total, parsed, correct = 'prediction_groups', 'p.total', 'p.parsed', 'p.correct'
+        else:
+            source, total, parsed, correct = 'predictions', '1', 'p.parsed', 'p.correct'
+        cursor = self.conn.execute(f'''
+            SELECT {columns}, SUM({total}) AS total,
+                SUM({correct}) * 1.0 / SUM({total}) AS accuracy,
+                SUM({parsed}) * 1.0 / SUM({total}) AS parsed,
+                SUM({correct} * p.is_answerable) * 1.0 / NULLIF(SUM({total} * p.is_answerable), 0) AS acc_answerable,
+                SUM({correct} * (1 - p.is_answerable)) * 1.0 / NULLIF(SUM({total} * (1 - p.is_answerable)), 0)
+                    AS acc_unanswerable
+            FROM {source} p JOIN runs r ON p.run_id = r.run_id {where}
+            GROUP BY {columns}
+            ORDER BY {columns}
+        ''', values)
+        slices: List[Dict] = to_dicts(cursor)
+        for values in slices:
+            values['adt'] = None
+            if values['acc_answerable'] is not None and values['acc_unanswerable'] is not None:
+                values['adt'] = float(get_adt(values['acc_answerable'], values['acc_unanswerable']))
+        return slices
+
+    def __del__(self):
+        self.conn.close()
+
+
+def get_metrics_path(predictions_path: str) -> str:
+    return predictions_path[:-len('.predictions.jsonl')] + '.metrics.json'
+
+
+def get_partial_metrics_path(predictions_path: str) -> str:
+    return predictions_path[:-len('.predictions.jsonl')] + '.metrics.partial.json'
+
+
+def is_finished_run(predictions_path: str) -> bool:
+    # Same as load_finished_metrics(): the final metrics are stored and there are no partial metrics.
+    return exists(get_metrics_path(predictions_path)) and not exists(get_partial_metrics_path(predictions_path))
+
+
+def read_metrics(metrics_path: str) -> Optional[str]:
+    return json.dumps(read_json(metrics_path)) if exists(metrics_path) else None
+
+
+def parse_run_path(path: str) -> Dict:
+    """
+    Reads the setup of a run from its path (<model>/<variant>/<template>/<split>.seed-N.predictions.jsonl).
+    """
+    model, data_variant, template, file_name = normpath(path).split(sep)[-4:]
+    match: re.Match = _PREDICTIONS_FILE_PATTERN.match(file_name)
+    return {
+        'model': model,
+        'data_variant': data_variant,
+        'template': template,
+        'split': match.group('split'),
+        'seed': int(match.group('seed'))
+    }
+
+
+def read_prediction_rows(path: str) -> Iterable[Tuple]:
+    with open(path, encoding='utf-8') as f_in:
+        for line in f_in:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                prediction: Dict = json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith('\n'):
+                    raise
+                # Incomplete last line (the run was killed while writing it).
+                break
+            predicted: int = prediction['predicted_answer']
+            gold: int = prediction['gold_answer_idx']
+            yield (
+                prediction['instance_id'], prediction.get('question_family_id'), prediction['answerable'],
+                prediction['category'], prediction.get('num_documents'), int(prediction['answerable'] == ANSWERABLE),
+                gold, predicted, int(predicted >= 0), int(predicted == gold)
+            )
+
+
+def summarize(predictions: List[Tuple]) -> Dict:
+    # Same metrics as in evaluate_file() ("acc_all" and "adt_score")
+    num_instances: int = len(predictions)
+    answerable: List[int] = [prediction[-1] for prediction in predictions if prediction[5] == 1]
+    unanswerable: List[int] = [prediction[-1] for prediction in predictions if prediction[5] == 0]
+    acc_answerable: Optional[float] = sum(answerable) / len(answerable) if answerable else None
+    acc_unanswerable: Optional[float] = sum(unanswerable) / len(unanswerable) if unanswerable else None
+    return {
+        'num_instances': num_instances,
+        'parsed': sum(prediction[-2] for prediction in predictions) / num_instances if num_instances else None,
+        'accuracy': sum(prediction[-1] for prediction in predictions) / num_instances if num_instances else None,
+        'acc_answerable': acc_answerable,
+        'acc_unanswerable': acc_unanswerable,
+        'adt': float(get_adt(acc_answerable, acc_unanswerable))
+        if acc_answerable is not None and acc_unanswerable is not None else None
+    }
+
+
+def count_groups(predictions: List[Tuple]) -> Dict[Tuple, List[int]]:
+    """
+    (answerable, category, num_documents, is_answerable) -> [total, parsed, correct]
+    """
+    groups: Dict[Tuple, List[int]] = dict()
+    for prediction in predictions:
+        counts: List[int] = groups.setdefault((*prediction[2:6],), [0, 0, 0])
+        counts[0] += 1
+        counts[1] += prediction[-2]
+        counts[2] += prediction[-1]
+    return groups
+
+
+def get_column(column: str) -> str:
+    return f'r.{column}' if column in RUN_COLUMNS else f'p.{column}'
+
+
+def get_where_clause(
+        filters: Optional[Dict], allowed_columns: List[str], table_prefix: bool = False
+) -> Tuple[str, List]:
+    """
+    :param filters:     Column -> required value (or list of allowed values).
+    """
+    conditions: List[str] = []
+    values: List = []
+    for column, value in (filters or dict()).items():
+        if column not in allowed_columns:
+            raise ValueError(f'Cannot filter by "{column}". Select from: {allowed_columns}')
+        name: str = get_column(column) if table_prefix else column
+        allowed: List = value if isinstance(value, (list, tuple, set)) else [value]
+        conditions.append(f'{name} IN ({",".join("?" * len(allowed))})')
+        values.extend(allowed)
+    return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), values
+
+
+def to_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    names: List[str] = [description[0] for description in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
@@ -0,0 +1,34 @@
+from typing import List
+
+import torch
+from transformers import StoppingCriteria, PreTrainedTokenizer
+
+from experiments.parsing.ouput_parser import OutputParser
+
+
+class AnswerStoppingCriteria(StoppingCriteria):
+    """
+    Stops the generation of each sequence as soon as the output parser can extract a final answer from it.
+    Sequences that are finished are not decoded again. The generation of a batch ends once all sequences are finished.
+    """
+
+    def __init__(self, parser: OutputParser, tokenizer: PreTrainedTokenizer, prompt_length: int, batch_size: int):
+        """
+        :param parser:          Output parser that decides whether a (partial) response contains a final answer.
+        :param tokenizer:       Tokenizer to decode the generated tokens.
+        :param prompt_length:   Number of (padded) prompt tokens, i.e. the position of the first generated token.
+        :param batch_size:      Number of sequences in the batch.
+        """
+        self.parser: OutputParser = parser
+        self.tokenizer: PreTrainedTokenizer = tokenizer
+        self.prompt_length: int = prompt_length
+        self.finished: List[bool] = [False] * batch_size
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        unfinished: List[int] = [i for i, is_finished in enumerate(self.finished) if not is_finished]
+        responses: List[str] = self.tokenizer.batch_decode(
+            input_ids[unfinished, self.prompt_length:], skip_special_tokens=True
+        )
+        for i, response in zip(unfinished, responses):
+            self.finished[i] = self.parser.has_final_answer(response)
+        return torch.tensor(self.finished, dtype=torch.bool, device=input_ids.device)
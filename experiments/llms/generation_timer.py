@@ -0,0 +1,34 @@
+import time
+from typing import Optional
+
+import torch
+from transformers import StoppingCriteria
+
+
+class FirstTokenTimer(StoppingCriteria):
+    """
+    Never stops the generation, only records when the first token was generated. Stopping criteria are checked after
+    every generation step, i.e. the first check marks the end of the prefill (the forward pass over the prompt).
+    """
+
+    def __init__(self):
+        self.first_token_time: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+def reset_peak_memory() -> None:
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+
+def get_peak_memory() -> Optional[int]:
+    """
+    Returns the peak GPU memory (in bytes) since the last reset_peak_memory() (None without a GPU).
+    """
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated()
+    return None
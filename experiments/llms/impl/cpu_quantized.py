@@ -0,0 +1,51 @@
+from typing import Dict, Optional, TYPE_CHECKING
+
+from experiments.llms.impl.hf_chat_llm import HuggingFaceChatLLM
+
+if TYPE_CHECKING:
+    from transformers import AutoModelForCausalLM
+
+
+class QuantizedCPUChatLLM(HuggingFaceChatLLM):
+    """
+    Runs a chat model on the CPU without a GPU-specific attention implementation. The weights of all linear layers are
+    quantized to int8 after loading (dynamic quantization: activations are quantized on the fly), which roughly
+    quarters the memory of these layers and speeds up the matrix multiplications. Batches (including the prefill) are
+    processed with num_threads threads. A draft model is loaded (and quantized) in the same way.
+    """
+
+    def __init__(
+            self, path_or_name: str, temperature: float = 0.0, max_new_tokens: int = 3000,
+            do_sample=False, top_k=None, top_p=None,
+            name: Optional[str] = None, trust_remote_code: bool = False,
+            quantize: bool = True, num_threads: Optional[int] = None, share_prefix: bool = False,
+            draft_model_path: Optional[str] = None
+    ):
+        """
+        :param quantize:        Quantize the linear layers to int8 (otherwise the model runs in float32).
+        :param num_threads:     Number of threads used by torch (defaults to the number of physical cores).
+        """
+        super().__init__(
+            path_or_name, temperature=temperature, max_new_tokens=max_new_tokens,
+            do_sample=do_sample, top_k=top_k, top_p=top_p,
+            # The responses differ from the ones of the full-precision model, i.e. they must be cached separately.
+            name=name or f'{path_or_name}-cpu-{"int8" if quantize else "fp32"}',
+            trust_remote_code=trust_remote_code,
+            device_map=None, attn_implementation='sdpa', torch_dtype='float32', share_prefix=share_prefix,
+            draft_model_path=draft_model_path
+        )
+        self.quantize: bool = quantize
+        self.num_threads: Optional[int] = num_threads
+
+    def load_pretrained(self, path_or_name: str) -> 'AutoModelForCausalLM':
+        import torch
+        if self.num_threads is not None:
+            torch.set_num_threads(self.num_threads)
+        model: AutoModelForCausalLM = super().load_pretrained(path_or_name)
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def get_generation_args(self) -> Dict:
+        return {**super().get_generation_args(), 'quantization': 'int8' if self.quantize else None}
@@ -0,0 +1,303 @@
+import time
+from typing import Dict, Optional, List, Tuple, Union, TYPE_CHECKING
+
+from experiments.llms.llm import LLM
+
+# torch and transformers are imported on first use, i.e. not at all if all responses are cached.
+if TYPE_CHECKING:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteriaList
+
+
+def get_common_prefix_length(a: List[int], b: List[int]) -> int:
+    length: int = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class HuggingFaceChatLLM(LLM):
+    """
+    Base class for chat models that run in-process via transformers. Prompts are wrapped as a single user message
+    and formatted with the chat template of the model.
+
+    With share_prefix, prompts are generated one at a time and the KV cache of the previous prompt is kept: only the
+    tokens after the prefix shared with the previous prompt are computed (e.g. the question after the same evidence).
+
+    With a draft model (a small model of the same family, i.e. with the same tokenizer), prompts are generated one at a
+    time with assisted (speculative) decoding: the draft proposes several tokens, which the model verifies in a single
+    forward pass. Under greedy decoding, the response is the one the model generates on its own.
+    """
+
+    def __init__(
+            self, path_or_name: str, temperature: float = 0.0, max_new_tokens: int = 3000,
+            do_sample=False, top_k=None, top_p=None,
+            name: Optional[str] = None, trust_remote_code: bool = False,
+            device_map: Optional[str] = "auto", attn_implementation: Optional[str] = "flash_attention_2",
+            torch_dtype: Union[str, 'torch.dtype'] = "auto", share_prefix: bool = False,
+            draft_model_path: Optional[str] = None
+    ):
+        super().__init__(temperature, max_new_tokens)
+        if share_prefix and draft_model_path is not None:
+            raise ValueError('A draft model cannot be combined with share_prefix!')
+        self.name: str = name or path_or_name
+        self.do_sample = do_sample
+        self.top_k = top_k
+        self.top_p = top_p
+
+        self.path_or_name: str = path_or_name
+        self.trust_remote_code: bool = trust_remote_code
+        self.device_map: Optional[str] = device_map
+        self.attn_implementation: Optional[str] = attn_implementation
+        self.torch_dtype: Union[str, torch.dtype] = torch_dtype
+
+        # Model and tokenizer are loaded on first use (e.g. not at all if all responses are cached).
+        self._model: Optional[AutoModelForCausalLM] = None
+        self._tokenizer: Optional[AutoTokenizer] = None
+
+        self.share_prefix: bool = share_prefix
+        # Prompt tokens whose keys and values are in the prefix cache (only used with share_prefix).
+        self._prefix_ids: List[int] = []
+        self._prefix_cache: Optional[DynamicCache] = None
+
+        # Not part of the generation args: under greedy decoding, the responses are the same with and without it.
+        self.draft_model_path: Optional[str] = draft_model_path
+        self._draft_model: Optional[AutoModelForCausalLM] = None
+
+        self.generation_args = {
+            "max_new_tokens": self.max_new_tokens,
+            "temperature": self.temperature,
+            "do_sample": self.do_sample,
+            "top_k": self.top_k,
+            'top_p': self.top_p
+        }
+
+    @property
+    def model(self) -> 'AutoModelForCausalLM':
+        if self._model is None:
+            self._model = self.load_model()
+        return self._model
+
+    @property
+    def draft_model(self) -> Optional['AutoModelForCausalLM']:
+        if self._draft_model is None and self.draft_model_path is not None:
+            self._draft_model = self.load_pretrained(self.draft_model_path)
+        return self._draft_model
+
+    def load_model(self) -> 'AutoModelForCausalLM':
+        return self.load_pretrained(self.path_or_name)
+
+    def load_pretrained(self, path_or_name: str) -> 'AutoModelForCausalLM':
+        from transformers import AutoModelForCausalLM
+        return AutoModelForCausalLM.from_pretrained(
+            path_or_name,
+            device_map=self.device_map,
+            torch_dtype=self.torch_dtype,
+            trust_remote_code=self.trust_remote_code,
+            attn_implementation=self.attn_implementation
+        )
+
+    @property
+    def tokenizer(self) -> 'AutoTokenizer':
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.path_or_name, trust_remote_code=self.trust_remote_code)
+
+            # Decoder-only models must be padded on the left for batched generation.
+            self._tokenizer.padding_side = 'left'
+            if self._tokenizer.pad_token is None:
+                self._tokenizer.pad_token = self._tokenizer.eos_token
+        return self._tokenizer
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_generation_args(self) -> Dict:
+        return {**super().get_generation_args(), **self.generation_args}
+
+    def generate(self, instance: Dict) -> str:
+        return self.generate_batch([instance])[0]
+
+    def get_input_ids(self, instances: List[Dict]) -> List[List[int]]:
+        return self.tokenizer.apply_chat_template(
+            [self.get_messages(instance) for instance in instances],
+            add_generation_prompt=True,
+            tokenize=True
+        )
+
+    def generate_batch(self, instances: List[Dict]) -> List[str]:
+        from experiments.llms.generation_timer import reset_peak_memory, get_peak_memory
+
+        start: float = time.perf_counter()
+        input_ids: List[List[int]] = self.get_input_ids(instances)
+        tokenization_seconds: float = time.perf_counter() - start
+
+        reset_peak_memory()
+        if self.share_prefix:
+            results: List[Tuple[str, Dict]] = [self.generate_with_shared_prefix(ids) for ids in input_ids]
+        elif self.draft_model is not None:
+            results = [self.generate_with_draft_model(ids) for ids in input_ids]
+        else:
+            results = self.generate_padded(input_ids)
+
+        peak_memory: Optional[int] = get_peak_memory()
+        self.last_profile = [{
+            **profile,
+            'tokenization_seconds': tokenization_seconds / len(instances),
+            'prompt_tokens': len(ids),
+            'batch_size': len(instances),
+            'peak_memory_bytes': peak_memory
+        } for (_, profile), ids in zip(results, input_ids)]
+        return [response for response, _ in results]
+
+    def generate_padded(self, input_ids: List[List[int]]) -> List[Tuple[str, Dict]]:
+        from transformers import StoppingCriteriaList
+        from experiments.llms.answer_stopping_criteria import AnswerStoppingCriteria
+
+        inputs = self.tokenizer.pad({'input_ids': input_ids}, padding=True, return_tensors='pt').to(self.model.device)
+
+        stopping_criteria: StoppingCriteriaList = StoppingCriteriaList()
+        if self.answer_parser is not None:
+            stopping_criteria.append(AnswerStoppingCriteria(
+                self.answer_parser, self.tokenizer, inputs['input_ids'].shape[1], len(input_ids)
+            ))
+
+        outputs, timings = self.generate_with_timer(stopping_criteria, **inputs)
+
+        # Only decode the generated tokens (all prompts end at the same position because of the left padding).
+        output_ids = outputs[:, inputs['input_ids'].shape[1]:]
+        responses: List[str] = self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+        # The time of the batch is shared equally by its instances.
+        timings = {name: seconds / len(input_ids) for name, seconds in timings.items()}
+        return [
+            (response, {**timings, 'output_tokens': num_tokens})
+            for response, num_tokens in zip(responses, self.count_output_tokens(output_ids))
+        ]
+
+    def generate_with_timer(self, stopping_criteria: 'StoppingCriteriaList', **kwargs) -> Tuple['torch.Tensor', Dict]:
+        """
+        Runs generate() and measures the prefill (until the first generated token) and the decoding of the rest.
+        """
+        import torch
+        from transformers import StoppingCriteriaList
+        from experiments.llms.generation_timer import FirstTokenTimer
+
+        timer: FirstTokenTimer = FirstTokenTimer()
+        start: float = time.perf_counter()
+        with torch.no_grad():
+            outputs = self.model.generate(
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([*stopping_criteria, timer]),
+                **self.generation_args,
+                **kwargs
+            )
+        end: float = time.perf_counter()
+        first_token_time: float = timer.first_token_time or end
+        return outputs, {'prefill_seconds': first_token_time - start, 'decode_seconds': end - first_token_time}
+
+    def count_output_tokens(self, output_ids: 'torch.Tensor') -> List[int]:
+        # Finished sequences of a batch are filled up with padding tokens.
+        return (output_ids != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+
+    def score_options(self, instances: List[Dict], answer_prefix: str = 'Answer: [') -> List[List[float]]:
+        import torch
+
+        prefix_ids: List[int] = self.tokenizer.encode(answer_prefix, add_special_tokens=False)
+        input_ids: List[List[int]] = [ids + prefix_ids for ids in self.get_input_ids(instances)]
+        inputs = self.tokenizer.pad({'input_ids': input_ids}, padding=True, return_tensors='pt').to(self.model.device)
+
+        num_options: int = max(len(instance['options']) for instance in instances)
+        label_ids: List[int] = [self.get_option_label_id(i) for i in range(num_options)]
+
+        with torch.no_grad():
+            # Only project the last position onto the vocabulary instead of computing logits for the full prompt.
+            hidden_states = self.model.base_model(**inputs).last_hidden_state[:, -1, :]
+            logits = self.model.get_output_embeddings()(hidden_states)
+
+        scores: List[List[float]] = []
+        for i, instance in enumerate(instances):
+            option_logits = logits[i, label_ids[:len(instance['options'])]].float()
+            scores.append(torch.log_softmax(option_logits, dim=-1).tolist())
+        return scores
+
+    def get_prefix_cache(self, prefix_ids: List[int]) -> 'DynamicCache':
+        """
+        Returns the KV cache of the prefix_ids. The cache of the previous prefix is cropped to the tokens it shares with
+        the new prefix, only the remaining tokens are computed.
+        """
+        import torch
+        from transformers import DynamicCache
+
+        if self._prefix_cache is None:
+            self._prefix_cache = DynamicCache()
+            self._prefix_ids = []
+        num_shared: int = get_common_prefix_length(self._prefix_ids, prefix_ids)
+        self._prefix_cache.crop(num_shared)
+        self._prefix_ids = prefix_ids[:num_shared]
+        if num_shared < len(prefix_ids):
+            with torch.no_grad():
+                # Only the keys and values are needed, not the logits of the prefix.
+                self.model.base_model(
+                    input_ids=torch.tensor([prefix_ids[num_shared:]], device=self.model.device),
+                    past_key_values=self._prefix_cache,
+                    use_cache=True
+                )
+            self._prefix_ids = prefix_ids
+        return self._prefix_cache
+
+    def generate_with_shared_prefix(self, input_ids: List[int]) -> Tuple[str, Dict]:
+        import torch
+        from transformers import StoppingCriteriaList
+        from experiments.llms.answer_stopping_criteria import AnswerStoppingCriteria
+
+        # The last prompt token is computed by generate() to get the logits of the first generated token.
+        start: float = time.perf_counter()
+        prefix_cache: DynamicCache = self.get_prefix_cache(input_ids[:-1])
+        prefix_seconds: float = time.perf_counter() - start
+
+        stopping_criteria: StoppingCriteriaList = StoppingCriteriaList()
+        if self.answer_parser is not None:
+            stopping_criteria.append(AnswerStoppingCriteria(self.answer_parser, self.tokenizer, len(input_ids), 1))
+
+        try:
+            outputs, timings = self.generate_with_timer(
+                stopping_criteria,
+                input_ids=torch.tensor([input_ids], device=self.model.device),
+                attention_mask=torch.ones((1, len(input_ids)), dtype=torch.long, device=self.model.device),
+                past_key_values=prefix_cache
+            )
+        finally:
+            # generate() appended the last prompt token and the response to the cache.
+            prefix_cache.crop(len(input_ids) - 1)
+        timings['prefill_seconds'] += prefix_seconds
+        output_ids = outputs[:, len(input_ids):]
+        response: str = self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+        return response, {**timings, 'output_tokens': self.count_output_tokens(output_ids)[0]}
+
+    def generate_with_draft_model(self, input_ids: List[int]) -> Tuple[str, Dict]:
+        import torch
+        from transformers import StoppingCriteriaList
+        from experiments.llms.answer_stopping_criteria import AnswerStoppingCriteria
+
+        stopping_criteria: StoppingCriteriaList = StoppingCriteriaList()
+        if self.answer_parser is not None:
+            stopping_criteria.append(AnswerStoppingCriteria(self.answer_parser, self.tokenizer, len(input_ids), 1))
+
+        # Assisted generation only supports a single prompt (no padding).
+        outputs, timings = self.generate_with_timer(
+            stopping_criteria,
+            input_ids=torch.tensor([input_ids], device=self.model.device),
+            attention_mask=torch.ones((1, len(input_ids)), dtype=torch.long, device=self.model.device),
+            assistant_model=self.draft_model
+        )
+        output_ids = outputs[:, len(input_ids):]
+        response: str = self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+        return response, {**timings, 'output_tokens': self.count_output_tokens(output_ids)[0]}
+
+    def get_option_label_id(self, option_idx: int) -> int:
+        label_ids: List[int] = self.tokenizer.encode(str(option_idx + 1), add_special_tokens=False)
+        if len(label_ids) != 1:
+            raise ValueError(f'The option label "{option_idx + 1}" is not a single token: {label_ids}')
+        return label_ids[0]
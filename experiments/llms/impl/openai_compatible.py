@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, SplitResult
+
+from experiments.llms.llm import LLM
+
+
+class HTTPConnectionPool:
+    """
+    Thread-safe pool of keep-alive connections to a single server. At most max_connections requests are in flight at
+    the same time; idle connections are reused instead of opening a new connection per request.
+    """
+
+    def __init__(self, base_url: str, max_connections: int, timeout: float):
+        url: SplitResult = urlsplit(base_url)
+        self.connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+        self.host: str = url.hostname
+        self.port: Optional[int] = url.port
+        self.path_prefix: str = url.path.rstrip('/')
+        self.timeout: float = timeout
+
+        self.idle_connections: queue.LifoQueue = queue.LifoQueue()
+        self.in_flight: threading.BoundedSemaphore = threading.BoundedSemaphore(max_connections)
+        self.num_opened: int = 0
+
+    def _get_connection(self) -> HTTPConnection:
+        try:
+            return self.idle_connections.get_nowait()
+        except queue.Empty:
+            self.num_opened += 1
+            return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        """
+        Sends the request and returns the status and the body of the response. Raises HTTPException or OSError if the
+        connection fails (the connection is discarded in this case).
+        """
+        with self.in_flight:
+            connection: HTTPConnection = self._get_connection()
+            try:
+                connection.request(method, self.path_prefix + path, body=body, headers=headers)
+                response = connection.getresponse()
+                data: bytes = response.read()
+            except (HTTPException, OSError):
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.idle_connections.put(connection)
+            return response.status, data
+
+    def close(self) -> None:
+        while not self.idle_connections.empty():
+            self.idle_connections.get_nowait().close()
+
+
+class OpenAICompatibleLLM(LLM):
+    """
+    Queries a server with an OpenAI-compatible chat completions API (e.g. vLLM, llama.cpp server or the OpenAI API).
+    Batches are sent as concurrent requests (at most max_concurrency in flight) over pooled keep-alive connections,
+    the responses are returned in the order of the instances.
+    """
+
+    # Status codes after which the request is sent again.
+    RETRY_STATUS: Tuple[int, ...] = (408, 429, 500, 502, 503, 504)
+
+    def __init__(
+            self, model: str, base_url: str = 'http://localhost:8000/v1', api_key: Optional[str] = None,
+            temperature: float = 0.0, max_new_tokens: int = 3000, max_concurrency: int = 16, timeout: float = 600.0,
+            max_retries: int = 5, retry_delay: float = 1.0, name: Optional[str] = None
+    ):
+        """
+        :param model:               Model name as expected by the server.
+        :param base_url:            URL of the API (including "/v1").
+        :param api_key:             Sent as bearer token. Defaults to the environment variable OPENAI_API_KEY (if set).
+        :param max_concurrency:     Maximum number of requests that are processed by the server at the same time.
+        :param max_retries:         Number of retries of failed requests (connection errors, RETRY_STATUS).
+        :param retry_delay:         Seconds to wait before the first retry (doubled for each further retry).
+        """
+        super().__init__(temperature, max_new_tokens)
+        self.model: str = model
+        self.name: str = name or model
+        self.base_url: str = base_url
+        self.max_concurrency: int = max_concurrency
+        self.max_retries: int = max_retries
+        self.retry_delay: float = retry_delay
+
+        self.headers: Dict[str, str] = {'Content-Type': 'application/json'}
+        api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        if api_key:
+            self.headers['Authorization'] = f'Bearer {api_key}'
+
+        self.pool: HTTPConnectionPool = HTTPConnectionPool(base_url, max_concurrency, timeout)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        return self._executor
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_generation_args(self) -> Dict:
+        # The answer parser is not used (no early stopping), i.e. it does not influence the responses.
+        return {**super().get_generation_args(), 'answer_parser': None}
+
+    def get_request_body(self, instance: Dict) -> Dict:
+        return {
+            'model': self.model,
+            'messages': self.get_messages(instance),
+            'temperature': self.temperature,
+            'max_tokens': self.max_new_tokens
+        }
+
+    def generate(self, instance: Dict) -> str:
+        body: bytes = json.dumps(self.get_request_body(instance)).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            if attempt > 1:
+                # The first retry is immediate: a reused keep-alive connection may have been closed by the server.
+                time.sleep(self.retry_delay * 2 ** (attempt - 2))
+            try:
+                status, data = self.pool.request('POST', '/chat/completions', body, self.headers)
+            except (HTTPException, OSError) as e:
+                error: str = repr(e)
+                continue
+
+            if status == 200:
+                return self.get_content(json.loads(data))
+            error = f'{status}: {data.decode("utf-8", errors="replace")}'
+            if status not in OpenAICompatibleLLM.RETRY_STATUS:
+                raise ValueError(f'Request to {self.base_url} failed with {error}')
+        raise ConnectionError(f'Request to {self.base_url} failed after {self.max_retries} retries: {error}')
+
+    def get_content(self, response: Dict) -> str:
+        """
+        Returns the text of the response. If the content is missing or null (e.g. for refusals or tool calls), the
+        response is empty (i.e. no answer is selected).
+        """
+        if len(response.get('choices') or []) == 0:
+            raise ValueError(f'Response of {self.base_url} without choices: {json.dumps(response)}')
+        choice: Dict = response['choices'][0]
+        content: Optional[str] = (choice.get('message') or dict()).get('content')
+        if content is None:
+            print(f'WARNING: Response without content (finish_reason: {choice.get("finish_reason")}).')
+            return ''
+        return content
+
+    def generate_batch(self, instances: List[Dict]) -> List[str]:
+        return list(self.executor.map(self.generate, instances))
+
+    async def agenerate(self, instance: Dict) -> str:
+        # Own executor instead of the default one, whose number of threads depends on the number of CPUs.
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.generate, instance)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.pool.close()
@@ -1,8 +1,10 @@
+import asyncio
 import hashlib
 import json
 from typing import Dict, Optional, List
 
 from experiments.llms.llm_cache import LLMHashCache
+from experiments.parsing.ouput_parser import OutputParser
 
 
 def hash_messages(messages: List[Dict], system_prompt: Optional[str] = None) -> str:
@@ -22,8 +24,113 @@ class LLM:
         self.temperature: float = temperature
         self.max_new_tokens: int = max_new_tokens
 
+        # If set, backends that support it stop generating as soon as this parser can extract an answer.
+        self.answer_parser: Optional[OutputParser] = None
+
+        # Timings and token counts per instance of the last generate_batch() call (only set by backends that measure
+        # them), e.g. "prefill_seconds", "decode_seconds", "prompt_tokens" and "output_tokens".
+        self.last_profile: Optional[List[Dict]] = None
+
+    def set_answer_parser(self, parser: Optional[OutputParser]) -> None:
+        self.answer_parser = parser
+
     def generate(self, instance: Dict) -> str:
         raise NotImplementedError
 
+    def generate_batch(self, instances: List[Dict]) -> List[str]:
+        """
+        Generates one response per instance (in the same order). Backends that can process several prompts at once
+        should override this method.
+        """
+        return [self.generate(instance) for instance in instances]
+
+    async def agenerate(self, instance: Dict) -> str:
+        """
+        Generates the response without blocking the event loop (runs generate() in a thread by default). Backends with
+        non-blocking I/O should override this method.
+        """
+        return await asyncio.to_thread(self.generate, instance)
+
+    def score_options(self, instances: List[Dict], answer_prefix: str = 'Answer: [') -> List[List[float]]:
+        """
+        Scores the answer options of each instance without generating: the response is started with answer_prefix and
+        the log-probabilities of the option labels ("1", "2", ...) as the next token are returned (one per option).
+        """
+        raise NotImplementedError
+
     def get_name(self) -> str:
         raise NotImplementedError
+
+    def get_messages(self, instance: Dict) -> List[Dict]:
+        return [
+            {"role": "user", "content": instance['prompt']},
+        ]
+
+    def get_generation_args(self) -> Dict:
+        """
+        All arguments that influence the generated responses (used to identify cached responses).
+        """
+        return {
+            'temperature': self.temperature,
+            'max_new_tokens': self.max_new_tokens,
+            'answer_parser': type(self.answer_parser).__name__ if self.answer_parser is not None else None
+        }
+
+
+class CachedLLM(LLM):
+    """
+    Wraps an LLM and stores all generated responses in a persistent LLMHashCache. Responses are identified by the LLM
+    name, the generation arguments and the hash of the messages. The wrapped LLM is only called for cache misses, i.e.
+    backends that load their weights lazily never load them if all responses are cached.
+    """
+
+    def __init__(self, llm: LLM, cache: Optional[LLMHashCache] = None):
+        super().__init__(llm.temperature, llm.max_new_tokens)
+        self.llm: LLM = llm
+        self.cache: LLMHashCache = cache if cache is not None else LLMHashCache()
+
+    def set_answer_parser(self, parser: Optional[OutputParser]) -> None:
+        super().set_answer_parser(parser)
+        self.llm.set_answer_parser(parser)
+
+    def get_name(self) -> str:
+        return self.llm.get_name()
+
+    def get_messages(self, instance: Dict) -> List[Dict]:
+        return self.llm.get_messages(instance)
+
+    def get_generation_args(self) -> Dict:
+        return self.llm.get_generation_args()
+
+    def generate(self, instance: Dict) -> str:
+        return self.generate_batch([instance])[0]
+
+    def generate_batch(self, instances: List[Dict]) -> List[str]:
+        generation_args: str = json.dumps(self.get_generation_args(), sort_keys=True)
+        query_hashes: List[str] = [hash_messages(self.get_messages(instance)) for instance in instances]
+        results: Dict[str, str] = self.cache.get_results(query_hashes, self.get_name(), generation_args)
+
+        missing: List[int] = [i for i, query_hash in enumerate(query_hashes) if query_hash not in results]
+        self.last_profile = [{'cached': True} for _ in instances]
+        if len(missing) > 0:
+            responses: List[str] = self.llm.generate_batch([instances[i] for i in missing])
+            new_results: List = [(query_hashes[i], response) for i, response in zip(missing, responses)]
+            self.cache.add_results(new_results, self.get_name(), generation_args)
+            results.update(dict(new_results))
+            for i, profile in zip(missing, self.llm.last_profile or [dict() for _ in missing]):
+                self.last_profile[i] = {'cached': False, **profile}
+
+        return [results[query_hash] for query_hash in query_hashes]
+
+    async def agenerate(self, instance: Dict) -> str:
+        # The cache is only accessed from the event loop thread, only the wrapped LLM runs concurrently.
+        generation_args: str = json.dumps(self.get_generation_args(), sort_keys=True)
+        query_hash: str = hash_messages(self.get_messages(instance))
+        results: Dict[str, str] = self.cache.get_results([query_hash], self.get_name(), generation_args)
+        if query_hash not in results:
+            results[query_hash] = await self.llm.agenerate(instance)
+            self.cache.add_results([(query_hash, results[query_hash])], self.get_name(), generation_args)
+        return results[query_hash]
+
+    def score_options(self, instances: List[Dict], answer_prefix: str = 'Answer: [') -> List[List[float]]:
+        return self.llm.score_options(instances, answer_prefix)
@@ -0,0 +1,87 @@
+import sqlite3
+from os import makedirs
+from os.path import exists, join
+from typing import Dict, List, Tuple, Optional
+
+
+class LLMHashCache:
+    """
+    Stores LLM responses and makes them accessible via the hash of the messages, the LLM name and the generation
+    arguments. Uses a sqlite DB in WAL mode as a backend, so that several processes can read and write concurrently.
+    """
+
+    # Maximum number of parameters per SELECT (sqlite limits the number of host parameters)
+    MAX_BULK_SIZE: int = 500
+
+    def __init__(self, db_name: str = "experiment_cache.db", dir_name: str = './cache', timeout: float = 120.0):
+        """
+        :param db_name      Name of the resulting file
+        :param dir_name     Name of the directory
+        :param timeout      Seconds to wait for a lock held by another process
+        """
+        if not exists(dir_name):
+            makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(join(dir_name, db_name), timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_table()
+
+    def _create_table(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    query_hash TEXT,
+                    llm TEXT,
+                    generation_args TEXT,
+                    result TEXT,
+                    PRIMARY KEY (query_hash, llm, generation_args)
+                )
+            ''')
+
+    def length(self) -> int:
+        cursor = self.conn.execute('''
+            SELECT COUNT(*) FROM response_cache
+        ''')
+        return cursor.fetchone()[0]
+
+    def has_hash(self, query_hash: str, llm: str, generation_args: str) -> bool:
+        return self.get_result(query_hash, llm, generation_args) is not None
+
+    def get_result(self, query_hash: str, llm: str, generation_args: str) -> Optional[str]:
+        cursor = self.conn.execute('''
+            SELECT result FROM response_cache WHERE query_hash = ? AND llm = ? AND generation_args = ?
+        ''', (query_hash, llm, generation_args))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_results(self, query_hashes: List[str], llm: str, generation_args: str) -> Dict[str, str]:
+        """
+        Looks up many hashes at once. Returns the cached results of all hashes that were found.
+        """
+        results: Dict[str, str] = dict()
+        unique_hashes: List[str] = sorted(set(query_hashes))
+        for start in range(0, len(unique_hashes), LLMHashCache.MAX_BULK_SIZE):
+            chunk: List[str] = unique_hashes[start:start + LLMHashCache.MAX_BULK_SIZE]
+            placeholders: str = ','.join('?' * len(chunk))
+            cursor = self.conn.execute(f'''
+                SELECT query_hash, result FROM response_cache
+                WHERE llm = ? AND generation_args = ? AND query_hash IN ({placeholders})
+            ''', (llm, generation_args, *chunk))
+            results.update(dict(cursor.fetchall()))
+        return results
+
+    def add_result(self, query_hash: str, result: str, llm: str, generation_args: str) -> None:
+        self.add_results([(query_hash, result)], llm, generation_args)
+
+    def add_results(self, hashes_and_results: List[Tuple[str, str]], llm: str, generation_args: str) -> None:
+        """
+        Stores many results within a single transaction.
+        """
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO response_cache (query_hash, llm, generation_args, result)
+                VALUES (?, ?, ?, ?)
+            ''', [(query_hash, llm, generation_args, result) for query_hash, result in hashes_and_results])
+
+    def __del__(self):
+        self.conn.close()
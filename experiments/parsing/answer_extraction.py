@@ -0,0 +1,163 @@
+import re
+from typing import Dict, List, Tuple, Optional
+
+# Characters that are ignored around a bare answer number (e.g. "[3].", "(3)" or "'3'").
+ANSWER_PUNCTUATION: str = '[],.:()`\'"`'
+_PUNCTUATION_TABLE: Dict[int, None] = str.maketrans('', '', ANSWER_PUNCTUATION)
+
+# A line (after removing "*", stripping and lowercasing) that starts with "answer:" followed by a digit.
+# [^\S\n] is whitespace without the line break, i.e. the same as \s within a single line.
+_ANSWER_LINE_PATTERN: re.Pattern = re.compile(r'^[^\S\n]*(?:answer:[^\S\n]*)+\[?(\d)', re.MULTILINE)
+
+# "answer:" anywhere in the (lowercased) text followed by a digit, possibly in bold or brackets.
+_ANSWER_MARKER_PATTERN: re.Pattern = re.compile(r'answer:\*?\*?\s*\[?(\d)')
+
+# A line that only consists of a number (after removing the ANSWER_PUNCTUATION).
+_NUMBER_LINE_PATTERN: re.Pattern = re.compile(r'^[^\S\n]*(\d+)[^\S\n]*$', re.MULTILINE)
+
+_BRACKET_NUMBER_PATTERN: re.Pattern = re.compile(r'\[(\d+)\]')
+
+# Prefix of an answer that is given as the option text (e.g. "**Answer:** The mayor").
+_ANSWER_TEXT_PREFIX: str = r'answer\*?\*?:\*?\*?\s*'
+_ANSWER_TEXT_PREFIX_PATTERN: re.Pattern = re.compile(_ANSWER_TEXT_PREFIX)
+
+
+def remove_answer_punctuation(text: str) -> str:
+    if text.isascii():
+        return text.translate(_PUNCTUATION_TABLE)
+    # str.translate() has no fast path for non-ASCII text, a few passes of str.replace() are faster.
+    for c in ANSWER_PUNCTUATION[:-1]:
+        text = text.replace(c, '')
+    return text
+
+
+class AnswerExtractor:
+    """
+    Precompiled answer extraction for a fixed number of answer options. Each method scans the response once (within
+    C via a precompiled pattern) and returns the 0-based answer index, or -1 if the response contains no such answer.
+    Answer numbers outside the valid range are skipped in the same way as by the original per-line implementations.
+    """
+
+    def __init__(self, num_answer_options: int):
+        self.num_answer_options: int = num_answer_options
+        self.answers_by_number: Dict[str, int] = {
+            str(answer): answer - 1 for answer in range(1, num_answer_options + 1)
+        }
+        single_digits: str = ''.join(number for number in self.answers_by_number if len(number) == 1)
+        self.single_digit_pattern: Optional[re.Pattern] = re.compile(f'[{single_digits}]') if single_digits else None
+
+    def get_answer(self, number: str) -> int:
+        return self.answers_by_number.get(number, -1)
+
+    def get_num_if_exists(self, text: str) -> int:
+        """
+        The answer if the text only consists of an answer number (ignoring whitespace and ANSWER_PUNCTUATION).
+        """
+        return self.answers_by_number.get(remove_answer_punctuation(text).strip(), -1)
+
+    def find_last_answer_line(self, text: str) -> int:
+        """
+        The answer of the last line that starts with "Answer: <digit>" (ignoring "*", case and surrounding whitespace).
+        A line with the digit 0 ends the search without an answer.
+        """
+        if ':' not in text:
+            return -1
+        for digit in reversed(_ANSWER_LINE_PATTERN.findall(text.replace('*', '').lower())):
+            answered: int = int(digit) - 1
+            if answered < self.num_answer_options:
+                return answered
+        return -1
+
+    def find_first_answer_marker(self, text: str) -> int:
+        """
+        The answer of the first "Answer: <digit>" anywhere in the text (only the first occurrence is considered).
+        """
+        match: Optional[re.Match] = _ANSWER_MARKER_PATTERN.search(text.lower())
+        if match:
+            answered: int = int(match.group(1)) - 1
+            if answered < self.num_answer_options:
+                return answered
+        return -1
+
+    def find_number_line(self, cleaned_text: str) -> int:
+        """
+        The answer of the first line that only consists of a valid answer number.
+        :param cleaned_text:    The response after remove_answer_punctuation().
+        """
+        for number in _NUMBER_LINE_PATTERN.findall(cleaned_text):
+            if number in self.answers_by_number:
+                return self.answers_by_number[number]
+        return -1
+
+    def find_bracket_numbers(self, text: str) -> List[Tuple[int, int]]:
+        """
+        All valid answer numbers in square brackets (e.g. "[3]") as (answer, position) in the order of their occurrence.
+        """
+        return [
+            (self.answers_by_number[match.group(1)], match.start())
+            for match in _BRACKET_NUMBER_PATTERN.finditer(text) if match.group(1) in self.answers_by_number
+        ]
+
+    def find_first_digit(self, text: str) -> int:
+        """
+        The answer of the first character in the text that is a valid (single-digit) answer number.
+        """
+        if self.single_digit_pattern is None:
+            return -1
+        match: Optional[re.Match] = self.single_digit_pattern.search(text)
+        return self.answers_by_number[match.group(0)] if match else -1
+
+
+def is_word_boundary(text: str, position: int) -> bool:
+    """
+    Same as \\b in a regular expression: exactly one of the characters around the position is a word character.
+    """
+    before: bool = position > 0 and (text[position - 1].isalnum() or text[position - 1] == '_')
+    after: bool = position < len(text) and (text[position].isalnum() or text[position] == '_')
+    return before != after
+
+
+def contains_word(text: str, word: str) -> bool:
+    """
+    Same as re.search(rf'\\b{re.escape(word)}\\b', text) without compiling a pattern for every word.
+    """
+    position: int = text.find(word)
+    while position >= 0:
+        if is_word_boundary(text, position) and is_word_boundary(text, position + len(word)):
+            return True
+        position = text.find(word, position + 1)
+    return False
+
+
+def get_single_answer_token(text: str, options: List[str]) -> int:
+    """
+    The option index if exactly one of the options occurs as a whole word in the text, otherwise -1.
+    """
+    found: List[int] = []
+    for i, option in enumerate(options):
+        if contains_word(text, option):
+            found.append(i)
+            if len(found) > 1:
+                return -1
+    return found[0] if len(found) == 1 else -1
+
+
+def find_answer_text(text: str, options: List[str]) -> int:
+    """
+    The index of the longest option that directly follows "Answer:" in the (lowercased) text. The index refers to the
+    options sorted by length (longest first).
+    """
+    # All positions after an "Answer:" prefix are found in one scan and the options are compared at these positions.
+    answer_positions: Optional[List[int]] = None
+    for i, option in enumerate(sorted(options, key=lambda x: -len(x))):
+        option = option.lower()
+        if len(option) > 0 and (option[0].isspace() or option[0] == '*'):
+            # The greedy prefix would consume the first characters of these options.
+            if re.search(_ANSWER_TEXT_PREFIX + re.escape(option), text):
+                return i
+            continue
+        if answer_positions is None:
+            answer_positions = [match.end() for match in _ANSWER_TEXT_PREFIX_PATTERN.finditer(text)]
+        if any(text.startswith(option, position) for position in answer_positions):
+            return i
+    return -1
@@ -1,7 +1,7 @@
-import re
-from typing import List, Dict, Callable
+from typing import List, Dict
 
 
+from experiments.parsing.answer_extraction import AnswerExtractor, find_answer_text
 from experiments.parsing.ouput_parser import OutputParser
 
 
@@ -9,6 +9,7 @@ class LastLineOutputParser(OutputParser):
 
     def __init__(self, num_answer_options: int):
         self.num_answer_options: int = num_answer_options
+        self.extractor: AnswerExtractor = AnswerExtractor(num_answer_options)
 
     def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
 
@@ -32,6 +33,9 @@ class LastLineOutputParser(OutputParser):
         }
 
 
+    def has_final_answer(self, response: str) -> bool:
+        return self.extract_single_digit_number(response) >= 0
+
     def extract_single_digit_number(self, text):
         """
         Extracts a single-digit number from a string starting with 'Answer:'.
@@ -43,33 +47,11 @@ class LastLineOutputParser(OutputParser):
         Returns:
             int: The single-digit number if found, or None otherwise.
         """
-
-        lines = text.strip().split('\n')[::-1]
-        for line in lines:
-            line = line.replace('*', '').strip().lower()
-            match = re.match(r'^(?:answer:\s*)+\[?(\d)\]?', line)
-            if match:
-                answered: int = int(match.group(1)) - 1
-                if answered < self.num_answer_options:
-                    return answered
-        return -1
+        return self.extractor.find_last_answer_line(text)
 
     def select_multi_line(self, text: str):
-        text = text.lower().strip()
-        match = re.search(r'\*?\*?answer:\*?\*?\s*\[?(\d)\]?', text)
-        if match:
-            answer: int = int(match.group(1)) - 1
-            if answer < self.num_answer_options:
-                return answer
-        return -1
+        return self.extractor.find_first_answer_marker(text)
 
     def select_by_option_text(self, text: str, options: List[str]):
-        options = sorted(options, key=lambda x: -len(x))
-
-        text = text.lower()
-        for i, opt in enumerate(options):
-            if re.search(rf'\s*answer\*?\*?:\*?\*?\s*{re.escape(opt.lower())}', text):
-                return i
-        return -1
-
-
+        # The returned index refers to the options sorted by length (longest first).
+        return find_answer_text(text.lower(), options)
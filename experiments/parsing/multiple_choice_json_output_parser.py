@@ -2,9 +2,13 @@ import json
 import re
 from typing import Dict, List, Optional
 
+from experiments.parsing.answer_extraction import remove_answer_punctuation
 from experiments.parsing.multiple_choice_text_output_parser import MultipleChoiceTextOutputParser
 from experiments.parsing.ouput_parser import OutputParser
 
+# This regular expression matches the first JSON-like structure in the text
+_JSON_PATTERN: re.Pattern = re.compile(r'{.*?}', re.DOTALL)
+
 
 def find_json_in_text(text):
     """
@@ -18,9 +22,7 @@ def find_json_in_text(text):
     """
     json_str = None
     try:
-        # This regular expression matches the first JSON-like structure in the text
-        json_pattern = r'{.*?}'
-        match = re.search(json_pattern, text, re.DOTALL)
+        match = _JSON_PATTERN.search(text)
 
         if match:
             json_str = match.group(0)
@@ -40,10 +42,7 @@ def find_json_in_text(text):
 
 
 def clean_answer_choice(choice: str) -> str:
-    choice = str(choice)
-    for c in '[],.:()`\'"`':
-        choice = choice.replace(c, '')
-    return choice.strip()
+    return remove_answer_punctuation(str(choice)).strip()
 
 
 class MultipleChoiceJsonOutputParser(OutputParser):
@@ -60,18 +59,27 @@ class MultipleChoiceJsonOutputParser(OutputParser):
             print("Could not parse:", response)
         return answer
 
+    def has_final_answer(self, response: str) -> bool:
+        # Only the complete JSON object with a valid answer number counts (the text fallback is ambiguous while generating).
+        try:
+            response_json: Optional[Dict] = find_json_in_text(response)
+        except json.JSONDecodeError:
+            return False
+        if response_json is None or 'answer_choice' not in response_json:
+            return False
+        return self.backup.extractor.get_answer(clean_answer_choice(response_json['answer_choice'])) >= 0
+
     def get_answer_from_json(self, response: str, answer_choices: List[str]) -> Dict:
         response_json: Optional[Dict] = find_json_in_text(response)
         if response_json is None:
             pass
         if response_json is not None and 'answer_choice' in response_json:
             answer_choice = response_json['answer_choice']
-            answer_choice = clean_answer_choice(answer_choice)
-            for possible_answer in range(1, self.num_answer_options + 1):
-                if answer_choice == str(possible_answer):
-                    return {
-                        'parsed': True, 'answered': possible_answer - 1
-                    }
+            answered: int = self.backup.extractor.get_answer(clean_answer_choice(answer_choice))
+            if answered >= 0:
+                return {
+                    'parsed': True, 'answered': answered
+                }
 
             # Default parser on the answer
             answer_choice = self.backup.select_answer(str(response_json['answer_choice']), answer_choices)
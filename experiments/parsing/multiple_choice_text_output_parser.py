@@ -1,5 +1,8 @@
 import re
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Tuple
+
+from experiments.parsing.answer_extraction import AnswerExtractor, get_single_answer_token, \
+    remove_answer_punctuation
 
 
 class AnswerChoiceSelector:
@@ -14,35 +17,34 @@ class AnswerChoiceSelector:
         return sorted(positions, key=lambda x: x[-1])
 
     def get_single_answer_token(self, text):
-        found = list(set([
-            idx for idx, _, _ in self.get_token_positions(text)
-        ]))
-        if len(found) == 1:
-            return found[0]
-        return -1
+        return get_single_answer_token(text, self.choices)
 
 
 class MultipleChoiceTextOutputParser:
 
     def __init__(self, num_answer_options: int):
         self.num_answer_options: int = num_answer_options
+        self.extractor: AnswerExtractor = AnswerExtractor(num_answer_options)
 
     def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
-        selector: AnswerChoiceSelector = AnswerChoiceSelector(answer_choices)
-        parse_fns: List[Callable[[str], int]] = [
-            self.get_num_if_exists,
-            self.first_line_is_answer,
-            self.any_single_line_is_answer,
-            self.starts_with_num,
-            self.single_bracket_num,
-            selector.get_single_answer_token,
-            self.first_bracket_num,
-            self.first_single_line
+        # The response is scanned once per fallback (in the same order as below) until one of them finds an answer.
+        # Punctuation is removed only once for all line-based fallbacks. A first line with only the answer number is
+        # also found by any_single_line_is_answer, i.e. first_line_is_answer need not run separately.
+        cleaned: str = remove_answer_punctuation(response)
+        bracket_numbers: List[Tuple[int, int]] = []
+        parse_fns: List[Callable[[], int]] = [
+            lambda: self.extractor.get_answer(cleaned.strip()),
+            lambda: self.extractor.find_number_line(cleaned),
+            lambda: self.starts_with_num(response),
+            lambda: self.single_bracket_num(response, bracket_numbers),
+            lambda: get_single_answer_token(response, answer_choices),
+            lambda: bracket_numbers[0][0] if len(bracket_numbers) > 0 else -1,
+            lambda: self.extractor.find_first_digit(response)
         ]
 
         answer_idx: int = -1
         for _parse in parse_fns:
-            answer_idx = _parse(response)
+            answer_idx = _parse()
             if answer_idx > -1:
                 return {
                     'parsed': True,
@@ -67,38 +69,21 @@ class MultipleChoiceTextOutputParser:
         }
 
     def parse_response(self, original_response: str) -> int:
-        response: str = original_response
-        for c in '[],.:()`\'"`':
-            response = response.replace(c, '')
-        response = response.strip().split('\n')[0]
-        response = response.strip()
-
-        for answer in range(1, self.num_answer_options + 1):
-            if response == str(answer):
-                return answer - 1
-        return -1
+        response: str = remove_answer_punctuation(original_response)
+        return self.extractor.get_answer(response.strip().split('\n')[0].strip())
 
     def get_num_if_exists(self, text: str) -> int:
-        for c in '[],.:()`\'"`':
-            text = text.replace(c, '')
-        text = text.strip()
-        for answer in range(1, self.num_answer_options + 1):
-            if text == str(answer):
-                return answer - 1
-        return -1
+        return self.extractor.get_num_if_exists(text)
 
     def first_line_is_answer(self, text: str):
         return self.get_num_if_exists(text.strip().split('\n')[0])
 
     def first_single_line(self, text):
-        for line in text.strip('\n'):
-            answer = self.get_num_if_exists(line)
-            if answer > -1:
-                return answer
-        return -1
+        # Iterates over the characters (not the lines), i.e. finds the first digit of a valid answer number.
+        return self.extractor.find_first_digit(text)
 
     def starts_with_num(self, text: str) -> int:
-        return self.get_num_if_exists(text.strip().split(' ')[0])
+        return self.get_num_if_exists(text.strip().split(' ', 1)[0])
 
     def answer_number(self, text: str):
         nums = [
@@ -108,35 +93,23 @@ class MultipleChoiceTextOutputParser:
             return nums[0]
         return -1
 
-    def single_bracket_num(self, text: str):
-        nums = [
-            num - 1 for num in range(1, self.num_answer_options + 1)
-            if f'[{num}]' in text
-        ]
+    def single_bracket_num(self, text: str, bracket_numbers: List[Tuple[int, int]] = None):
+        """
+        :param bracket_numbers:     Optional list that is filled with the found bracket numbers (to reuse them).
+        """
+        if bracket_numbers is None:
+            bracket_numbers = []
+        bracket_numbers.extend(self.extractor.find_bracket_numbers(text))
+        nums = {answer for answer, _ in bracket_numbers}
         if len(nums) == 1:
-            return nums[0]
+            return nums.pop()
         return -1
 
     def first_bracket_num(self, text):
-        nums = [
-            (num - 1, text.index(f'[{num}]')) for num in range(1, self.num_answer_options + 1)if f'[{num}]' in text
-        ]
-        nums = [
-            n for n in nums if n[-1] >= 0
-        ]
-        nums = sorted(nums, key=lambda x: x[-1])
-        if len(nums) > 0:
-            answer = nums[0][0]
-            return answer
+        bracket_numbers: List[Tuple[int, int]] = self.extractor.find_bracket_numbers(text)
+        if len(bracket_numbers) > 0:
+            return bracket_numbers[0][0]
         return -1
 
     def any_single_line_is_answer(self, text: str):
-        lines = [
-            line for line in text.split('\n') if len(line.strip()) > 0
-        ]
-        for line in lines:
-            answer: int  =  self.get_num_if_exists(line)
-            if answer > -1:
-                return answer
-        return -1
-
+        return self.extractor.find_number_line(remove_answer_punctuation(text))
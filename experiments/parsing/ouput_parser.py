@@ -4,3 +4,10 @@ from typing import Dict, List
 class OutputParser:
     def select_answer(self, response: str, answer_choices: List[str]) -> Dict:
         raise NotImplementedError
+
+    def has_final_answer(self, response: str) -> bool:
+        """
+        Returns true if the (possibly incomplete) response already contains an answer that this parser can extract.
+        Used to stop the generation early. Parsers that cannot decide this on partial responses return false.
+        """
+        return False
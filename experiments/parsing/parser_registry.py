@@ -0,0 +1,25 @@
+from typing import Dict, Callable, List
+
+from experiments.parsing.last_line_output_parser import LastLineOutputParser
+from experiments.parsing.multiple_choice_json_output_parser import MultipleChoiceJsonOutputParser
+from experiments.parsing.ouput_parser import OutputParser
+
+
+# Maps the parser names (as used on the command line) to the output parser classes.
+OUTPUT_PARSERS: Dict[str, Callable[[int], OutputParser]] = {
+    'last-line': LastLineOutputParser,
+    'json': MultipleChoiceJsonOutputParser,
+}
+
+# All used prompts expect the answer in the last line of the response.
+DEFAULT_PARSER: str = 'last-line'
+
+
+def get_parser_names() -> List[str]:
+    return sorted(OUTPUT_PARSERS.keys())
+
+
+def get_output_parser(parser_name: str, num_answer_options: int = 7) -> OutputParser:
+    if parser_name not in OUTPUT_PARSERS:
+        raise NotImplementedError(parser_name)
+    return OUTPUT_PARSERS[parser_name](num_answer_options)
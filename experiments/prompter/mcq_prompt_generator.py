@@ -1,5 +1,6 @@
-from typing import Dict
+from typing import Dict, List, Optional
 
+from experiments.data.article_store import ArticleStore
 from experiments.prompter.prompt_generator import PromptGenerator
 from experiments.util.entity_util import remove_ids_from
 
@@ -12,13 +13,39 @@ def stringify_news_article(article: Dict, content=None) -> str:
 
 
 class MultipleChoicePromptGenerator(PromptGenerator):
-    def __init__(self, template_name: str, prompt_directory: str = './prompt_templates/mcq'):
+    def __init__(
+            self, template_name: str, prompt_directory: str = './prompt_templates/mcq',
+            article_store: Optional[ArticleStore] = None, rendered_articles: Optional[Dict[str, str]] = None
+    ):
         """
         Fills a prompt template with instances.
         :param template_name:           Name of the template.txt file (.txt is optional)
         :param prompt_directory:        Directory of the template files.
+        :param article_store:           Resolves the "news_article_ids" of instances that do not embed the news articles.
+        :param rendered_articles:       Rendered articles by article_id (e.g. shared by the generators of several
+                                        templates, the rendering does not depend on the template).
         """
         super().__init__(template_name, prompt_directory)
+        self.article_store: Optional[ArticleStore] = article_store
+
+        # Each article is rendered only once, no matter how many instances use it. Articles are identified by their
+        # article_id, i.e. a generator must only be used with articles prepared in the same way (e.g. ID removal).
+        self.rendered_articles: Dict[str, str] = rendered_articles if rendered_articles is not None else dict()
+
+    def _render_news_articles(self, instance: Dict) -> List[str]:
+        if 'news_articles' in instance:
+            for article in instance['news_articles']:
+                if article['article_id'] not in self.rendered_articles:
+                    self.rendered_articles[article['article_id']] = stringify_news_article(article)
+            article_ids: List[str] = [article['article_id'] for article in instance['news_articles']]
+        else:
+            article_ids = instance['news_article_ids']
+            for article_id in article_ids:
+                if article_id not in self.rendered_articles:
+                    if self.article_store is None:
+                        raise ValueError('The instance only contains "news_article_ids" but no article store was provided!')
+                    self.rendered_articles[article_id] = stringify_news_article(self.article_store.get(article_id))
+        return [self.rendered_articles[article_id] for article_id in article_ids]
 
     def _prepare_prompt_values(self, instance: Dict) -> Dict:
         data = instance
@@ -29,5 +56,5 @@ class MultipleChoicePromptGenerator(PromptGenerator):
             'ANSWERS': '\n'.join([
                 f'[{i+1}] {data["options"][i]}' for i in range(len(data["options"]))
             ]),
-            'NEWS_ARTICLES': '\n'.join(list(map(stringify_news_article, data['news_articles'])))
+            'NEWS_ARTICLES': '\n'.join(self._render_news_articles(data))
         }
@@ -1,6 +1,7 @@
+import hashlib
 import re
 from os.path import exists, join
-from typing import Dict
+from typing import Dict, List
 
 from experiments.util.file_util import read_text_file
 
@@ -16,28 +17,39 @@ class PromptGenerator:
 
         self.template: str = read_text_file(template_path).strip()
 
-    def get_prompt(self, instance: Dict) -> Dict:
+        # The template is parsed once into literal segments and placeholders: Splitting on the placeholder pattern
+        # (with a capturing group) alternates literals (even positions) and placeholder names (odd positions).
+        pattern_instruction_placeholder: re.Pattern = re.compile(r'\{\{(\w+)\}\}')
+        self.template_segments: List[str] = pattern_instruction_placeholder.split(self.template)
+        self.placeholders: List[str] = self.template_segments[1::2]
 
-        prompt_values: Dict = self._prepare_prompt_values(instance)
+    def get_prompt(self, instance: Dict) -> Dict:
 
-        # Fill placeholders
-        prompt: str = self.template[:]
-        for key in prompt_values:
-            repl = '{{' + key.upper() + '}}'
-            if repl in prompt:
-                prompt = prompt.replace(repl, prompt_values[key])
+        prompt_values: Dict = {
+            key.upper(): value for key, value in self._prepare_prompt_values(instance).items()
+        }
 
         # Make sure no placeholders are unfilled
-        pattern_instruction_placeholder: re.Pattern = re.compile(r'\{\{\w+\}\}')
-        placeholder_exist = bool(re.search(pattern_instruction_placeholder, prompt))
-        if placeholder_exist:
-            raise ValueError(f'Placeholder still exist in prompt: "{prompt}"')
+        missing: List[str] = [key for key in self.placeholders if key not in prompt_values]
+        if len(missing) > 0:
+            raise ValueError(f'Placeholder still exist in prompt: {missing}')
+
+        # Fill placeholders
+        segments: List[str] = self.template_segments[:]
+        for i in range(1, len(segments), 2):
+            segments[i] = prompt_values[segments[i]]
+        prompt: str = ''.join(segments)
 
         return {
             'prompt': prompt,
             'prompt_len': len(prompt)
         }
 
+    def get_template_hash(self) -> str:
+        """
+        Identifies the prompts produced by this generator (e.g. to cache datasets with filled prompts).
+        """
+        return hashlib.sha256(f'{type(self).__name__}:{self.template}'.encode()).hexdigest()
+
     def _prepare_prompt_values(self, instance: Dict) -> Dict:
         raise NotImplementedError
-
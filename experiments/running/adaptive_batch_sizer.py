@@ -0,0 +1,57 @@
+from os.path import exists
+from typing import Dict, List, Optional
+
+from experiments.util.file_util import read_json, store_json
+
+
+class AdaptiveBatchSizer:
+    """
+    Remembers the largest batch size that fits into memory per length bucket (of the longest prompt in the batch).
+    After an out-of-memory error, the limit of the bucket is halved and the failed batch is split accordingly. Longer
+    prompts need more memory, i.e. the limit of a bucket also applies to all longer buckets. The limits are stored in
+    a JSON file, so that a resumed run does not run out of memory again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path:    JSON file of the limits per bucket (loaded if it exists).
+        """
+        self.path: Optional[str] = path
+        self.max_batch_sizes: Dict[int, int] = dict()
+        if path is not None and exists(path):
+            self.max_batch_sizes = {int(bucket): size for bucket, size in read_json(path).items()}
+
+    @staticmethod
+    def get_bucket(max_num_tokens: int) -> int:
+        # Buckets double in length: 1, 2-3, 4-7, ..., 1024-2047, ...
+        return max_num_tokens.bit_length()
+
+    def get_max_batch_size(self, max_num_tokens: int) -> Optional[int]:
+        """
+        Returns the largest safe batch size for prompts of up to max_num_tokens (None if there is no limit yet).
+        """
+        bucket: int = self.get_bucket(max_num_tokens)
+        limits: List[int] = [size for other_bucket, size in self.max_batch_sizes.items() if other_bucket <= bucket]
+        return min(limits) if len(limits) > 0 else None
+
+    def split(self, batch: List[int], max_num_tokens: int) -> List[List[int]]:
+        """
+        Splits the batch (of instance indices) into consecutive batches within the limit of its bucket.
+        """
+        max_batch_size: Optional[int] = self.get_max_batch_size(max_num_tokens)
+        if max_batch_size is None or len(batch) <= max_batch_size:
+            return [batch]
+        return [batch[i:i + max_batch_size] for i in range(0, len(batch), max_batch_size)]
+
+    def add_out_of_memory(self, batch_size: int, max_num_tokens: int) -> int:
+        """
+        Records that a batch of batch_size prompts with up to max_num_tokens ran out of memory. Returns the new limit.
+        """
+        if batch_size <= 1:
+            raise ValueError('A single instance cannot be split any further!')
+        bucket: int = self.get_bucket(max_num_tokens)
+        max_batch_size: int = (batch_size + 1) // 2
+        self.max_batch_sizes[bucket] = min(self.max_batch_sizes.get(bucket, max_batch_size), max_batch_size)
+        if self.path is not None:
+            store_json({str(bucket): size for bucket, size in sorted(self.max_batch_sizes.items())}, self.path)
+        return self.get_max_batch_size(max_num_tokens)
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+from os import makedirs
+from os.path import join, exists, getsize
+from typing import List, Dict, Set, Optional, Iterator, IO, Tuple, TYPE_CHECKING
+
+from tqdm import tqdm
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.evaluate.evaluate import evaluate_file
+from experiments.evaluate.metrics_accumulator import MetricsAccumulator
+from experiments.llms.llm import LLM
+from experiments.parsing.ouput_parser import OutputParser
+from experiments.parsing.parser_registry import get_output_parser
+from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
+from experiments.prompter.prompt_generator import PromptGenerator
+from experiments.running.run_and_eval import (
+    get_dataset_with_prompts, update_partial_metrics, get_out_directory, load_finished_metrics
+)
+from experiments.util.file_util import store_json
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+
+
+def read_checkpoint(src: str) -> List[Dict]:
+    """
+    Reads the predictions of a previous run. An incomplete last line (the run was killed while writing it) is removed
+    from the file, so that new predictions are appended after the last complete one.
+    """
+    predictions: List[Dict] = []
+    num_valid_bytes: int = 0
+    with open(src, 'rb') as f_in:
+        for line in f_in:
+            if not line.endswith(b'\n'):
+                break
+            predictions.append(json.loads(line))
+            num_valid_bytes += len(line)
+    if num_valid_bytes < getsize(src):
+        os.truncate(src, num_valid_bytes)
+    return predictions
+
+
+class PredictionWriter:
+    """
+    The only task that writes to the predictions file. Predictions are appended in the order in which the instances
+    were scheduled (i.e. the file has the same order as the synchronous runner): predictions that complete early wait
+    in a reorder buffer until all previous instances are written. Workers only schedule instances within a bounded
+    look-ahead window of the next instance to write, so the buffer holds fewer than max_look_ahead predictions.
+
+    Written predictions are made durable (flush and fsync) as soon as they and the buffered predictions add up to
+    checkpoint_interval. With max_look_ahead <= checkpoint_interval, a crash therefore loses at most
+    checkpoint_interval completed predictions (written but not synced, or buffered). Instance IDs that are already in
+    the file are never written again.
+    """
+
+    def __init__(
+            self, out_path: str, written_ids: Set[str], checkpoint_interval: int, accumulator: MetricsAccumulator,
+            progress: tqdm, max_look_ahead: int
+    ):
+        """
+        :param max_look_ahead:  Maximum number of scheduled instances that are not written yet (at most
+                                checkpoint_interval).
+        """
+        if max_look_ahead > checkpoint_interval:
+            raise ValueError(
+                f'The look-ahead ({max_look_ahead}) must not exceed the checkpoint interval ({checkpoint_interval})!'
+            )
+        self.out_path: str = out_path
+        self.written_ids: Set[str] = written_ids
+        self.checkpoint_interval: int = checkpoint_interval
+        self.accumulator: MetricsAccumulator = accumulator
+        self.progress: tqdm = progress
+        self.max_look_ahead: int = max_look_ahead
+
+        # Completed predictions by their schedule index that wait for their predecessors.
+        self.buffer: Dict[int, Dict] = dict()
+        self.next_index: int = 0
+
+    @staticmethod
+    def checkpoint(f_out: IO) -> None:
+        f_out.flush()
+        os.fsync(f_out.fileno())
+
+    async def run(self, predictions: asyncio.Queue, look_ahead: asyncio.Semaphore) -> None:
+        """
+        Writes (schedule index, prediction) pairs from the queue until it receives None. Releases the look-ahead
+        window by one for every written prediction. Buffered predictions that are left at the end (after an error or
+        interrupt, fewer than max_look_ahead) are not written: they are predicted again when the run is resumed.
+        """
+        with open(self.out_path, 'a', encoding='utf-8') as f_out:
+            num_unsynced: int = 0
+            while True:
+                item: Optional[Tuple[int, Dict]] = await predictions.get()
+                if item is None:
+                    break
+                index, prediction = item
+                self.buffer[index] = prediction
+
+                while self.next_index in self.buffer:
+                    prediction = self.buffer.pop(self.next_index)
+                    self.next_index += 1
+                    look_ahead.release()
+                    if prediction['instance_id'] in self.written_ids:
+                        continue
+
+                    f_out.write(json.dumps(prediction) + '\n')
+                    self.written_ids.add(prediction['instance_id'])
+                    self.accumulator.add(prediction)
+                    self.progress.update(1)
+
+                    num_unsynced += 1
+
+                # Completed predictions that are not on the disk yet: unsynced and buffered ones.
+                if num_unsynced > 0 and num_unsynced + len(self.buffer) >= self.checkpoint_interval:
+                    # Other coroutines can continue while the OS writes the data to the disk.
+                    await asyncio.to_thread(PredictionWriter.checkpoint, f_out)
+                    num_unsynced = 0
+                    update_partial_metrics(self.accumulator, self.progress)
+            PredictionWriter.checkpoint(f_out)
+        if len(self.buffer) > 0:
+            print(f'Discarded {len(self.buffer)} predictions that completed before their predecessors.')
+
+
+async def predict(
+        llm: LLM, parser: OutputParser, instances: Iterator[Tuple[int, Dict]], predictions: asyncio.Queue,
+        look_ahead: asyncio.Semaphore
+) -> None:
+    # All workers share the same iterator, i.e. each instance is only requested once.
+    while True:
+        # Do not schedule instances too far ahead of the next instance that is written.
+        await look_ahead.acquire()
+        scheduled: Optional[Tuple[int, Dict]] = next(instances, None)
+        if scheduled is None:
+            look_ahead.release()
+            return
+        index, instance = scheduled
+        response: str = await llm.agenerate(instance)
+        instance['response'] = response
+        instance['predicted_answer'] = parser.select_answer(response, instance['options'])['answered']
+        # So that we do not store all the news articles.
+        instance['news_articles'] = instance.pop('news_article_ids')
+        await predictions.put((index, instance))
+
+
+async def predict_concurrently(
+        llm: LLM, parser: OutputParser, instances: Iterator[Dict], writer: PredictionWriter, max_concurrency: int
+) -> None:
+    predictions: asyncio.Queue = asyncio.Queue()
+    look_ahead: asyncio.Semaphore = asyncio.Semaphore(writer.max_look_ahead)
+    writer_task: asyncio.Task = asyncio.create_task(writer.run(predictions, look_ahead))
+    indexed_instances: Iterator[Tuple[int, Dict]] = enumerate(instances)
+    workers: List[asyncio.Task] = [
+        asyncio.create_task(predict(llm, parser, indexed_instances, predictions, look_ahead))
+        for _ in range(max_concurrency)
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # Also on errors and interrupts: everything that was completed so far is written.
+        for worker in workers:
+            worker.cancel()
+        await predictions.put(None)
+        await writer_task
+
+
+def iter_unpredicted(instances: Iterator[Dict], already_predicted: Set[str]) -> Iterator[Dict]:
+    scheduled: Set[str] = set(already_predicted)
+    for instance in instances:
+        if instance['instance_id'] not in scheduled:
+            scheduled.add(instance['instance_id'])
+            yield instance
+
+
+def run_and_eval_multiple_choice_async(
+        llm: LLM, template_name: str, parser_name: str, data_variant: str, data_split: str, random_seed: int,
+        cache_dir: Optional[str] = './cache/datasets', max_concurrency: int = 16, checkpoint_interval: int = 32,
+        stop_at_answer: bool = False, max_look_ahead: Optional[int] = None
+):
+    """
+    Same as run_and_eval_multiple_choice(), but keeps max_concurrency requests in flight (see LLM.agenerate) and parses
+    each response as soon as it arrives. The predictions are stored in the same order as by the synchronous runner
+    (see PredictionWriter) and synced to the disk so that a crash loses at most checkpoint_interval completed
+    predictions. Interrupted runs can be resumed.
+
+    :param max_look_ahead:  Maximum number of instances that are scheduled ahead of the next prediction to write
+                            (defaults to checkpoint_interval). Must be between max_concurrency and checkpoint_interval.
+    """
+    if checkpoint_interval < max_concurrency:
+        raise ValueError(
+            f'The checkpoint interval ({checkpoint_interval}) must be at least the concurrency ({max_concurrency})!'
+        )
+    if max_look_ahead is None:
+        max_look_ahead = checkpoint_interval
+    if max_look_ahead < max_concurrency:
+        raise ValueError(f'The look-ahead ({max_look_ahead}) must be at least the concurrency ({max_concurrency})!')
+
+    out_directory: str = get_out_directory(llm.get_name(), data_variant, template_name)
+    finished_metrics: Optional[Dict] = load_finished_metrics(out_directory, data_split, random_seed)
+    if finished_metrics is not None:
+        return finished_metrics
+
+    parser: OutputParser = get_output_parser(parser_name, 7)
+
+    loader: NeoQALoader = NeoQALoader(data_variant, embed_articles=False, cache_dir=cache_dir)
+    prompt_generator: PromptGenerator = MultipleChoicePromptGenerator(template_name, article_store=loader.article_store)
+    dataset_with_prompts: Dataset = get_dataset_with_prompts(loader, prompt_generator, data_split, random_seed)
+
+    # Fail early! Start with largest context
+    dataset_with_prompts = dataset_with_prompts.sort('prompt_len', reverse=True)
+
+    makedirs(out_directory, exist_ok=True)
+
+    out_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
+
+    accumulator: MetricsAccumulator = MetricsAccumulator(
+        join(out_directory, f'{data_split}.seed-{random_seed}.metrics.partial.json'), len(dataset_with_prompts)
+    )
+    already_predicted: Set[str] = set()
+    if exists(out_path):
+        for prediction in read_checkpoint(out_path):
+            if prediction['instance_id'] not in already_predicted:
+                already_predicted.add(prediction['instance_id'])
+                accumulator.add(prediction, is_new=False)
+
+    # Stop generating once the parser finds an answer (only used by backends that support it).
+    llm.set_answer_parser(parser if stop_at_answer else None)
+
+    num_remaining: int = len(set(dataset_with_prompts['instance_id']) - already_predicted)
+    with tqdm(total=num_remaining) as progress:
+        writer: PredictionWriter = PredictionWriter(
+            out_path, set(already_predicted), checkpoint_interval, accumulator, progress, max_look_ahead
+        )
+        instances: Iterator[Dict] = iter_unpredicted(iter(dataset_with_prompts), already_predicted)
+        asyncio.run(predict_concurrently(llm, parser, instances, writer, max_concurrency))
+
+    metrics = evaluate_file(out_path)
+    store_json(metrics, join(out_directory, f'{data_split}.seed-{random_seed}.metrics.json'), pretty=True)
+    accumulator.remove()
+    print('ADTScore:', json.dumps(metrics['adt_score'], indent=2))
+    return metrics
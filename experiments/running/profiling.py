@@ -0,0 +1,80 @@
+import time
+from os.path import join
+from typing import Dict, List, Optional
+
+from experiments.util.file_util import append_jsonl
+
+PROFILE_SUFFIX: str = '.profile.jsonl'
+
+
+def get_profile_path(out_directory: str, data_split: str, random_seed: int) -> str:
+    return join(out_directory, f'{data_split}.seed-{random_seed}{PROFILE_SUFFIX}')
+
+
+def get_peak_rss() -> Optional[int]:
+    """
+    Returns the peak resident memory of the process in bytes (None if it is not available on this platform).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RunProfiler:
+    """
+    Writes one record per predicted instance to a sidecar file next to the predictions (*.profile.jsonl): the time
+    of each step (prompt building, tokenization, prefill, decoding, parsing), the token counts, the throughput and the
+    peak memory. Backends report what they can measure (see LLM.last_profile), other values are None. The time of a
+    batch is shared equally by its instances, i.e. the times of all records add up to the time of the run.
+    """
+
+    def __init__(self, path: str, prompt_build_seconds: Optional[float] = None):
+        """
+        :param path:                    Path of the sidecar file (records are appended, i.e. resumed runs add to it).
+        :param prompt_build_seconds:    Time to build the prompt of one instance (e.g. the time to create the prompts
+                                        of the whole dataset divided by its size).
+        """
+        self.path: str = path
+        self.prompt_build_seconds: Optional[float] = prompt_build_seconds
+        self.batch_start: float = time.perf_counter()
+
+    def start_batch(self) -> None:
+        self.batch_start = time.perf_counter()
+
+    def add_batch(self, instances: List[Dict], profiles: Optional[List[Dict]], parse_seconds: List[float]) -> None:
+        """
+        Stores the records of a finished batch (started with start_batch).
+
+        :param instances:       The predicted instances.
+        :param profiles:        Timings and token counts per instance as reported by the backend (if any).
+        :param parse_seconds:   Time to parse the response of each instance.
+        """
+        total_seconds: float = (time.perf_counter() - self.batch_start) / len(instances)
+        peak_rss: Optional[int] = get_peak_rss()
+        for i, instance in enumerate(instances):
+            profile: Dict = profiles[i] if profiles is not None else dict()
+            generation_seconds: Optional[float] = None
+            if profile.get('prefill_seconds') is not None and profile.get('decode_seconds') is not None:
+                generation_seconds = profile['prefill_seconds'] + profile['decode_seconds']
+            output_tokens: Optional[int] = profile.get('output_tokens')
+            append_jsonl({
+                'instance_id': instance['instance_id'],
+                'batch_size': profile.get('batch_size', len(instances)),
+                'cached': profile.get('cached'),
+                'prompt_tokens': profile.get('prompt_tokens'),
+                'output_tokens': output_tokens,
+                'prompt_build_seconds': self.prompt_build_seconds,
+                'tokenization_seconds': profile.get('tokenization_seconds'),
+                'prefill_seconds': profile.get('prefill_seconds'),
+                'decode_seconds': profile.get('decode_seconds'),
+                'parse_seconds': parse_seconds[i],
+                'total_seconds': total_seconds,
+                'tokens_per_second': (
+                    output_tokens / generation_seconds if output_tokens is not None and generation_seconds else None
+                ),
+                'peak_memory_bytes': profile.get('peak_memory_bytes'),
+                'peak_rss_bytes': peak_rss
+            }, self.path)
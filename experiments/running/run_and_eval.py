@@ -1,150 +1,458 @@
 import json
+import time
 from os import makedirs
 from os.path import join, exists
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional, Iterable, TYPE_CHECKING
 
-import torch
-from datasets import Dataset
-from torch.utils.data import DataLoader
+import numpy as np
 from tqdm import tqdm
-from transformers import Pipeline, AutoModelForCausalLM, AutoTokenizer
 
 from experiments.data.neoqa_loader import NeoQALoader
 from experiments.evaluate.evaluate import evaluate_file
+from experiments.evaluate.metrics_accumulator import MetricsAccumulator
 from experiments.llms.llm import LLM
-from experiments.parsing.last_line_output_parser import LastLineOutputParser
-from experiments.parsing.multiple_choice_json_output_parser import MultipleChoiceJsonOutputParser
 from experiments.parsing.ouput_parser import OutputParser
+from experiments.parsing.parser_registry import get_output_parser
 from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
 from experiments.prompter.prompt_generator import PromptGenerator
-from experiments.util.file_util import store_jsonl, store_json, read_jsonl, append_jsonl
+from experiments.running.adaptive_batch_sizer import AdaptiveBatchSizer
+from experiments.running.profiling import RunProfiler, get_profile_path
+from experiments.running.token_budget_batcher import TokenBudgetBatcher
+from experiments.util.file_util import store_json, read_jsonl, append_jsonl, read_json
+
+# Only imported where they are needed, so that finished or fully cached runs start fast.
+if TYPE_CHECKING:
+    from datasets import Dataset
+    from transformers import AutoModelForCausalLM, AutoTokenizer
 
 
 def collate_fn(batch, device, tokenizer):
-    prompts = [instance['prompt'] for instance in batch]
-    messages_batch = [[{"role": "user", "content": prompt}] for prompt in prompts]
-
-    # Apply chat template to the whole batch at once
-    input_tensors = tokenizer.apply_chat_template(
-        messages_batch,
-        add_generation_prompt=True,
-        return_tensors="pt",
-        padding=True  # Important: Add padding for batching
+    # The prompts were tokenized (with the chat template) once in add_prompt_tokens(). Pad on the left for generation.
+    tokenizer.padding_side = 'left'
+    inputs = tokenizer.pad(
+        {'input_ids': [instance['prompt_input_ids'] for instance in batch]},
+        padding=True,
+        return_tensors='pt'
     )
 
     # Move input tensors to the device
-    input_tensors = input_tensors.to(device)
-    original_batch = [{k:v for k,v in instance.items()} for instance in batch]
+    inputs = inputs.to(device)
+    original_batch = [{k:v for k,v in instance.items() if k != 'prompt_input_ids'} for instance in batch]
     for instance in original_batch:
-        instance['news_articles'] = [article['article_id'] for article in instance['news_articles']]
+        instance['news_articles'] = instance.pop('news_article_ids')
+
+    return inputs, original_batch
+
+
+def add_prompt_tokens(dataset: 'Dataset', tokenizer: 'AutoTokenizer') -> 'Dataset':
+    """
+    Tokenizes every (chat-templated) prompt once with the tokenizer of the model. Adds the token IDs
+    ("prompt_input_ids") and the number of tokens ("prompt_num_tokens") of each prompt.
+    """
+    def tokenize(batch: Dict) -> Dict:
+        input_ids: List[List[int]] = tokenizer.apply_chat_template(
+            [[{"role": "user", "content": prompt}] for prompt in batch['prompt']],
+            add_generation_prompt=True,
+            tokenize=True
+        )
+        return {
+            'prompt_input_ids': input_ids,
+            'prompt_num_tokens': [len(ids) for ids in input_ids]
+        }
+    return dataset.map(tokenize, batched=True, load_from_cache_file=False, keep_in_memory=True)
+
+
+def get_out_directory(model_name: str, data_variant: str, template_name: str) -> str:
+    model_dir: str = model_name.replace('/', '--')
+    return f'./results/{model_dir}/{data_variant}/{template_name.replace(".txt", "")}'
+
+
+def load_finished_metrics(out_directory: str, data_split: str, random_seed: int) -> Optional[Dict]:
+    """
+    Returns the stored metrics if the run is finished (None otherwise). A run is finished once its final metrics are
+    stored. A partial metrics file means that the run was interrupted or is still running.
+    """
+    metrics_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.metrics.json')
+    partial_metrics_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.metrics.partial.json')
+    if exists(metrics_path) and not exists(partial_metrics_path):
+        print(f'Skipping finished run: {metrics_path}')
+        return read_json(metrics_path)
+    return None
+
+
+def get_dataset_with_prompts(
+        loader: NeoQALoader, prompt_generator: PromptGenerator, data_split: str, random_seed: int
+) -> 'Dataset':
+    """
+    Loads the data split and fills the prompts. If the loader has a dataset cache, the result is cached as well.
+    """
+    def create() -> 'Dataset':
+        dataset: Dataset = loader.get(data_split, random_seed=random_seed)
+        return dataset.map(prompt_generator.get_prompt, load_from_cache_file=False, keep_in_memory=True)
+
+    if loader.dataset_cache is None:
+        return create()
+
+    cache_key: Dict = {
+        **loader.get_cache_key(data_split, random_seed),
+        'template_hash': prompt_generator.get_template_hash()
+    }
+    return loader.dataset_cache.get_or_create(cache_key, create)
+
 
-    return input_tensors, original_batch
+def is_out_of_memory(error: Exception) -> bool:
+    import torch
+    if isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    # Allocation failures on the CPU (or MPS) are plain RuntimeErrors.
+    message: str = str(error)
+    return isinstance(error, RuntimeError) and ("can't allocate memory" in message or 'out of memory' in message)
 
 
 def run_and_eval_multiple_choice_with_batches(
-        model: AutoModelForCausalLM, tokenizer: AutoTokenizer, batch_size: int, model_name: str,
-        template_name: str, parser_name: str, data_variant: str, data_split: str, random_seed: int
+        model: 'AutoModelForCausalLM', tokenizer: 'AutoTokenizer', max_tokens_per_batch: int, model_name: str,
+        template_name: str, parser_name: str, data_variant: str, data_split: str, random_seed: int,
+        max_new_tokens: int = 3000, max_batch_size: Optional[int] = None,
+        cache_dir: Optional[str] = './cache/datasets', stop_at_answer: bool = False,
+        simulated_memory_limit: Optional[int] = None, profile: bool = False
 ):
-    parser: OutputParser
-    if parser_name == 'last-line':
-        parser = LastLineOutputParser(7)
-    elif parser_name == 'json':
-        parser = MultipleChoiceJsonOutputParser(7)
-    else:
-        raise NotImplementedError(parser_name)
+    """
+    Runs the model in batches that are packed up to max_tokens_per_batch (prompt tokens plus max_new_tokens for each
+    instance in the batch, including padding). If stop_at_answer is set, the generation of each instance stops as soon
+    as the parser can extract an answer.
 
-    loader: NeoQALoader = NeoQALoader(data_variant)
-    prompt_generator: PromptGenerator = MultipleChoicePromptGenerator(template_name)
+    A batch that runs out of memory is split and retried. The largest batch size that fits per prompt length is
+    remembered (see AdaptiveBatchSizer), i.e. the following batches of similar length are split before they fail.
+    Predictions are appended after each batch and already predicted instances are skipped, i.e. interrupted runs can be
+    resumed.
 
-    dataset: Dataset = loader.get(data_split, random_seed=random_seed)
-    dataset_with_prompts: Dataset = dataset.map(prompt_generator.get_prompt, load_from_cache_file=False)
+    :param simulated_memory_limit:  Raises an out-of-memory error for batches that cost more tokens (as computed by the
+                                    TokenBudgetBatcher), e.g. to test the adaptive batch sizing on the CPU (see
+                                    benchmarks/check_adaptive_batching.py).
+    :param profile:                 Store the timings, token counts and memory of each instance (see RunProfiler).
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+    from experiments.llms.answer_stopping_criteria import AnswerStoppingCriteria
+    from experiments.llms.generation_timer import FirstTokenTimer, reset_peak_memory, get_peak_memory
+
+    out_directory: str = get_out_directory(model_name, data_variant, template_name)
+    finished_metrics: Optional[Dict] = load_finished_metrics(out_directory, data_split, random_seed)
+    if finished_metrics is not None:
+        return finished_metrics
+
+    parser: OutputParser = get_output_parser(parser_name, 7)
+
+    loader: NeoQALoader = NeoQALoader(data_variant, embed_articles=False, cache_dir=cache_dir)
+    prompt_generator: PromptGenerator = MultipleChoicePromptGenerator(template_name, article_store=loader.article_store)
+    start: float = time.perf_counter()
+    dataset_with_prompts: Dataset = get_dataset_with_prompts(loader, prompt_generator, data_split, random_seed)
+    prompt_build_seconds: float = (time.perf_counter() - start) / len(dataset_with_prompts)
+    start = time.perf_counter()
+    dataset_with_prompts = add_prompt_tokens(dataset_with_prompts, tokenizer)
+    tokenization_seconds: float = (time.perf_counter() - start) / len(dataset_with_prompts)
 
-    model_dir: str = model_name.replace('/', '--')
-    out_directory: str = f'./results/{model_dir}/{data_variant}/{template_name.replace(".txt", "")}'
     makedirs(out_directory, exist_ok=True)
 
+    out_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
+    accumulator: MetricsAccumulator = MetricsAccumulator(
+        join(out_directory, f'{data_split}.seed-{random_seed}.metrics.partial.json'), len(dataset_with_prompts)
+    )
+    already_predicted: Set[str] = set()
+    if exists(out_path):
+        previous_predictions: List[Dict] = read_jsonl(out_path)
+        already_predicted = {pred['instance_id'] for pred in previous_predictions}
+        accumulator.add_all(previous_predictions, is_new=False)
+    dataset_with_prompts = dataset_with_prompts.filter(
+        lambda instance: instance['instance_id'] not in already_predicted, keep_in_memory=True
+    )
+
     # Fail early! Start with largest context
-    dataset_with_prompts = dataset_with_prompts.sort('prompt_len', reverse=True)
-    dataloader = DataLoader(
-        dataset_with_prompts,
-        batch_size=batch_size,
-        collate_fn=lambda batch: collate_fn(batch, model.device, tokenizer)
+    dataset_with_prompts = dataset_with_prompts.sort('prompt_num_tokens', reverse=True)
+    prompt_num_tokens: List[int] = dataset_with_prompts['prompt_num_tokens']
+    batcher: TokenBudgetBatcher = TokenBudgetBatcher(max_tokens_per_batch, max_new_tokens, max_batch_size)
+    batch_sizer: AdaptiveBatchSizer = AdaptiveBatchSizer(
+        join(out_directory, f'{data_split}.seed-{random_seed}.batch-sizes.json')
     )
+    profiler: Optional[RunProfiler] = None
+    if profile:
+        profiler = RunProfiler(get_profile_path(out_directory, data_split, random_seed), prompt_build_seconds)
+
+    # Batches that still need to be processed (the next one last). Failed batches are split and put back.
+    pending_batches: List[List[int]] = list(reversed(batcher.get_batches(prompt_num_tokens)))
+    progress: tqdm = tqdm(total=len(dataset_with_prompts))
+    while len(pending_batches) > 0:
+        batch_indices: List[int] = pending_batches.pop()
+        max_num_tokens: int = max(prompt_num_tokens[i] for i in batch_indices)
+        split_batches: List[List[int]] = batch_sizer.split(batch_indices, max_num_tokens)
+        if len(split_batches) > 1:
+            pending_batches.extend(reversed(split_batches))
+            continue
 
-    all_results = []
-    for batch, instances in tqdm(dataloader):
-        with torch.no_grad():  # Important for inference
-            outputs = model.generate(
-                batch,
-                max_new_tokens=3000,
-                do_sample=False,
-                temperature=None,
-                top_p=None,
-                pad_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id
+        if profiler is not None:
+            profiler.start_batch()
+        batch, instances = collate_fn(dataset_with_prompts.select(batch_indices), model.device, tokenizer)
+        stopping_criteria: StoppingCriteriaList = StoppingCriteriaList()
+        if stop_at_answer:
+            stopping_criteria.append(
+                AnswerStoppingCriteria(parser, tokenizer, batch['input_ids'].shape[1], len(instances))
             )
-            start_indices = batch.shape[1]  # Correctly compute start indices
-            for i in range(outputs.shape[0]):  # Iterate through the batch dimension
-                response = tokenizer.decode(outputs[i][start_indices:], skip_special_tokens=True)
-                predicted_answer: int = parser.select_answer(response, instances[i]['options'])['answered']
-                instances[i]['response'] = response
-                instances[i]['predicted_answer'] = predicted_answer
-                all_results.append(instances[i])
+        timer: FirstTokenTimer = FirstTokenTimer()
+        stopping_criteria.append(timer)
+        reset_peak_memory()
+        generate_start: float = time.perf_counter()
+        try:
+            batch_cost: int = batcher.get_batch_cost(len(instances), batch['input_ids'].shape[1])
+            if simulated_memory_limit is not None and batch_cost > simulated_memory_limit:
+                raise torch.cuda.OutOfMemoryError(f'Simulated: {batch_cost} > {simulated_memory_limit} tokens')
+            with torch.no_grad():  # Important for inference
+                outputs = model.generate(
+                    **batch,
+                    stopping_criteria=stopping_criteria,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    temperature=None,
+                    top_p=None,
+                    pad_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id
+                )
+        except Exception as error:
+            if not is_out_of_memory(error) or len(batch_indices) == 1:
+                raise
+            new_max_batch_size: int = batch_sizer.add_out_of_memory(len(batch_indices), max_num_tokens)
+            print(
+                f'Out of memory for {len(batch_indices)} instances with up to {max_num_tokens} tokens, '
+                f'retrying with at most {new_max_batch_size}.'
+            )
+            pending_batches.append(batch_indices)
+            batch = outputs = None
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            continue
 
-    out_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
-    store_jsonl(all_results, out_path)
+        generate_end: float = time.perf_counter()
+        first_token_time: float = timer.first_token_time or generate_end
+
+        start_indices = batch['input_ids'].shape[1]  # Correctly compute start indices
+        parse_seconds: List[float] = []
+        for i in range(outputs.shape[0]):  # Iterate through the batch dimension
+            response = tokenizer.decode(outputs[i][start_indices:], skip_special_tokens=True)
+            start = time.perf_counter()
+            predicted_answer: int = parser.select_answer(response, instances[i]['options'])['answered']
+            parse_seconds.append(time.perf_counter() - start)
+            instances[i]['response'] = response
+            instances[i]['predicted_answer'] = predicted_answer
+            append_jsonl(instances[i], out_path)
+            accumulator.add(instances[i])
+        if profiler is not None:
+            peak_memory: Optional[int] = get_peak_memory()
+            output_tokens: List[int] = (outputs[:, start_indices:] != tokenizer.eos_token_id).sum(dim=1).tolist()
+            profiler.add_batch(instances, [{
+                'batch_size': len(instances),
+                'prompt_tokens': instance['prompt_num_tokens'],
+                'output_tokens': num_tokens,
+                'tokenization_seconds': tokenization_seconds,
+                # The time of the batch is shared equally by its instances.
+                'prefill_seconds': (first_token_time - generate_start) / len(instances),
+                'decode_seconds': (generate_end - first_token_time) / len(instances),
+                'peak_memory_bytes': peak_memory
+            } for instance, num_tokens in zip(instances, output_tokens)], parse_seconds)
+        progress.update(len(instances))
+        update_partial_metrics(accumulator, progress)
+    progress.close()
 
     metrics = evaluate_file(out_path)
     store_json(metrics, join(out_directory, f'{data_split}.seed-{random_seed}.metrics.json'), pretty=True)
+    accumulator.remove()
     print('ADTScore:', json.dumps(metrics['adt_score'], indent=2))
     return metrics
 
 
+def update_partial_metrics(accumulator: MetricsAccumulator, progress: tqdm) -> None:
+    # Writes the partial metrics from time to time and shows the current ADT score next to the progress bar.
+    metrics: Optional[Dict] = accumulator.maybe_write()
+    if metrics is not None:
+        progress.set_postfix(adt=f"{metrics['adt_score']['adt']:.3f}")
+
+
+def iter_unpredicted_batches(
+        instances: Iterable[Dict], already_predicted: Set[str], batch_size: int
+) -> Iterable[List[Dict]]:
+    """
+    Groups all instances that have not been predicted yet into batches (keeping their order).
+    """
+    batch: List[Dict] = []
+    for instance in instances:
+        if instance['instance_id'] not in already_predicted:
+            batch.append(instance)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def is_chain_of_thought_template(template_name: str) -> bool:
+    # Template names may be given with or without ".txt".
+    return template_name.replace('.txt', '').endswith('.cot')
+
+
+def check_score_options(template_name: str, score_options: bool) -> None:
+    """
+    The answer options are scored directly after the prompt, i.e. only with direct-answer templates (not with *.cot).
+    """
+    if score_options and is_chain_of_thought_template(template_name):
+        raise ValueError(f'Cannot score the answer options with the chain-of-thought template "{template_name}"!')
+
+
+def get_run_out_directory(
+        model_name: str, data_variant: str, template_name: str, score_options: bool = False,
+        order_by_evidence: bool = False
+) -> str:
+    out_directory: str = get_out_directory(model_name, data_variant, template_name)
+    if score_options:
+        out_directory += '.option-scoring'
+    if order_by_evidence:
+        out_directory += '.canonical-order'
+    return out_directory
+
+
+def get_sorted_dataset_with_prompts(
+        loader: NeoQALoader, prompt_generator: PromptGenerator, data_split: str, random_seed: int,
+        order_by_evidence: bool = False
+) -> 'Dataset':
+    """
+    Loads the data split with the prompts in the order in which the instances are run.
+    """
+    dataset_with_prompts: Dataset = get_dataset_with_prompts(loader, prompt_generator, data_split, random_seed)
+    if order_by_evidence:
+        # Sorting the article ID sequences puts instances with the longest common evidence prefixes next to each other.
+        evidence: List[List[str]] = dataset_with_prompts['news_article_ids']
+        return dataset_with_prompts.select(sorted(range(len(evidence)), key=lambda i: evidence[i]))
+    # Fail early! Start with largest context
+    return dataset_with_prompts.sort('prompt_len', reverse=True)
+
+
 def run_and_eval_multiple_choice(
-        llm: LLM, template_name: str, parser_name: str, data_variant: str, data_split: str, random_seed: int
+        llm: LLM, template_name: str, parser_name: str, data_variant: str, data_split: str, random_seed: int,
+        cache_dir: Optional[str] = './cache/datasets', batch_size: int = 1, stop_at_answer: bool = False,
+        score_options: bool = False, order_by_evidence: bool = False, profile: bool = False
 ):
+    """
+    Runs and evaluates the LLM on the data split. Predictions are appended after each batch and already predicted
+    instances are skipped, i.e. interrupted runs can be resumed.
 
-    parser: OutputParser
-    if parser_name == 'last-line':
-        parser = LastLineOutputParser(7)
-    elif parser_name == 'json':
-        parser = MultipleChoiceJsonOutputParser(7)
-    else:
-        raise NotImplementedError(parser_name)
+    If score_options is set, nothing is generated. Instead, the answer option with the highest likelihood as the next
+    token after the answer prefix ("Answer: [") is selected (see LLM.score_options). These runs are stored separately.
+    The answer prefix directly follows the prompt, i.e. this only works with direct-answer templates (not with *.cot).
 
-    loader: NeoQALoader = NeoQALoader(data_variant)
-    prompt_generator: PromptGenerator = MultipleChoicePromptGenerator(template_name)
+    If order_by_evidence is set, the news articles of each instance are in a canonical order and instances with the
+    same (or overlapping) evidence follow each other, i.e. their prompts share long prefixes (e.g. for LLMs that reuse
+    the KV cache of a shared prefix). These runs are stored separately.
 
-    dataset: Dataset = loader.get(data_split, random_seed=random_seed)
-    dataset_with_prompts: Dataset = dataset.map(prompt_generator.get_prompt, load_from_cache_file=False)
+    If profile is set, the timings, token counts and memory of each instance are stored next to the predictions (see
+    RunProfiler).
 
-    # Fail early! Start with largest context
-    dataset_with_prompts = dataset_with_prompts.sort('prompt_len', reverse=True)
+    Finished runs are skipped before the data (or the model) is loaded.
+    """
+    check_score_options(template_name, score_options)
+
+    out_directory: str = get_run_out_directory(
+        llm.get_name(), data_variant, template_name, score_options, order_by_evidence
+    )
+    finished_metrics: Optional[Dict] = load_finished_metrics(out_directory, data_split, random_seed)
+    if finished_metrics is not None:
+        return finished_metrics
+
+    loader: NeoQALoader = NeoQALoader(
+        data_variant, embed_articles=False, cache_dir=cache_dir, canonical_article_order=order_by_evidence
+    )
+    prompt_generator: PromptGenerator = MultipleChoicePromptGenerator(template_name, article_store=loader.article_store)
+    start: float = time.perf_counter()
+    dataset_with_prompts: Dataset = get_sorted_dataset_with_prompts(
+        loader, prompt_generator, data_split, random_seed, order_by_evidence
+    )
+    prompt_build_seconds: float = time.perf_counter() - start
+    return predict_and_eval(
+        llm, dataset_with_prompts, parser_name, out_directory, data_split, random_seed, batch_size, stop_at_answer,
+        score_options, profile, prompt_build_seconds
+    )
+
+
+def predict_and_eval(
+        llm: LLM, dataset_with_prompts: 'Dataset', parser_name: str, out_directory: str, data_split: str,
+        random_seed: int, batch_size: int = 1, stop_at_answer: bool = False, score_options: bool = False,
+        profile: bool = False, prompt_build_seconds: Optional[float] = None
+) -> Dict:
+    """
+    Predicts all instances of the dataset (in its order) that are not yet stored in the out_directory and evaluates
+    the predictions (see run_and_eval_multiple_choice).
+
+    :param profile:                 Store the timings, token counts and memory of each instance (see RunProfiler).
+    :param prompt_build_seconds:    Time it took to create the dataset with the prompts (for the profile).
+    """
+    parser: OutputParser = get_output_parser(parser_name, 7)
 
-    model_dir: str = llm.get_name().replace('/', '--')
-    out_directory: str = f'./results/{model_dir}/{data_variant}/{template_name.replace(".txt", "")}'
     makedirs(out_directory, exist_ok=True)
 
     out_path: str = join(out_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
 
+    accumulator: MetricsAccumulator = MetricsAccumulator(
+        join(out_directory, f'{data_split}.seed-{random_seed}.metrics.partial.json'), len(dataset_with_prompts)
+    )
     if exists(out_path):
+        previous_predictions: List[Dict] = read_jsonl(out_path)
         already_predicted: Set[str] = {
-            pred['instance_id'] for pred in read_jsonl(out_path)
+            pred['instance_id'] for pred in previous_predictions
         }
+        accumulator.add_all(previous_predictions, is_new=False)
     else:
         already_predicted = set()
 
-    for instance in tqdm(dataset_with_prompts):
-        if instance['instance_id'] not in already_predicted:
-            response: str = llm.generate(instance)
-            predicted_answer: int = parser.select_answer(response, instance['options'])['answered']
-            instance['response'] = response
-            instance['predicted_answer'] = predicted_answer
+    # Stop generating once the parser finds an answer (only used by backends that support it).
+    llm.set_answer_parser(parser if stop_at_answer else None)
+
+    # Unless ordered by evidence, instances are sorted by length, i.e. instances within the same batch need little
+    # padding.
+    num_remaining: int = len([
+        instance_id for instance_id in dataset_with_prompts['instance_id'] if instance_id not in already_predicted
+    ])
+    profiler: Optional[RunProfiler] = None
+    if profile:
+        profiler = RunProfiler(
+            get_profile_path(out_directory, data_split, random_seed),
+            prompt_build_seconds / len(dataset_with_prompts) if prompt_build_seconds is not None else None
+        )
+    with tqdm(total=num_remaining) as progress:
+        for batch in iter_unpredicted_batches(dataset_with_prompts, already_predicted, batch_size):
+            parse_seconds: List[float] = [0.0] * len(batch)
+            if profiler is not None:
+                profiler.start_batch()
+            if score_options:
+                for instance, option_scores in zip(batch, llm.score_options(batch)):
+                    predicted_answer: int = int(np.argmax(option_scores))
+                    instance['option_scores'] = option_scores
+                    # Stored in the same format as a generated answer, so that the result can be re-parsed.
+                    instance['response'] = f'Answer: [{predicted_answer + 1}]'
+                    instance['predicted_answer'] = predicted_answer
+            else:
+                for i, (instance, response) in enumerate(zip(batch, llm.generate_batch(batch))):
+                    start: float = time.perf_counter()
+                    instance['response'] = response
+                    instance['predicted_answer'] = parser.select_answer(response, instance['options'])['answered']
+                    parse_seconds[i] = time.perf_counter() - start
+            if profiler is not None:
+                profiler.add_batch(batch, None if score_options else llm.last_profile, parse_seconds)
 
-            # So that we do not store all the news articles.
-            instance['news_articles'] = [article['article_id'] for article in instance['news_articles']]
-            append_jsonl(instance, out_path)
+            for instance in batch:
+                # So that we do not store all the news articles.
+                instance['news_articles'] = instance.pop('news_article_ids')
+                append_jsonl(instance, out_path)
+                accumulator.add(instance)
+            progress.update(len(batch))
+            update_partial_metrics(accumulator, progress)
 
     metrics = evaluate_file(out_path)
     store_json(metrics, join(out_directory, f'{data_split}.seed-{random_seed}.metrics.json'), pretty=True)
+    accumulator.remove()
     print('ADTScore:', json.dumps(metrics['adt_score'], indent=2))
     return metrics
@@ -0,0 +1,117 @@
+import json
+import time
+from os import listdir
+from os.path import join
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from experiments.data.neoqa_loader import NeoQALoader
+from experiments.evaluate.reparse import reparse_file
+from experiments.llms.llm import LLM
+from experiments.parsing.parser_registry import DEFAULT_PARSER, get_parser_names
+from experiments.prompter.mcq_prompt_generator import MultipleChoicePromptGenerator
+from experiments.running.run_and_eval import (
+    get_run_out_directory, load_finished_metrics, get_sorted_dataset_with_prompts, predict_and_eval,
+    is_chain_of_thought_template
+)
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+
+
+def get_template_names(prompt_directory: str = './prompt_templates/mcq') -> List[str]:
+    return sorted(name[:-len('.txt')] for name in listdir(prompt_directory) if name.endswith('.txt'))
+
+
+def get_sweep_parser_names() -> List[str]:
+    # The default parser comes first: its responses are the ones that are re-parsed with the other parsers.
+    return [DEFAULT_PARSER] + [name for name in get_parser_names() if name != DEFAULT_PARSER]
+
+
+def get_parser_out_directory(out_directory: str, parser_name: str) -> str:
+    """
+    Runs with the default parser are stored as by run_and_eval_multiple_choice, all others in a directory per parser.
+    """
+    if parser_name == DEFAULT_PARSER:
+        return out_directory
+    return f'{out_directory}.parser-{parser_name}'
+
+
+def run_and_eval_sweep(
+        llm: LLM, template_names: List[str], parser_names: List[str], data_variant: str, data_split: str,
+        random_seed: int, cache_dir: Optional[str] = './cache/datasets', batch_size: int = 1,
+        stop_at_answer: bool = False, score_options: bool = False, order_by_evidence: bool = False,
+        profile: bool = False
+) -> Dict[Tuple[str, str], Dict]:
+    """
+    Runs and evaluates the LLM for all combinations of templates and parsers in one session (see
+    run_and_eval_multiple_choice). The model and the data are loaded once (only if some runs are not finished yet),
+    the news articles are rendered once for all templates and the prompts of each template are created once.
+
+    The responses do not depend on the parser unless stop_at_answer is set: the responses of each template are only
+    generated for the first parser and re-parsed with the others. With stop_at_answer, each parser stops the
+    generation at a different point, i.e. the responses are generated per parser.
+
+    With score_options, the chain-of-thought templates (*.cot) are skipped: the answer options can only be scored
+    directly after the prompt (see run_and_eval_multiple_choice).
+
+    Returns the metrics per (template_name, parser_name).
+    """
+    loader: Optional[NeoQALoader] = None
+    rendered_articles: Dict[str, str] = dict()
+    all_metrics: Dict[Tuple[str, str], Dict] = dict()
+
+    if score_options:
+        skipped: List[str] = [name for name in template_names if is_chain_of_thought_template(name)]
+        if len(skipped) > 0:
+            print(f'Skipping the chain-of-thought templates when scoring the answer options: {", ".join(skipped)}')
+        template_names = [name for name in template_names if not is_chain_of_thought_template(name)]
+
+    for template_name in template_names:
+        out_directory: str = get_run_out_directory(
+            llm.get_name(), data_variant, template_name, score_options, order_by_evidence
+        )
+        dataset_with_prompts: Optional[Dataset] = None
+        prompt_build_seconds: Optional[float] = None
+        # Predictions file with the responses of this template that can be re-parsed with the other parsers.
+        responses_path: Optional[str] = None
+
+        for parser_name in parser_names:
+            parser_directory: str = get_parser_out_directory(out_directory, parser_name)
+            metrics: Optional[Dict] = load_finished_metrics(parser_directory, data_split, random_seed)
+            if metrics is None and responses_path is not None:
+                _, metrics = reparse_file(
+                    responses_path, parser_name,
+                    dest=join(parser_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
+                )
+                print(f'Re-parsed the responses with {parser_name}:', json.dumps(metrics['adt_score'], indent=2))
+            elif metrics is None:
+                if loader is None:
+                    loader = NeoQALoader(
+                        data_variant, embed_articles=False, cache_dir=cache_dir,
+                        canonical_article_order=order_by_evidence
+                    )
+                if dataset_with_prompts is None:
+                    prompt_generator: MultipleChoicePromptGenerator = MultipleChoicePromptGenerator(
+                        template_name, article_store=loader.article_store, rendered_articles=rendered_articles
+                    )
+                    start: float = time.perf_counter()
+                    dataset_with_prompts = get_sorted_dataset_with_prompts(
+                        loader, prompt_generator, data_split, random_seed, order_by_evidence
+                    )
+                    prompt_build_seconds = time.perf_counter() - start
+                metrics = predict_and_eval(
+                    llm, dataset_with_prompts, parser_name, parser_directory, data_split, random_seed, batch_size,
+                    stop_at_answer, score_options, profile, prompt_build_seconds
+                )
+
+            if not stop_at_answer and responses_path is None:
+                responses_path = join(parser_directory, f'{data_split}.seed-{random_seed}.predictions.jsonl')
+            all_metrics[(template_name, parser_name)] = metrics
+
+    return all_metrics
+
+
+def print_sweep_metrics(all_metrics: Dict[Tuple[str, str], Dict]) -> None:
+    # Best first
+    for (template_name, parser_name), metrics in sorted(all_metrics.items(), key=lambda x: -x[1]['adt_score']['adt']):
+        print(f'{metrics["adt_score"]["adt"]:.4f}  {template_name:40s} {parser_name}')
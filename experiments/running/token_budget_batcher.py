@@ -0,0 +1,50 @@
+from typing import List, Optional
+
+
+class TokenBudgetBatcher:
+    """
+    Groups instances into batches so that the padded size of each batch stays within a token budget.
+
+    The cost of a batch is the number of instances times the longest prompt in the batch plus the number of tokens
+    that may be generated, i.e. the number of token positions the model must hold in memory at the end of generation.
+    Instances are kept in their given order (e.g. sorted by length), so that similar lengths end up in the same batch.
+    """
+
+    def __init__(self, max_tokens_per_batch: int, max_new_tokens: int, max_batch_size: Optional[int] = None):
+        """
+        :param max_tokens_per_batch:    Token budget of a batch (including the generated tokens).
+        :param max_new_tokens:          Maximum number of tokens that are generated per instance.
+        :param max_batch_size:          Optional upper bound for the number of instances per batch.
+        """
+        self.max_tokens_per_batch: int = max_tokens_per_batch
+        self.max_new_tokens: int = max_new_tokens
+        self.max_batch_size: Optional[int] = max_batch_size
+
+    def get_batch_cost(self, batch_size: int, max_num_tokens: int) -> int:
+        return batch_size * (max_num_tokens + self.max_new_tokens)
+
+    def get_batches(self, num_tokens: List[int]) -> List[List[int]]:
+        """
+        :param num_tokens:      Number of prompt tokens per instance.
+        :return:                Batches as lists of instance indices. Instances exceeding the budget form their own batch.
+        """
+        batches: List[List[int]] = []
+        current_batch: List[int] = []
+        current_max: int = 0
+        for idx, length in enumerate(num_tokens):
+            new_max: int = max(current_max, length)
+            fits_budget: bool = self.get_batch_cost(len(current_batch) + 1, new_max) <= self.max_tokens_per_batch
+            fits_size: bool = self.max_batch_size is None or len(current_batch) < self.max_batch_size
+            if len(current_batch) > 0 and not (fits_budget and fits_size):
+                batches.append(current_batch)
+                current_batch, new_max = [], length
+
+            if len(current_batch) == 0 and self.get_batch_cost(1, length) > self.max_tokens_per_batch:
+                print(f'WARNING: Instance {idx} with {length} tokens exceeds the token budget of {self.max_tokens_per_batch}.')
+
+            current_batch.append(idx)
+            current_max = new_max
+
+        if len(current_batch) > 0:
+            batches.append(current_batch)
+        return batches
@@ -1,9 +1,54 @@
 import re
+from typing import List, Dict, Callable, Tuple
+
+ENTITY_MENTION_PATTERN: re.Pattern = re.compile(r'\{([^|]+)\|([A-Z]+-\d+,?)+\}')
+
+# Same as ENTITY_MENTION_PATTERN but only captures the name. Splitting a text with it yields the text between the
+# mentions interleaved with the mentioned names, i.e. joining the parts removes all IDs in a single pass.
+_ENTITY_ID_REMOVAL_PATTERN: re.Pattern = re.compile(r'\{([^|]+)\|(?:[A-Z]+-\d+,?)+\}')
 
 
 def remove_ids_from(text: str) -> str:
-    pattern: re.Pattern = re.compile(r'\{([^|]+)\|([A-Z]+-\d+,?)+\}')
-    matches = re.finditer(pattern, text)
-    for match in matches:
-        text = text.replace(match.group(0), match.group(1))
-    return text
+    """
+    Replaces every entity mention "{name|ENTITY-ID}" with its name in a single pass over the text.
+    """
+    return ''.join(_ENTITY_ID_REMOVAL_PATTERN.split(text))
+
+
+def remove_ids_from_all(texts: List[str]) -> List[str]:
+    """
+    Same as remove_ids_from() for a list of texts (e.g. all passages of a news article).
+    """
+    split = _ENTITY_ID_REMOVAL_PATTERN.split
+    return [''.join(split(text)) for text in texts]
+
+
+def find_entity_mentions(text: str) -> List[Dict]:
+    """
+    Returns all entity mentions with their character span ("start", "end") in the text, the mentioned "name" and
+    the "entity_id". If several IDs are listed within one mention, the last one is used.
+    """
+    return [
+        {'start': match.start(), 'end': match.end(), 'name': match.group(1), 'entity_id': match.group(2)}
+        for match in ENTITY_MENTION_PATTERN.finditer(text)
+    ]
+
+
+def replace_entity_mentions(text: str, get_replacement: Callable[[Dict], str]) -> Tuple[str, List[Dict]]:
+    """
+    Replaces every entity mention with the string returned by get_replacement in a single pass.
+
+    :param text:                Text with entity mentions "{name|ENTITY-ID}".
+    :param get_replacement:     Receives the mention (see find_entity_mentions()) and returns its replacement.
+    :return:                    The text with replaced mentions and the list of all mentions (spans refer to the input).
+    """
+    mentions: List[Dict] = []
+
+    def _replace(match: re.Match) -> str:
+        mention: Dict = {
+            'start': match.start(), 'end': match.end(), 'name': match.group(1), 'entity_id': match.group(2)
+        }
+        mentions.append(mention)
+        return get_replacement(mention)
+
+    return ENTITY_MENTION_PATTERN.sub(_replace, text), mentions
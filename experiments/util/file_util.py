@@ -1,4 +1,5 @@
 import codecs
+import hashlib
 import json
 from typing import Dict, List
 
@@ -46,4 +47,14 @@ def read_text_file(file_path, encoding='utf-8'):
     - str: Content of the text file.
     """
     with codecs.open(file_path, mode='r', encoding=encoding) as file:
-        return file.read()
\ No newline at end of file
+        return file.read()
+
+def file_checksum(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 checksum of a file without loading it into memory at once.
+    """
+    hash_object = hashlib.sha256()
+    with open(file_path, 'rb') as f_in:
+        for chunk in iter(lambda: f_in.read(chunk_size), b''):
+            hash_object.update(chunk)
+    return hash_object.hexdigest()
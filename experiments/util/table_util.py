@@ -0,0 +1,13 @@
+from typing import Dict, List
+
+
+def print_table(rows: List[Dict]) -> None:
+    if len(rows) == 0:
+        print('No results.')
+        return
+    cells: List[List[str]] = [list(rows[0].keys())] + [
+        [f'{value:.4f}' if isinstance(value, float) else str(value) for value in row.values()] for row in rows
+    ]
+    widths: List[int] = [max(len(row[i]) for row in cells) for i in range(len(cells[0]))]
+    for row in cells:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,56 @@
+import binascii
+import os
+from typing import Iterator
+
+
+def get_xor_table(key: int) -> bytes:
+    """
+    Translation table that XORs every byte with the key (the same table encrypts and decrypts).
+    """
+    key = key % 256
+    return bytes(b ^ key for b in range(256))
+
+
+def decrypt_line(encrypted_line: bytes, table: bytes) -> str:
+    # Each decrypted byte is one character (as chr(b ^ key) in the original implementation), i.e. latin-1.
+    return binascii.a2b_base64(encrypted_line).translate(table).decode('latin-1').strip()
+
+
+def encrypt_line(line: str, table: bytes) -> bytes:
+    """
+    Inverse of decrypt_line(). Raises a UnicodeEncodeError for characters that cannot be stored in one byte (the
+    dataset is stored as JSON with ASCII escapes).
+    """
+    return binascii.b2a_base64(line.strip().encode('latin-1').translate(table))
+
+
+def xor_decrypt(encrypted_text: str, key: int) -> str:
+    return decrypt_line(encrypted_text.encode('ascii'), get_xor_table(key))
+
+
+def iter_decrypted_lines(src: str, key: int) -> Iterator[str]:
+    """
+    Decrypts the file line by line in memory (the plaintext is never written to disk).
+    """
+    table: bytes = get_xor_table(key)
+    with open(src, 'rb') as f_in:
+        for line in f_in:
+            yield decrypt_line(line, table)
+
+
+def decrypt_file(src: str, dest: str, key: int) -> str:
+    # Written to a temporary file first, so that an interrupted run never leaves a partially decrypted file.
+    with open(f'{dest}.tmp', 'w', encoding='utf-8') as f_out:
+        for line in iter_decrypted_lines(src, key):
+            f_out.write(line + '\n')
+    os.replace(f'{dest}.tmp', dest)
+    return dest
+
+
+def encrypt_file(src: str, dest: str, key: int) -> str:
+    table: bytes = get_xor_table(key)
+    with open(src, encoding='utf-8') as f_in, open(f'{dest}.tmp', 'wb') as f_out:
+        for line in f_in:
+            f_out.write(encrypt_line(line, table))
+    os.replace(f'{dest}.tmp', dest)
+    return dest
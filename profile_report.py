@@ -0,0 +1,35 @@
+"""
+profile_report.py
+
+Summarizes the per-instance profiles of runs (*.profile.jsonl, stored next to the predictions of runs with --profile):
+the throughput, the mean time of each step and the peak memory, e.g. per prompt length, template and model. Use it to
+select the batch size and the maximum number of tokens.
+
+Usage:
+  profile_report.py [<src>...] [--group-by=<columns>]
+
+Arguments:
+  <src>     Profile files or directories that are searched recursively (default: ./results).
+
+Options:
+  --group-by=<columns>      Comma-separated columns: model, data_variant, template, split, seed, prompt_length,
+                            batch_size or cached [default: model,template,prompt_length].
+  -h --help                 Show this screen.
+"""
+from typing import Dict, List
+
+from docopt import docopt
+
+from experiments.evaluate.profile_report import get_profile_report
+from experiments.util.table_util import print_table
+
+
+def main(args):
+    sources: List[str] = args['<src>'] or ['./results']
+    rows: List[Dict] = get_profile_report(sources, args['--group-by'].split(','))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version="profile_report.py 1.0")
+    main(args)
@@ -0,0 +1,42 @@
+"""
+reparse.py
+
+Parses the stored responses of existing runs again with another output parser (no model is loaded). The
+"predicted_answer" of each prediction and the metrics files are rewritten.
+
+Usage:
+  reparse.py <parser> <src>... [--processes=<processes>]
+
+Arguments:
+  <parser>      The parser to use (last-line or json).
+  <src>         Predictions files (*.predictions.jsonl) or directories (e.g. ./results) that are searched recursively.
+
+Options:
+  --processes=<processes>       Number of worker processes (default: number of CPUs).
+  -h --help                     Show this screen.
+"""
+import time
+from typing import Dict, Optional
+
+from docopt import docopt
+
+from experiments.evaluate.reparse import reparse_files
+from experiments.parsing.parser_registry import get_parser_names
+
+
+def main(args):
+    parser_name: str = args['<parser>']
+    if parser_name not in get_parser_names():
+        raise ValueError(f'Select one of these parsers: {get_parser_names()}')
+    num_processes: Optional[int] = int(args['--processes']) if args['--processes'] is not None else None
+
+    start: float = time.time()
+    metrics: Dict[str, Dict] = reparse_files(args['<src>'], parser_name, num_processes)
+    for path in sorted(metrics.keys()):
+        print(f'{metrics[path]["adt_score"]["adt"]:.4f}  {path}')
+    print(f'Re-parsed {len(metrics)} files in {time.time() - start:.2f}s.')
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version="reparse.py 1.0")
+    main(args)
@@ -0,0 +1,62 @@
+"""
+results_warehouse.py
+
+Indexes all finished runs in the results directory into a sqlite DB (incrementally, unchanged files are skipped) and
+compares them. The leaderboard and slices commands update the index first.
+
+Usage:
+  results_warehouse.py index [--results=<results>] [--db=<db>]
+  results_warehouse.py leaderboard [--model=<model>] [--variant=<variant>] [--template=<template>] [--split=<split>] [--order-by=<metric>] [--results=<results>] [--db=<db>]
+  results_warehouse.py slices <group_by>... [--model=<model>] [--variant=<variant>] [--template=<template>] [--split=<split>] [--results=<results>] [--db=<db>]
+
+Arguments:
+  <group_by>    Columns to group the predictions by: model, data_variant, template, split, seed, answerable, category,
+                num_documents or question_family_id. For example: "model num_documents" for the context ablation.
+
+Options:
+  --model=<model>           Only consider runs of this model (name of the results directory).
+  --variant=<variant>       Only consider runs on this data variant.
+  --template=<template>     Only consider runs with this template (without ".txt").
+  --split=<split>           Only consider runs on this split.
+  --order-by=<metric>       Sort the leaderboard by adt, accuracy or parsed [default: adt].
+  --results=<results>       The results directory [default: ./results].
+  --db=<db>                 The sqlite DB file [default: ./cache/results.db].
+  -h --help                 Show this screen.
+"""
+import time
+from os.path import dirname, basename
+from typing import Dict, List
+
+from docopt import docopt
+
+from experiments.evaluate.results_warehouse import ResultsWarehouse
+from experiments.util.table_util import print_table
+
+
+def main(args):
+    warehouse: ResultsWarehouse = ResultsWarehouse(
+        db_name=basename(args['--db']), dir_name=dirname(args['--db']) or '.', results_dir=args['--results']
+    )
+    start: float = time.time()
+    stats: Dict[str, int] = warehouse.index()
+    print(f'Indexed {args["--results"]} in {time.time() - start:.2f}s: {stats}')
+
+    filters: Dict = {
+        column: args[option] for column, option in [
+            ('model', '--model'), ('data_variant', '--variant'), ('template', '--template'), ('split', '--split')
+        ] if args[option] is not None
+    }
+    start = time.time()
+    if args['leaderboard']:
+        rows: List[Dict] = warehouse.get_leaderboard(filters, order_by=args['--order-by'])
+    elif args['slices']:
+        rows = warehouse.get_slices(args['<group_by>'], filters)
+    else:
+        return
+    print_table(rows)
+    print(f'({len(rows)} rows in {(time.time() - start) * 1000:.1f} ms)')
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version="results_warehouse.py 1.0")
+    main(args)
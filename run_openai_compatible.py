@@ -0,0 +1,100 @@
+"""
+run_openai_compatible.py
+
+Usage:
+  run_openai_compatible.py tune <model> <template_name> <parser> [--url=<url>] [--concurrency=<concurrency>] [--checkpoint-interval=<checkpoint_interval>] [--name=<name>]
+  run_openai_compatible.py main <model> <template_name> <parser> [--url=<url>] [--concurrency=<concurrency>] [--checkpoint-interval=<checkpoint_interval>] [--name=<name>]
+  run_openai_compatible.py context <model> <template_name> <parser> [--url=<url>] [--concurrency=<concurrency>] [--checkpoint-interval=<checkpoint_interval>] [--name=<name>]
+
+Arguments:
+  <model>           Name of the model on the server.
+  <template_name>   The name of the template to use for tuning.
+  <parser>          The parser to use during the tuning process.
+
+Options:
+  --url=<url>                                   URL of the OpenAI-compatible API [default: http://localhost:8000/v1].
+  --concurrency=<concurrency>                   Maximum number of requests that are sent to the server at the same time [default: 16].
+  --checkpoint-interval=<checkpoint_interval>   A crash loses at most this many completed predictions (at least --concurrency) [default: 32].
+  --name=<name>                                 Name of the LLM in the results and the cache (defaults to <model>).
+  -h --help         Show this screen.
+  --version         Show version.
+"""
+
+from docopt import docopt
+
+from experiments.data.neoqa_loader import NeoQALoader
+
+from experiments.llms.impl.openai_compatible import OpenAICompatibleLLM
+from experiments.llms.llm import LLM, CachedLLM
+from experiments.running.async_run_and_eval import run_and_eval_multiple_choice_async
+
+
+def eval_prompt_selection(
+        llm: LLM, template_name: str, parser_name: str, max_concurrency: int, checkpoint_interval: int
+):
+    run_and_eval_multiple_choice_async(
+        llm=llm,
+        template_name=template_name,
+        parser_name=parser_name,
+        data_variant=NeoQALoader.BENCHMARK_WITHOUT_NOISE,
+        data_split='dev',
+        random_seed=1,
+        max_concurrency=max_concurrency,
+        checkpoint_interval=checkpoint_interval
+    )
+
+
+def main_benchmark(
+        llm: LLM, template_name: str, parser_name: str, max_concurrency: int, checkpoint_interval: int
+):
+    run_and_eval_multiple_choice_async(
+        llm=llm,
+        template_name=template_name,
+        parser_name=parser_name,
+        data_variant=NeoQALoader.BENCHMARK,
+        data_split='test',
+        random_seed=1,
+        max_concurrency=max_concurrency,
+        checkpoint_interval=checkpoint_interval
+    )
+
+
+def context_length_ablation(
+        llm: LLM, template_name: str, parser_name: str, max_concurrency: int, checkpoint_interval: int
+):
+    run_and_eval_multiple_choice_async(
+        llm=llm,
+        template_name=template_name,
+        parser_name=parser_name,
+        data_variant=NeoQALoader.CONTEXT_ABL_80_20,
+        data_split='test',
+        random_seed=1,
+        max_concurrency=max_concurrency,
+        checkpoint_interval=checkpoint_interval
+    )
+
+
+def main(args):
+
+    max_concurrency: int = int(args['--concurrency'])
+    llm: LLM = CachedLLM(OpenAICompatibleLLM(
+        model=args['<model>'],
+        base_url=args['--url'],
+        max_concurrency=max_concurrency,
+        name=args['--name']
+    ))
+    template_name: str = args['<template_name>']
+    parser_name: str = args['<parser>']
+    checkpoint_interval: int = int(args['--checkpoint-interval'])
+
+    if args['tune']:
+        eval_prompt_selection(llm, template_name, parser_name, max_concurrency, checkpoint_interval)
+    elif args['main']:
+        main_benchmark(llm, template_name, parser_name, max_concurrency, checkpoint_interval)
+    elif args['context']:
+        context_length_ablation(llm, template_name, parser_name, max_concurrency, checkpoint_interval)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version="run_openai_compatible.py 1.0")
+    main(args)
@@ -2,9 +2,10 @@
 run_qwen25.py
 
 Usage:
-  run_qwen25.py tune <model_size> <template_name> <parser>
-  run_qwen25.py main <model_size> <template_name> <parser>
-  run_qwen25.py context <model_size> <template_name> <parser>
+  run_qwen25.py tune <model_size> <template_name> <parser> [--batch-size=<batch_size>] [--stop-at-answer] [--score-options] [--share-prefix] [--draft=<draft_size>] [--profile] [--cpu]
+  run_qwen25.py main <model_size> <template_name> <parser> [--batch-size=<batch_size>] [--stop-at-answer] [--score-options] [--share-prefix] [--draft=<draft_size>] [--profile] [--cpu]
+  run_qwen25.py context <model_size> <template_name> <parser> [--batch-size=<batch_size>] [--stop-at-answer] [--score-options] [--share-prefix] [--draft=<draft_size>] [--profile] [--cpu]
+  run_qwen25.py sweep <model_size> [--templates=<templates>] [--parsers=<parsers>] [--batch-size=<batch_size>] [--stop-at-answer] [--score-options] [--share-prefix] [--draft=<draft_size>] [--profile] [--cpu]
 
 Arguments:
   <model_size>      Size of the model
@@ -12,56 +13,123 @@ Arguments:
   <parser>          The parser to use during the tuning process.
 
 Options:
+  --templates=<templates>       Comma-separated templates of the sweep (default: all in ./prompt_templates/mcq).
+  --parsers=<parsers>           Comma-separated parsers of the sweep (default: all, last-line first).
+  --batch-size=<batch_size>     Number of prompts that are generated together [default: 1].
+  --stop-at-answer              Stop generating as soon as the parser can extract an answer.
+  --score-options               Select the most likely answer option after "Answer: [" instead of generating (not with *.cot templates).
+  --share-prefix                Order instances by their evidence and reuse the KV cache of shared prompt prefixes.
+  --draft=<draft_size>          Size of a smaller Qwen2.5 model for speculative decoding, e.g. 0.5b (prompts are
+                                generated one at a time, the responses stay the same under greedy decoding).
+  --cpu                         Run on the CPU with int8 weights (for the small models, e.g. 0.5b or 1.5b).
+  --profile                     Store the timings, token counts and memory of each instance next to the predictions.
   -h --help         Show this screen.
   --version         Show version.
 """
 
+from typing import List, Optional
+
 from docopt import docopt
 
 from experiments.data.neoqa_loader import NeoQALoader
 
+from experiments.llms.impl.cpu_quantized import QuantizedCPUChatLLM
 from experiments.llms.impl.qwen25 import Qwen25
-from experiments.llms.llm import LLM
-from experiments.running.run_and_eval import run_and_eval_multiple_choice
+from experiments.llms.llm import LLM, CachedLLM
+from experiments.running.run_and_eval import run_and_eval_multiple_choice, check_score_options
+from experiments.running.sweep import (
+    run_and_eval_sweep, get_template_names, get_sweep_parser_names, print_sweep_metrics
+)
 
 
-def eval_prompt_selection(llm: LLM, template_name: str, parser_name: str):
+def eval_prompt_selection(
+        llm: LLM, template_name: str, parser_name: str, batch_size: int = 1, stop_at_answer: bool = False,
+        score_options: bool = False, share_prefix: bool = False, profile: bool = False
+):
     run_and_eval_multiple_choice(
         llm=llm,
         template_name=template_name,
         parser_name=parser_name,
         data_variant=NeoQALoader.BENCHMARK_WITHOUT_NOISE,
         data_split='dev',
-        random_seed=1
+        random_seed=1,
+        batch_size=batch_size,
+        stop_at_answer=stop_at_answer,
+        score_options=score_options,
+        order_by_evidence=share_prefix,
+        profile=profile
     )
 
 
-def main_benchmark(llm: LLM, template_name: str, parser_name: str):
+def main_benchmark(
+        llm: LLM, template_name: str, parser_name: str, batch_size: int = 1, stop_at_answer: bool = False,
+        score_options: bool = False, share_prefix: bool = False, profile: bool = False
+):
     run_and_eval_multiple_choice(
         llm=llm,
         template_name=template_name,
         parser_name=parser_name,
         data_variant=NeoQALoader.BENCHMARK,
         data_split='test',
-        random_seed=1
+        random_seed=1,
+        batch_size=batch_size,
+        stop_at_answer=stop_at_answer,
+        score_options=score_options,
+        order_by_evidence=share_prefix,
+        profile=profile
     )
 
 
-def context_length_ablation(llm: LLM, template_name: str, parser_name: str):
+def prompt_selection_sweep(
+        llm: LLM, template_names: List[str], parser_names: List[str], batch_size: int = 1,
+        stop_at_answer: bool = False, score_options: bool = False, share_prefix: bool = False, profile: bool = False
+):
+    # Same runs as eval_prompt_selection for each template and parser, but within one session.
+    all_metrics = run_and_eval_sweep(
+        llm=llm,
+        template_names=template_names,
+        parser_names=parser_names,
+        data_variant=NeoQALoader.BENCHMARK_WITHOUT_NOISE,
+        data_split='dev',
+        random_seed=1,
+        batch_size=batch_size,
+        stop_at_answer=stop_at_answer,
+        score_options=score_options,
+        order_by_evidence=share_prefix,
+        profile=profile
+    )
+    print_sweep_metrics(all_metrics)
+
+
+def context_length_ablation(
+        llm: LLM, template_name: str, parser_name: str, batch_size: int = 1, stop_at_answer: bool = False,
+        score_options: bool = False, share_prefix: bool = False, profile: bool = False
+):
     run_and_eval_multiple_choice(
         llm=llm,
         template_name=template_name,
         parser_name=parser_name,
         data_variant=NeoQALoader.CONTEXT_ABL_80_20,
         data_split='test',
-        random_seed=1
+        random_seed=1,
+        batch_size=batch_size,
+        stop_at_answer=stop_at_answer,
+        score_options=score_options,
+        order_by_evidence=share_prefix,
+        profile=profile
     )
 
 
-def get_qwen25(model_size: str) -> LLM:
+def get_qwen25_weights_path(model_size: str) -> str:
     model_size = model_size.lower()
 
-    if model_size == '7b':
+    if model_size == '0.5b':
+        weights_path = 'Qwen/Qwen2.5-0.5B-Instruct'
+    elif model_size == '1.5b':
+        weights_path = 'Qwen/Qwen2.5-1.5B-Instruct'
+    elif model_size == '3b':
+        weights_path = 'Qwen/Qwen2.5-3B-Instruct'
+    elif model_size == '7b':
         weights_path = 'Qwen/Qwen2.5-7B-Instruct'
     elif model_size == '14b':
         weights_path = 'Qwen/Qwen2.5-14B-Instruct'
@@ -69,22 +137,52 @@ def get_qwen25(model_size: str) -> LLM:
         weights_path = 'Qwen/Qwen2.5-32B-Instruct'
     else:
         raise ValueError
+    return weights_path
+
+
+def get_qwen25(
+        model_size: str, cpu: bool = False, share_prefix: bool = False, draft_size: Optional[str] = None
+) -> LLM:
+    weights_path: str = get_qwen25_weights_path(model_size)
+    draft_path: Optional[str] = get_qwen25_weights_path(draft_size) if draft_size is not None else None
 
-    return Qwen25(weights_path)
+    if cpu:
+        return CachedLLM(QuantizedCPUChatLLM(weights_path, share_prefix=share_prefix, draft_model_path=draft_path))
+    return CachedLLM(Qwen25(weights_path, share_prefix=share_prefix, draft_model_path=draft_path))
 
 
 def main(args):
 
-    llm: LLM = get_qwen25(args['<model_size>'])
+    llm: LLM = get_qwen25(args['<model_size>'], args['--cpu'], args['--share-prefix'], args['--draft'])
     template_name: str = args['<template_name>']
     parser_name: str = args['<parser>']
+    batch_size: int = int(args['--batch-size'])
+    stop_at_answer: bool = args['--stop-at-answer']
+    score_options: bool = args['--score-options']
+    share_prefix: bool = args['--share-prefix']
+    profile: bool = args['--profile']
+    if not args['sweep']:
+        # Fail before the model is loaded.
+        check_score_options(template_name, score_options)
 
     if args['tune']:
-        eval_prompt_selection(llm, template_name, parser_name)
+        eval_prompt_selection(
+            llm, template_name, parser_name, batch_size, stop_at_answer, score_options, share_prefix, profile
+        )
     elif args['main']:
-        main_benchmark(llm, template_name, parser_name)
+        main_benchmark(
+            llm, template_name, parser_name, batch_size, stop_at_answer, score_options, share_prefix, profile
+        )
     elif args['context']:
-        context_length_ablation(llm, template_name, parser_name)
+        context_length_ablation(
+            llm, template_name, parser_name, batch_size, stop_at_answer, score_options, share_prefix, profile
+        )
+    elif args['sweep']:
+        template_names: List[str] = args['--templates'].split(',') if args['--templates'] else get_template_names()
+        parser_names: List[str] = args['--parsers'].split(',') if args['--parsers'] else get_sweep_parser_names()
+        prompt_selection_sweep(
+            llm, template_names, parser_names, batch_size, stop_at_answer, score_options, share_prefix, profile
+        )
 
 
 if __name__ == "__main__":